@@ -0,0 +1,66 @@
+"""
+Compares speed and placement error of localization solvers
+of distance_simulation_loop on random layouts with noisy distances.
+
+Run from NovaSimulation/ directory:
+
+    python benchmarks/localization.py [DEVICE_COUNT ...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'simulation'))
+
+# pylint: disable=wrong-import-position
+from geometry import distance_simulation_loop
+from localization import placement_error
+
+SIDE = 10000
+NOISE = (0.0, 0.01, 0.05)
+SOLVERS = ('legacy', 'lstsq')
+
+
+def random_layout(device_count, noise, seed=0):
+    """
+    Returns:
+        (tuple) true coordinates {device: (x, y)} and distances
+            in format of DistanceFile.avg_dict, with relative
+            gaussian noise of standard deviation *noise*
+    """
+    rng = np.random.default_rng(seed)
+    coordinates = rng.uniform(0, SIDE, (device_count, 2))
+    names = ['DEV_%03d' % i for i in range(device_count)]
+    matrix = np.hypot(*(coordinates[:, None] - coordinates[None]).transpose(2, 0, 1))
+    matrix *= 1 + rng.normal(0, noise, matrix.shape)
+    matrix = (matrix + matrix.T) / 2
+    distances = {
+        name: {other: float(matrix[i, j]) for j, other in enumerate(names) if j != i}
+        for i, name in enumerate(names)
+    }
+    return dict(zip(names, coordinates.tolist())), distances
+
+
+def main(device_counts):
+    print(f"{'devices':>8} {'noise':>6} {'solver':>7} {'time ms':>9} {'mean err':>9} {'max err':>9}")
+    for device_count in device_counts:
+        for noise in NOISE:
+            truth, distances = random_layout(device_count, noise)
+            for solver in SOLVERS:
+                start = time.perf_counter()
+                try:
+                    result = distance_simulation_loop(distances, solver)
+                except (TypeError, ValueError):
+                    # legacy solver fails when circles can't be made to intersect
+                    print(f"{device_count:>8} {noise:>6} {solver:>7} {'failed':>9}")
+                    continue
+                elapsed = time.perf_counter() - start
+                mean_error, max_error = placement_error(result, truth)
+                print(f"{device_count:>8} {noise:>6} {solver:>7} {elapsed * 1000:>9.1f} "
+                      f"{mean_error:>9.1f} {max_error:>9.1f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [14, 100, 500])
@@ -0,0 +1,86 @@
+"""
+Compares memory used by Device/PatientDevice objects
+with memory used by DeviceTable for the same random grid.
+
+Run from NovaSimulation/ directory:
+
+    python benchmarks/memory.py [DEVICE_COUNT ...]
+"""
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'simulation'))
+
+# pylint: disable=wrong-import-position
+from device import PatientDevice
+from devicetable import DeviceTable
+from graph import create_nan_edges, scan_in_range
+from patient import Patient
+
+RADIUS = 5
+DENSITY = 0.2
+
+
+def random_coordinates(device_count, seed=0):
+    rng = random.Random(seed)
+    side = int((device_count / DENSITY) ** 0.5) + 1
+    cells = rng.sample(range(side * side), device_count)
+    return [(cell // side, cell % side) for cell in cells]
+
+
+def object_model(coordinates):
+    devices = [PatientDevice(coords, i + 1, patient=Patient(i))
+               for i, coords in enumerate(coordinates)]
+    for dev in devices:
+        dev.measure(0, 'spo2')
+        dev.measure(0, 'hr')
+    scan_in_range(devices, RADIUS)
+    create_nan_edges(_NodeList(devices))
+    return devices
+
+
+def table_model(coordinates):
+    table = DeviceTable(coordinates, range(1, len(coordinates) + 1),
+                        patient_ids=range(len(coordinates)))
+    neighbours = table.scan_in_range(RADIUS)
+    for index in range(len(table)):
+        for other in neighbours.neighbours(index)[0].tolist():
+            table.add_connection(index, other)
+    return table
+
+
+class _NodeList(list):
+    """
+    Plain list of devices that create_nan_edges can add edges to,
+    so networkx memory is not counted in either model
+    """
+    nodes = property(iter)
+
+    def add_edges_from(self, edges):
+        for _ in edges:
+            pass
+
+
+def peak_memory(build, coordinates):
+    tracemalloc.start()
+    result = build(coordinates)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main(device_counts):
+    print(f"{'devices':>8} {'model':>8} {'retained MB':>12} {'peak MB':>9} {'B/device':>9}")
+    for device_count in device_counts:
+        coordinates = random_coordinates(device_count)
+        for name, build in (('objects', object_model), ('table', table_model)):
+            current, peak = peak_memory(build, coordinates)
+            print(f"{device_count:>8} {name:>8} {current / 2**20:>12.1f} "
+                  f"{peak / 2**20:>9.1f} {current / device_count:>9.0f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
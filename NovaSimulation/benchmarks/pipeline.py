@@ -0,0 +1,228 @@
+"""
+Measures time and peak memory of every stage of the simulation
+pipeline on random grids of growing size.
+
+Every configuration (device count and density) is run twice:
+once timed, once with tracemalloc tracing peak memory, so
+tracing doesn't distort timings. Grids, patients and routed
+pairs come from fixed seeds, so runs can be compared.
+
+Run from NovaSimulation/ directory:
+
+    python benchmarks/pipeline.py [--devices N ...] [--output results.json]
+    python benchmarks/pipeline.py --compare baseline.json
+
+With --compare, stages slower than the baseline by more than
+--threshold are reported and exit status is 1.
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'simulation'))
+
+# pylint: disable=wrong-import-position
+from engine import SimulationEngine
+from graph import create_nan_edges, create_socket_edges, scan_in_range_batch
+from grid import random_grid
+from localization import localize
+from meshgraph import MeshGraph
+from propagation import PROTOCOLS, Propagation
+from routing import RouteCache, StationTree
+from simulator import create_patient_devices
+
+RADIUS = 5
+DEVICE_LIMIT = 5
+SEED = 0
+ROUTED_PAIRS = 5
+LOCALIZED_DEVICES = 500
+TICKS = 20
+# stages faster than this are too noisy to be compared
+MIN_COMPARED_SECONDS = 0.01
+
+
+def stage_create(state):
+    count, density = state['devices'], state['density']
+    side = int(math.ceil(math.sqrt(count / density)))
+    rows, columns, values = random_grid(side, side, count, seed=SEED)
+    state['grid'] = create_patient_devices(np.column_stack((columns, rows)), values, seed=SEED)
+
+
+def stage_scan(state):
+    state['socket'] = MeshGraph(state['grid'])
+    state['nan'] = state['socket'].copy()
+    state['neighbours'] = scan_in_range_batch(state['socket'], RADIUS)
+
+
+def stage_socket(state):
+    create_socket_edges(state['socket'], DEVICE_LIMIT, neighbours=state['neighbours'])
+
+
+def stage_nan(state):
+    create_nan_edges(state['nan'], neighbours=state['neighbours'])
+
+
+def stage_routing(state):
+    devices = state['grid']
+    rng = random.Random(SEED)
+    routes = RouteCache(state['nan'])
+    for _ in range(ROUTED_PAIRS):
+        routes.paths(*rng.sample(devices, 2))
+    tree = StationTree(state['nan'], [devices[0]])
+    for dev in rng.sample(devices, min(len(devices), 1000)):
+        tree.route(dev)
+
+
+def stage_propagation(state):
+    propagation = Propagation(state['socket'], state['nan'])
+    for protocol in PROTOCOLS:
+        propagation.run(state['grid'][0], protocol)
+
+
+def stage_trilateration(state):
+    devices = state['grid'][:LOCALIZED_DEVICES]
+    coordinates = np.array([dev.coordinates for dev in devices], dtype=np.float64)
+    matrix = np.hypot(*(coordinates[:, None] - coordinates[None]).transpose(2, 0, 1))
+    distances = {
+        i: {j: distance for j, distance in enumerate(row) if j != i}
+        for i, row in enumerate(matrix.tolist())
+    }
+    localize(distances)
+
+
+def stage_ticks(state):
+    SimulationEngine(state['grid'], step=1, params=('hr', 'spo2')).run(ticks=TICKS)
+
+
+STAGES = [
+    ('create', stage_create),
+    ('scan', stage_scan),
+    ('socket', stage_socket),
+    ('nan', stage_nan),
+    ('routing', stage_routing),
+    ('propagation', stage_propagation),
+    ('trilateration', stage_trilateration),
+    ('ticks', stage_ticks),
+]
+
+
+def run_pipeline(device_count, density, stages, trace):
+    """
+    Runs all stages in order, stages not in *stages*
+    are run too if later ones need them, but not reported
+
+    Returns:
+        dict {stage: seconds or peak bytes}
+    """
+    state = {'devices': device_count, 'density': density}
+    wanted = set(stages)
+    last = max(i for i, (name, _) in enumerate(STAGES) if name in wanted)
+    results = {}
+    for name, stage in STAGES[:last + 1]:
+        if trace:
+            tracemalloc.start()
+            stage(state)
+            results[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            stage(state)
+            results[name] = time.perf_counter() - start
+    return {name: value for name, value in results.items() if name in wanted}
+
+
+def benchmark(device_counts, densities, stages, memory=True):
+    results = []
+    for device_count in device_counts:
+        for density in densities:
+            seconds = run_pipeline(device_count, density, stages, trace=False)
+            peaks = run_pipeline(device_count, density, stages, trace=True) if memory else {}
+            for name in seconds:
+                result = {
+                    'devices': device_count,
+                    'density': density,
+                    'stage': name,
+                    'seconds': seconds[name],
+                    'peak_bytes': peaks.get(name),
+                }
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def print_result(result, baseline=None):
+    peak = result['peak_bytes']
+    line = (f"{result['devices']:>8} {result['density']:>7} {result['stage']:>14} "
+            f"{result['seconds']:>9.3f} {peak / 2**20 if peak is not None else float('nan'):>8.1f}")
+    if baseline is not None:
+        line += f" {result['seconds'] / baseline['seconds']:>8.2f}x"
+    print(line)
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns:
+        list of results slower than baseline by more than *threshold*
+    """
+    print(f"\n{'devices':>8} {'density':>7} {'stage':>14} {'seconds':>9} {'peak MB':>8} {'vs base':>9}")
+    known = {(r['devices'], r['density'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        base = known.get((result['devices'], result['density'], result['stage']))
+        if base is None:
+            continue
+        print_result(result, base)
+        if result['seconds'] > max(base['seconds'], MIN_COMPARED_SECONDS) * threshold:
+            regressions.append(result)
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="benchmarks/pipeline.py")
+    parser.add_argument("--devices", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--density", type=float, nargs="+", default=[0.2],
+                        help="devices per grid cell, sets grid size (default: %(default)s)")
+    parser.add_argument("--stages", nargs="+", default=[name for name, _ in STAGES],
+                        choices=[name for name, _ in STAGES])
+    parser.add_argument("--no-memory", action="store_true", help="don't measure peak memory")
+    parser.add_argument("--output", help="write results to JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON file of an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown reported as regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    print(f"{'devices':>8} {'density':>7} {'stage':>14} {'seconds':>9} {'peak MB':>8}")
+    results = benchmark(args.devices, args.density, args.stages, memory=not args.no_memory)
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'seed': SEED,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        for result in regressions:
+            print(f"regression: {result['stage']} with {result['devices']} devices "
+                  f"and density {result['density']}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
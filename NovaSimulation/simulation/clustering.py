@@ -0,0 +1,64 @@
+"""
+This module contains master election used
+to group devices into socket clusters.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+
+Election = namedtuple('Election', 'masters master_of edges')
+
+
+def elect_masters(values, neighbours, device_limit):
+    """
+    Splits devices into masters and their slaves
+
+    Device with the lowest value becomes a master and takes
+    up to *device_limit* closest devices that are not yet
+    assigned as its slaves, then the next lowest unassigned
+    device becomes a master and so on.
+
+    Values are sorted once, assigned devices are skipped
+    when they come up (lazy deletion), and neighbours are read
+    already sorted by distance, so the whole election takes
+    O(n log n + number of neighbour pairs).
+    Devices with equal values are taken in index order.
+
+    Args:
+        values (array like): value of every device
+        neighbours (:obj: CSRNeighbours): devices in range,
+            sorted by distance
+        device_limit (int): how many slaves one master can have
+
+    Returns:
+        (:obj: Election) masters - master indices in order of election,
+            master_of - master index of every device (masters point to themselves),
+            edges - (k, 2) array of (master, slave) pairs in order of assignment
+    """
+    values = np.asarray(values)
+    count = len(values)
+    indptr, indices = neighbours.indptr, neighbours.indices
+
+    assigned = np.zeros(count, dtype=bool)
+    master_of = np.arange(count)
+    masters, slave_chunks = [], []
+
+    for master in np.argsort(values, kind='stable').tolist():
+        if assigned[master]:
+            continue
+        assigned[master] = True
+        masters.append(master)
+
+        in_range = indices[indptr[master]:indptr[master + 1]]
+        slaves = in_range[~assigned[in_range]][:device_limit]
+        assigned[slaves] = True
+        master_of[slaves] = master
+        slave_chunks.append(slaves)
+
+    if slave_chunks:
+        slaves = np.concatenate(slave_chunks).astype(np.intp)
+    else:
+        slaves = np.empty(0, dtype=np.intp)
+    edges = np.column_stack((master_of[slaves], slaves))
+    return Election(np.asarray(masters, dtype=np.intp), master_of, edges)
@@ -1,11 +1,11 @@
 import collections
-import functools
 import logging
 import random
 import time
 
 import networkx as nx
 
+from measurements import MeasurementStore
 import patient
 
 LOG = logging.getLogger(__name__)
@@ -66,6 +66,8 @@ class PatientDevice(Device):
     A device assigned to a patient.
 
     Such a device is able to record a modest history of measurements of a patient's state.
+    History is kept in a MeasurementStore, which can be shared by many devices,
+    each of them using its own row (slot) of the store.
     """
 
     # Simulates disconnected or otherwise misbehaving sensors.
@@ -79,41 +81,69 @@ class PatientDevice(Device):
     def __init__(self, coordinates, value, *,
             battery_level=100,
             patient,
-            buffer_size=10):
+            buffer_size=10,
+            store=None,
+            slot=0):
         super().__init__(coordinates, value)
         self.battery_level = battery_level
         self.patient = patient
-        self.__buffer = collections.defaultdict(functools.partial(collections.deque, maxlen=buffer_size))
-        self.faulty = set() # set of params for which sensors are currently faulty
+        if store is None:
+            store = MeasurementStore(1, buffer_size)
+        self.store = store
+        self.slot = slot
+
+    @property
+    def faulty(self):
+        """
+        Params for which sensors are currently faulty
+        """
+        return frozenset(param for param in self.FAULTY if self.store.faulty(param, self.slot))
+
+    def set_faulty(self, param, faulty=True):
+        """
+        Breaks or repairs *param* sensor of the device
+        """
+        if param not in self.FAULTY:
+            raise ValueError("unknown sensor: %s" % param)
+        self.store.set_faulty(param, self.slot, faulty)
+
+    def faulty_value(self, param):
+        return random.randint(*self.FAULTY[param])
 
     def measure(self, timestamp, param):
         """
         Records a *param* measurement and returns it.
         """
         if param in self.faulty:
-            value = random.randint(*self.FAULTY[param])
+            value = self.faulty_value(param)
         else:
             value = self.patient.measure(param)
-        self.__buffer[param].append(Measurement(timestamp, value))
+        self.store.append_one(param, timestamp, value, self.slot)
         return value
 
     def get_last_measurement(self, param):
         """
         Gets *param* last measurment.
         """
-        return self.__buffer[param][-1]
+        timestamps, values = self.store.history(param, self.slot)
+        if not len(values):
+            raise IndexError("no %s measurements" % param)
+        return Measurement(timestamps[-1].item(), values[-1].item())
     
     def get_measurements(self, param):
         """
         Gets *param* measurement history.
         """
-        return tuple(self.__buffer[param])
+        timestamps, values = self.store.history(param, self.slot)
+        return tuple(map(Measurement, timestamps.tolist(), values.tolist()))
     
     def pop_measurements(self, param):
         """
         Clears *param* measurement history and returns it.
         """
-        return tuple(self.__buffer.pop(param, ()))
+        measurements = self.get_measurements(param)
+        self.store.clear(param, self.slot)
+        return measurements
 
 
 class ComplexDevice:
@@ -159,8 +189,8 @@ class ComplexDevice:
         else:
             self._status = value
 
-    def update_master_rank(self):
-        self.master_rank = random.randrange(21474836)
+    def update_master_rank(self, rng=random):
+        self.master_rank = rng.randrange(21474836)
 
     def select_master(self, other):
         if isinstance(other, ComplexDevice):
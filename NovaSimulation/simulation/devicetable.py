@@ -0,0 +1,222 @@
+"""
+This module contains compact, struct-of-arrays storage
+for large amounts of devices.
+"""
+from array import array
+
+import networkx as nx
+import numpy as np
+
+from spatial import range_csr
+
+
+class DeviceTable:
+    """
+    Stores state of many devices as typed NumPy columns
+
+    A single Device object carries its own __dict__,
+    devices_in_range dict and connections list, which adds up
+    to hundreds of MB for tens of thousands of devices.
+    Here every attribute is a column, device i is row i,
+    devices in range are kept as CSRNeighbours and connections
+    as linked lists of integer indices.
+    Rows are accessed through DeviceView objects, which provide
+    the same interface as Device, so existing graph functions
+    and visualizations keep working.
+
+    Args:
+        coordinates (array like): (n, 2) coordinates of devices
+        values (array like): n device values
+        battery_level (int or array like): battery level of devices
+        patient_ids (array like): patient id of every device,
+            -1 for devices without patient
+    """
+
+    def __init__(self, coordinates, values, *, battery_level=100, patient_ids=None):
+        coordinates = np.asarray(coordinates).reshape(-1, 2)
+        if np.issubdtype(coordinates.dtype, np.integer):
+            self.coordinates = coordinates.astype(np.int32)
+        else:
+            self.coordinates = coordinates.astype(np.float64)
+        count = len(self.coordinates)
+
+        self.value = np.asarray(values, dtype=np.int64).reshape(count)
+        self.is_master = np.zeros(count, dtype=bool)
+        self.battery_level = np.empty(count, dtype=np.int16)
+        self.battery_level[:] = battery_level
+        self.patient_id = np.full(count, -1, dtype=np.int32)
+        if patient_ids is not None:
+            self.patient_id[:] = patient_ids
+        self.neighbours = None
+
+        # connections of device i: target[head[i]], target[link[head[i]]], ...
+        self._head = np.full(count, -1, dtype=np.int32)
+        self._tail = np.full(count, -1, dtype=np.int32)
+        self._link = array('i')
+        self._target = array('i')
+
+    @classmethod
+    def from_devices(cls, devices):
+        """
+        Creates table from Device or PatientDevice objects
+        """
+        devices = list(devices)
+        patient_ids = [dev.patient.id if getattr(dev, 'patient', None) is not None else -1
+                       for dev in devices]
+        return cls(
+            [dev.coordinates for dev in devices],
+            [dev.value for dev in devices],
+            battery_level=[getattr(dev, 'battery_level', 100) for dev in devices],
+            patient_ids=patient_ids
+        )
+
+    def __len__(self):
+        return len(self.value)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("device index out of range: %s" % index)
+        return DeviceView(self, index % len(self))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield DeviceView(self, index)
+
+    def scan_in_range(self, radius, tile_size=1024):
+        """
+        Finds devices in range of each other, see spatial.range_csr
+
+        Returns:
+            (:obj: CSRNeighbours) neighbours sorted by distance
+        """
+        self.neighbours = range_csr(self.coordinates, radius, tile_size)
+        return self.neighbours
+
+    def add_connection(self, index, other):
+        position = len(self._target)
+        self._target.append(other)
+        self._link.append(-1)
+        if self._head[index] < 0:
+            self._head[index] = position
+        else:
+            self._link[self._tail[index]] = position
+        self._tail[index] = position
+
+    def clear_connections(self, index):
+        # links are left in place, they are only reachable through head
+        self._head[index] = self._tail[index] = -1
+
+    def connections_of(self, index):
+        """
+        Returns:
+            list of ints: indices of devices connected to device *index*
+        """
+        connected = []
+        position = self._head[index]
+        while position >= 0:
+            connected.append(self._target[position])
+            position = self._link[position]
+        return connected
+
+    def to_graph(self):
+        """
+        Creates networkx graph with device views as nodes,
+        node i is device i, edges are not added
+        """
+        graph = nx.Graph()
+        for view in self:
+            graph.add_node(view, pos=view.coordinates, value=view.value)
+        return graph
+
+
+class DeviceView:
+    """
+    Single row of DeviceTable, behaves like Device
+
+    Views are cheap and created on demand, two views of the
+    same row are equal, so they can be used as graph nodes.
+    """
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __eq__(self, other):
+        if isinstance(other, DeviceView):
+            return self.table is other.table and self.index == other.index
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self.table), self.index))
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return str(self.value)
+
+    def __lt__(self, other):
+        if isinstance(other, DeviceView):
+            return self.value < other.value
+        return NotImplemented
+
+    @property
+    def coordinates(self):
+        return tuple(self.table.coordinates[self.index].tolist())
+
+    @property
+    def value(self):
+        return int(self.table.value[self.index])
+
+    @property
+    def is_master(self):
+        return bool(self.table.is_master[self.index])
+
+    @is_master.setter
+    def is_master(self, value):
+        self.table.is_master[self.index] = value
+
+    @property
+    def battery_level(self):
+        return int(self.table.battery_level[self.index])
+
+    @battery_level.setter
+    def battery_level(self, value):
+        self.table.battery_level[self.index] = value
+
+    @property
+    def patient_id(self):
+        return int(self.table.patient_id[self.index])
+
+    @property
+    def devices_in_range(self):
+        """
+        Devices in range as a new dict {view: distance},
+        empty until DeviceTable.scan_in_range is called
+        """
+        if self.table.neighbours is None:
+            return {}
+        indices, distances = self.table.neighbours.neighbours(self.index)
+        return {DeviceView(self.table, i): d for i, d in zip(indices.tolist(), distances.tolist())}
+
+    def add_device_in_range(self, node, distance):
+        raise TypeError("devices in range of a table are set by DeviceTable.scan_in_range")
+
+    @property
+    def connections(self):
+        return [DeviceView(self.table, i) for i in self.table.connections_of(self.index)]
+
+    @connections.setter
+    def connections(self, nodes):
+        # supports both assignment and `view.connections += nodes`
+        current = self.table.connections_of(self.index)
+        indices = [node.index for node in nodes]
+        if indices[:len(current)] != current:
+            self.table.clear_connections(self.index)
+            current = []
+        for other in indices[len(current):]:
+            self.table.add_connection(self.index, other)
+
+    def add_connections(self, node):
+        self.table.add_connection(self.index, node.index)
@@ -3,89 +3,358 @@ This module contains distance-based simulation
 structures.
 """
 import json
+import logging
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+
+LOG = logging.getLogger(__name__)
+
+
+# distance reading of a device that wasn't found
+MISSING = -1
+
+CACHE_SUFFIX = '.cache'
+CACHE_MAGIC = b'NOVADIST'
+CACHE_VERSION = 1
+# magic, version, source size, source mtime in ns, number of names,
+# number of readings, length of encoded names, value type code
+CACHE_HEADER = struct.Struct('<8sIQqIQQc')
 
 
 class DistanceFile:
     """
     Class that handles distances data initially in json format.
 
-    Provides methods to change the format of json
-    to something easier to process by python.
-    This class is used mainly for handling e.g. missing,
-    inconsistent data.
+    Readings are put into matrices indexed by device, in one pass:
+    `readings[i, j]` is the distance from device i to device j as read
+    by device i, NaN if there is no such reading, `matrix` is symmetric
+    and holds average of readings in both directions, NaN if any
+    of them is not in the file or both are MISSING (-1),
+    `known` is the mask of distances that are not NaN in `matrix`.
+    `names` are device names, `index` maps names to positions in matrices.
+
+    Lists and dict of the previous format (`dist_list`, `avg_list`
+    and `avg_dict`) are built from matrices when first used.
+
+    The json file is read one phone at a time, then matrices are
+    saved to a binary cache file next to it (`input_file` + '.cache').
+    Later the cache is memory-mapped instead of reading json, as long
+    as size and modification time of the json file don't change.
 
     Args:
         input_file (str): path to distances.json file
+        cache (bool): use binary cache file
     """
 
-    def __init__(self, input_file):
+    def __init__(self, input_file, cache=True):
         self.distance_file = input_file
-        self.dist_list = self.json_to_numpy_array()
-        self.avg_list = self.calculate_average_distances()
-        self.avg_dict = self.average_dist_dict()
+        self.cache_file = input_file + CACHE_SUFFIX if cache else None
+        self.names = []
+        self.index = {}
+        self._src = self._dst = self._values = None
+        self._paired = None
+        self._dist_list = self._avg_list = self._avg_dict = None
+        self.readings = self.matrix = self.known = None
+        if self.cache_file is None or not self.load_cache():
+            self.read()
+            if self.cache_file is not None:
+                self.save_cache()
 
-    def json_to_numpy_array(self):
-        """
-        Read json distances files and turn it into list
+    def __len__(self):
+        return len(self.names)
 
-        Opens distances json file,
-        Iterates on objects a list in form of:
-        [devA, devB, distance]
-        Read it as distance from device A to device B
+    def _index_of(self, name):
+        index = self.index.get(name)
+        if index is None:
+            index = self.index[name] = len(self.names)
+            self.names.append(name)
+        return index
 
-        Returns:
-            list of lists: [[devA, devB, distance], ...]
+    def read(self):
         """
+        Reads json distances file into matrices
+
+        File holds objects with phoneName and distanceList
+        of {phoneName, distance} readings.
+        """
+        src, dst, values = [], [], []
         with open(self.distance_file, "r") as dist_file:
-            distances_str = dist_file.read()
+            for phone in iter_json_values(dist_file):
+                source = self._index_of(phone['phoneName'])
+                for reading in phone['distanceList']:
+                    src.append(source)
+                    dst.append(self._index_of(reading['phoneName']))
+                    values.append(reading['distance'])
+        self.set_readings(src, dst, values)
 
-        distances_json = json.loads(distances_str)
+    def set_readings(self, src, dst, values):
+        """
+        Builds matrices from readings given in order of the file
 
-        dist_list = []
-        for i in distances_json:
-            temp = distances_json[i]['phoneName']
-            for j in distances_json[i]['distanceList']:
-                dist_list.append([temp, j['phoneName'], j['distance']])
+        Args:
+            src (array like): indices of reading devices
+            dst (array like): indices of found devices
+            values (array like): read distances, MISSING if not found
+        """
+        self._src = np.asarray(src, dtype=np.intp)
+        self._dst = np.asarray(dst, dtype=np.intp)
+        self._values = np.asarray(values, dtype=np.float64)
+        self._paired = self._dist_list = self._avg_list = self._avg_dict = None
 
-        return dist_list
+        size = len(self.names)
+        self.readings = np.full((size, size), np.nan)
+        self.readings[self._src, self._dst] = self._values
+        average = pair_average(self.readings, self.readings.T)
+        with np.errstate(invalid='ignore'):
+            self.known = average >= 0
+        self.matrix = np.where(self.known, average, np.nan)
+
+    @property
+    def paired(self):
+        """
+        Mask of pairs of devices with readings in both directions
+        """
+        if self._paired is None:
+            self._paired = ~np.isnan(self.readings) & ~np.isnan(self.readings.T)
+        return self._paired
+
+    @property
+    def dist_list(self):
+        """
+        list of lists: [[devA, devB, distance], ...] in order of the file,
+            read it as distance from device A to device B
+        """
+        if self._dist_list is None:
+            self._dist_list = self.json_to_numpy_array()
+        return self._dist_list
+
+    @property
+    def avg_list(self):
+        if self._avg_list is None:
+            self._avg_list = self.calculate_average_distances()
+        return self._avg_list
+
+    @property
+    def avg_dict(self):
+        if self._avg_dict is None:
+            self._avg_dict = self.average_dist_dict()
+        return self._avg_dict
+
+    def json_to_numpy_array(self):
+        """
+        Readings as a list
+
+        Returns:
+            list of lists: [[devA, devB, distance], ...]
+        """
+        names = self.names
+        return [[names[i], names[j], value] for i, j, value in
+                zip(self._src.tolist(), self._dst.tolist(), self._values.tolist())]
 
     def calculate_average_distances(self):
         """
         Remove the differences between distances by using mean values
 
         if distances between devices: A -> B and B - > A
-        is not the same, then use mean value of the two
+        is not the same, then use mean value of the two,
+        readings without the opposite one are skipped
 
         Returns:
-            list
-        """
-        avg_list = []
-        for i in self.dist_list:
-            for j in self.dist_list:
-                if i[0] + i[1] == j[1] + j[0]:
-                    val_one, val_two = float(i[2]), float(j[2])
-                    if val_one > 1 and val_two > 1:
-                        mean_val = (val_one + val_two)/2
-                    else:
-                        mean_val = val_one if val_one > val_two else val_two
-                    avg_list.append([i[0], i[1], mean_val])
-        return avg_list
+            list: [[devA, devB, distance], ...] in order of the file
+        """
+        backward = self.readings[self._dst, self._src].astype(np.float64)
+        paired = ~np.isnan(backward)
+        src, dst = self._src[paired], self._dst[paired]
+        average = pair_average(self.readings[src, dst].astype(np.float64), backward[paired])
+        names = self.names
+        return [[names[i], names[j], value] for i, j, value in
+                zip(src.tolist(), dst.tolist(), average.tolist())]
 
     def average_dist_dict(self):
         """
         Turn avg distances list into dictonary
+
+        Returns:
+            dict: {devA: {devB: distance}}, MISSING distance
+                if both devices didn't find each other
         """
         avg_dict, temp_dict = {}, {}
+        avg_list = self.avg_list
+        for position, (dev_a, dev_b, distance) in enumerate(avg_list):
+            temp_dict[dev_b] = distance
+            if position + 1 == len(avg_list) or avg_list[position + 1][0] != dev_a:
+                avg_dict[dev_a] = temp_dict
+                temp_dict = {}
+        return avg_dict
+
+    def save_cache(self):
+        """
+        Writes matrices to the cache file, if it can't be written
+        only a warning is logged
+
+        Values are stored as float32 if they all fit in it exactly,
+        as float64 otherwise.
+        """
+        stat = os.stat(self.distance_file)
+        values = self._values
+        exact = [np.isnan(array) | (array.astype(np.float32) == array)
+                 for array in (values, self.matrix)]
+        value_type = np.float32 if all(mask.all() for mask in exact) else np.float64
+        names = '\0'.join(self.names).encode('utf8')
+        header = CACHE_HEADER.pack(
+            CACHE_MAGIC, CACHE_VERSION, stat.st_size, stat.st_mtime_ns, len(self.names),
+            len(values), len(names), np.dtype(value_type).char.encode()
+        )
+        sections = [
+            names,
+            self._src.astype(np.int32), self._dst.astype(np.int32), values.astype(value_type),
+            self.readings.astype(value_type), self.matrix.astype(value_type),
+            self.known.astype(np.uint8),
+        ]
+        # written next to the cache and renamed, so an interrupted
+        # write never leaves a cut cache file
+        directory, name = os.path.split(os.path.abspath(self.cache_file))
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+            with os.fdopen(fd, 'wb') as cache_file:
+                cache_file.write(header)
+                for section in sections:
+                    cache_file.write(b'\0' * (-cache_file.tell() % 8))
+                    cache_file.write(section if isinstance(section, bytes) else section.tobytes())
+            os.replace(temp_path, self.cache_file)
+        except OSError as err:
+            LOG.warning("cannot write distances cache %s: %s", self.cache_file, err)
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def load_cache(self):
+        """
+        Memory-maps matrices from the cache file
+
+        Returns:
+            (bool) False if there is no cache file or it's out of date
+        """
+        try:
+            stat = os.stat(self.distance_file)
+            with open(self.cache_file, 'rb') as cache_file:
+                header = cache_file.read(CACHE_HEADER.size)
+                cache_size = os.fstat(cache_file.fileno()).st_size
+        except OSError:
+            return False
+        if len(header) != CACHE_HEADER.size:
+            return False
+        magic, version, size, mtime_ns, name_count, reading_count, names_length, value_char = \
+            CACHE_HEADER.unpack(header)
+        if (magic, version, size, mtime_ns) != (CACHE_MAGIC, CACHE_VERSION, stat.st_size,
+                                                 stat.st_mtime_ns):
+            return False
+
+        value_type = np.dtype(value_char.decode())
+        layout = [
+            (np.uint8, names_length),
+            (np.int32, reading_count), (np.int32, reading_count), (value_type, reading_count),
+            (value_type, name_count ** 2), (value_type, name_count ** 2),
+            (np.uint8, name_count ** 2),
+        ]
+        offsets, offset = [], CACHE_HEADER.size
+        for dtype, count in layout:
+            offset += -offset % 8
+            offsets.append(offset)
+            offset += np.dtype(dtype).itemsize * count
+        if offset > cache_size:
+            LOG.warning("distances cache %s is cut, reading %s again",
+                        self.cache_file, self.distance_file)
+            return False
+        try:
+            sections = [
+                np.memmap(self.cache_file, dtype=dtype, mode='r', offset=start, shape=(count,))
+                if count else np.empty(0, dtype=dtype)
+                for (dtype, count), start in zip(layout, offsets)
+            ]
+        except (OSError, ValueError):
+            return False
+        names, src, dst, values, readings, matrix, known = sections
+
+        self.names = names.tobytes().decode('utf8').split('\0') if name_count else []
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self._src, self._dst, self._values = src, dst, values
+        shape = (name_count, name_count)
+        self.readings = readings.reshape(shape)
+        self.matrix = matrix.reshape(shape)
+        self.known = known.reshape(shape).view(np.bool_)
+        return True
+
 
-        dist_iter = iter(self.avg_list)
-        next(dist_iter)
-        for i in self.avg_list:
-            temp_dict[i[1]] = i[2]
+def pair_average(forward, backward):
+    """
+    Average of distances read in both directions, if any of them
+    is not valid (MISSING or less than 1) the bigger one is used
+
+    Args:
+        forward (array like): distances from A to B
+        backward (array like): distances from B to A
+
+    Returns:
+        array of averages, NaN if any of readings is NaN
+    """
+    forward, backward = np.asarray(forward), np.asarray(backward)
+    with np.errstate(invalid='ignore'):
+        both_valid = (forward > 1) & (backward > 1)
+    return np.where(both_valid, (forward + backward) / 2, np.maximum(forward, backward))
+
+
+def iter_json_values(text_file, chunk_size=1 << 16):
+    """
+    Yields values of a top level json object one by one,
+    reading the file in chunks, so whole text is never in memory
+
+    Args:
+        text_file (file): opened json file
+        chunk_size (int): number of characters read at once
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, at_end = '', 0, False
+
+    def skip(chars):
+        nonlocal buffer, position, at_end
+        while True:
+            while position < len(buffer) and buffer[position] in chars:
+                position += 1
+            if position < len(buffer) or at_end:
+                return
+            buffer, position = text_file.read(chunk_size), 0
+            at_end = not buffer
+
+    def decode():
+        nonlocal buffer, position, at_end
+        while True:
             try:
-                next_iter = next(dist_iter)
-                if next_iter[0] != i[0]:
-                    avg_dict[i[0]] = temp_dict
-                    temp_dict = {}
-            except StopIteration:
-                avg_dict[i[0]] = temp_dict
-        return avg_dict
+                value, end = decoder.raw_decode(buffer, position)
+                if end < len(buffer) or at_end:
+                    position = end
+                    return value
+            except json.JSONDecodeError:
+                if at_end:
+                    raise
+            # value may be cut by end of the buffer, read at least as much as is kept
+            more = text_file.read(max(chunk_size, len(buffer) - position))
+            buffer, position, at_end = buffer[position:] + more, 0, not more
+
+    skip(' \t\r\n')
+    if buffer[position:position + 1] != '{':
+        raise ValueError("distances file must hold a json object")
+    position += 1
+    while True:
+        skip(' \t\r\n,')
+        if at_end and position >= len(buffer):
+            raise ValueError("unexpected end of distances file")
+        if buffer[position] == '}':
+            return
+        decode() # key
+        skip(' \t\r\n:')
+        yield decode()
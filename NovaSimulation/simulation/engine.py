@@ -0,0 +1,247 @@
+"""
+This module contains the simulation engine, it advances
+patients' state and measurements on a virtual clock,
+independently of any display
+"""
+from collections import namedtuple
+import bisect
+import logging
+import time
+
+import numpy as np
+
+from device import PatientDevice
+import metrics
+import patient
+from patient import PatientView
+
+
+LOG = logging.getLogger(__name__)
+
+
+# devices used by the health demo on the default input grid
+DEMO_PATIENT_VALUE = 287
+DEMO_STATION_VALUE = 1223
+
+
+ScriptedChange = namedtuple('ScriptedChange', 'at action')
+Alert = namedtuple('Alert', 'timestamp source destination paths')
+RunStats = namedtuple('RunStats', 'ticks simulated_seconds wall_seconds ticks_per_second')
+
+
+class Mutator:
+
+    def __init__(self, devices):
+        self.devices = devices
+        self.timestamp = 0
+        self.__measured = set()
+        self.__groups = None
+
+    @property
+    def patient_devices(self):
+        for dev in self.devices:
+            if isinstance(dev, PatientDevice):
+                yield dev
+
+    def _groups(self):
+        """
+        Splits patient devices once into batches which can be
+        measured together (patients of one PatientPopulation
+        recording to one MeasurementStore) and the rest
+
+        Returns:
+            (tuple) populations, batches and single devices
+        """
+        if self.__groups is None:
+            populations, batches, singles = {}, {}, []
+            for dev in self.patient_devices:
+                if isinstance(dev.patient, PatientView):
+                    population = dev.patient.population
+                    populations[id(population)] = population
+                    key = (id(population), id(dev.store))
+                    batches.setdefault(key, (population, dev.store, []))[2].append(dev)
+                else:
+                    singles.append(dev)
+            batches = [
+                (population, store, devs,
+                 np.array([dev.patient.index for dev in devs]),
+                 np.array([dev.slot for dev in devs]))
+                for population, store, devs in batches.values()
+            ]
+            self.__groups = list(populations.values()), batches, singles
+        return self.__groups
+
+    def tick(self):
+        """
+        Moves time forward and mutates state of all patients.
+
+        Patients belonging to a PatientPopulation are ticked
+        together, once per population.
+        """
+        self.timestamp += 1
+        self.__measured.clear()
+        populations, _, singles = self._groups()
+        for dev in singles:
+            dev.patient.tick()
+        for population in populations:
+            population.tick()
+
+    def measure(self, param):
+        """
+        Measures *param* on all patient devices.
+        """
+        if param in self.__measured:
+            return # already measured
+        _, batches, singles = self._groups()
+        for population, store, devs, patients, slots in batches:
+            values = population.measure(param)[patients].astype(store.dtype)
+            faulty = np.flatnonzero(store.faulty(param)[slots])
+            if len(faulty):
+                values[faulty] = [devs[i].faulty_value(param) for i in faulty.tolist()]
+            store.append(param, self.timestamp, values, slots)
+        for dev in singles:
+            dev.measure(self.timestamp, param)
+        self.__measured.add(param)
+
+
+class SimulationEngine:
+    """
+    Runs simulation on a fixed-step virtual clock
+
+    Every tick moves virtual time by *step* seconds, applies
+    scripted changes that are due, mutates patients and measures
+    *params* on all patient devices. Nothing is drawn, rendering
+    or any other kind of output is done by observers, which
+    can be called every N-th tick only.
+
+    Args:
+        devices (iterable): devices taking part in the simulation
+        step (float): virtual seconds per tick
+        params (iterable): params measured every tick
+        script (iterable): ScriptedChange objects, action is
+            called with the engine once virtual time reaches *at*
+    """
+
+    def __init__(self, devices, *, step=0.25, params=('spo2',), script=()):
+        if step <= 0:
+            raise ValueError("step must be positive, got: %s" % step)
+        self.mutator = Mutator(devices)
+        self.step = step
+        self.params = tuple(params)
+        self.time = 0.0
+        self.ticks = 0
+        self.alerts = []
+        self._script = sorted(script, key=lambda change: change.at)
+        self._observers = []
+
+    @property
+    def devices(self):
+        return self.mutator.devices
+
+    def schedule(self, at, action):
+        """
+        Adds scripted change, *action* is called with the engine
+        on the first tick at or after *at* virtual seconds
+        """
+        keys = [change.at for change in self._script]
+        self._script.insert(bisect.bisect_right(keys, at), ScriptedChange(at, action))
+
+    def set_condition(self, device, condition):
+        """
+        Changes condition of the patient of *device*, scripts
+        change conditions with it, so that EventEngine can first
+        bring the patient up to date
+        """
+        device.patient.condition = condition
+
+    def add_observer(self, callback, every=1):
+        """
+        Registers *callback*, it's called with the engine
+        after every *every*-th tick
+        """
+        if every < 1:
+            raise ValueError("observer must be called at least every tick, got: %s" % every)
+        self._observers.append((every, callback))
+
+    def tick(self):
+        """
+        Moves virtual time one step forward.
+        """
+        self.time += self.step
+        self.ticks += 1
+        while self._script and self._script[0].at <= self.time:
+            self._script.pop(0).action(self)
+
+        self.mutator.tick()
+        for param in self.params:
+            self.mutator.measure(param)
+
+        for every, callback in self._observers:
+            if self.ticks % every == 0:
+                callback(self)
+
+    def run(self, duration=None, *, ticks=None):
+        """
+        Runs simulation as fast as possible
+
+        Args:
+            duration (float): virtual seconds to simulate
+            ticks (int): number of ticks to simulate,
+                used instead of duration
+
+        Returns:
+            (:obj: RunStats) amount of simulated and wall-clock time
+        """
+        if ticks is None:
+            if duration is None:
+                raise TypeError("either duration or ticks must be given")
+            ticks = int(round(duration / self.step))
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            with metrics.span('tick', histogram=True):
+                self.tick()
+        wall_seconds = time.perf_counter() - start
+
+        stats = RunStats(
+            ticks,
+            ticks * self.step,
+            wall_seconds,
+            ticks / wall_seconds if wall_seconds > 0 else float('inf')
+        )
+        LOG.info("simulated %.1f s in %.2f s (%.0f ticks/s)",
+                 stats.simulated_seconds, stats.wall_seconds, stats.ticks_per_second)
+        return stats
+
+
+def health_scenario(patient_device, station, route=None):
+    """
+    Scripted changes of the health demo
+
+    Patient's condition gets worse after 5 and 12 seconds,
+    after 13 seconds an alert is sent from the patient
+    to the monitoring station.
+
+    Args:
+        patient_device (:obj: PatientDevice): device of the patient
+        station (:obj: Device): monitoring station
+        route (callable): route(source, destination) returning
+            paths the alert takes, stored in Alert.paths
+
+    Returns:
+        list of ScriptedChange objects
+    """
+    def set_condition(condition):
+        def action(engine):
+            engine.set_condition(patient_device, condition)
+        return action
+
+    def send_alert(engine):
+        paths = route(patient_device, station) if route is not None else None
+        engine.alerts.append(Alert(engine.time, patient_device, station, paths))
+
+    return [
+        ScriptedChange(5, set_condition(patient.UNWELL)),
+        ScriptedChange(12, set_condition(patient.CRITICAL)),
+        ScriptedChange(13, send_alert),
+    ]
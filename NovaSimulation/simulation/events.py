@@ -0,0 +1,210 @@
+"""
+This module contains discrete-event version of the simulation,
+in which only due events are processed, so simulating
+a slowly changing ward costs time proportional to events,
+not to devices times ticks
+"""
+from collections import namedtuple
+import heapq
+import itertools
+import logging
+import random
+import time
+
+from device import PatientDevice
+import metrics
+from patient import PatientView
+
+
+LOG = logging.getLogger(__name__)
+
+
+SamplingPlan = namedtuple('SamplingPlan', 'interval jitter')
+EventStats = namedtuple('EventStats', 'events simulated_seconds wall_seconds events_per_second')
+
+DEFAULT_SAMPLING = {
+    'hr': SamplingPlan(5.0, 0.5),
+    'spo2': SamplingPlan(1.0, 0.1),
+}
+
+
+class EventScheduler:
+    """
+    Priority queue of actions ordered by time
+
+    Actions scheduled for the same time are run
+    in the order they were scheduled.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.processed = 0
+        self._queue = []
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def schedule(self, at, action, *args):
+        """
+        Schedules action(*args) at *at*, it must not be in the past
+        """
+        if at < self.now:
+            raise ValueError("cannot schedule event in the past: %s < %s" % (at, self.now))
+        heapq.heappush(self._queue, (at, next(self._order), action, args))
+
+    def next_time(self):
+        return self._queue[0][0] if self._queue else None
+
+    def run_until(self, until):
+        """
+        Runs all events due at or before *until*,
+        events scheduled by them are run too if they are due
+
+        Returns:
+            (int) number of processed events
+        """
+        processed = 0
+        while self._queue and self._queue[0][0] <= until:
+            at, _, action, args = heapq.heappop(self._queue)
+            self.now = at
+            action(*args)
+            processed += 1
+        self.now = max(self.now, until)
+        self.processed += processed
+        return processed
+
+
+class EventEngine:
+    """
+    Runs simulation as a series of scheduled events
+
+    Every patient device schedules its next measurement
+    of every param by itself, with its own interval and jitter.
+    Patients' state is not ticked globally, it's brought
+    up to date (one random walk step every *patient_tick* seconds)
+    only when it is measured.
+    Condition changes, faults and any other actions are
+    scheduled events as well.
+
+    Args:
+        devices (iterable): devices taking part in the simulation
+        sampling (dict): {param: SamplingPlan(interval, jitter)},
+            first samples are taken at time 0
+        patient_tick (float): seconds between patient state changes
+        script (iterable): ScriptedChange objects, action is
+            called with the engine at *at*
+        seed (int): seed of jitter random generator
+    """
+
+    def __init__(self, devices, *, sampling=None, patient_tick=1.0, script=(), seed=None):
+        self.devices = devices
+        self.sampling = {param: SamplingPlan(*plan)
+                         for param, plan in (sampling or DEFAULT_SAMPLING).items()}
+        self.patient_tick = patient_tick
+        self.scheduler = EventScheduler()
+        self.alerts = []
+        self.random = random.Random(seed)
+        self._patient_ticks = {}
+
+        for dev in self.devices:
+            if isinstance(dev, PatientDevice):
+                self._patient_ticks[dev] = 0
+                for param in self.sampling:
+                    self.scheduler.schedule(0.0, self._measure, dev, param)
+        for change in script:
+            self.schedule(change.at, change.action)
+
+    @property
+    def time(self):
+        return self.scheduler.now
+
+    def schedule(self, at, action):
+        """
+        Schedules action(engine) at *at* virtual seconds
+        """
+        self.scheduler.schedule(at, action, self)
+
+    def add_observer(self, callback, every=1.0):
+        """
+        Registers *callback*, it's called with the engine
+        every *every* virtual seconds
+        """
+        if every <= 0:
+            raise ValueError("observer interval must be positive, got: %s" % every)
+
+        def observe(engine):
+            callback(engine)
+            self.schedule(self.time + every, observe)
+        self.schedule(self.time + every, observe)
+
+    def set_condition(self, device, condition):
+        """
+        Changes condition of the patient of *device* now, random
+        walk steps due before are taken in the old condition
+        """
+        self._advance_patient(device)
+        device.patient.condition = condition
+
+    def schedule_condition_change(self, at, device, condition):
+        def change(engine):
+            engine.set_condition(device, condition)
+        self.schedule(at, change)
+
+    def schedule_fault(self, at, device, param, duration=None):
+        """
+        Makes *param* sensor of a device faulty at *at*,
+        repaired after *duration* seconds if it's given
+        """
+        def repair(engine):
+            device.set_faulty(param, False)
+
+        def fail(engine):
+            device.set_faulty(param)
+            if duration is not None:
+                self.schedule(self.time + duration, repair)
+        self.schedule(at, fail)
+
+    def _advance_patient(self, device):
+        due = int(self.time // self.patient_tick)
+        steps = due - self._patient_ticks[device]
+        if steps <= 0:
+            return
+        self._patient_ticks[device] = due
+        patient = device.patient
+        if isinstance(patient, PatientView):
+            patient.tick(steps)
+        else:
+            for _ in range(steps):
+                patient.tick()
+
+    def _measure(self, device, param):
+        self._advance_patient(device)
+        device.measure(self.time, param)
+        interval, jitter = self.sampling[param]
+        delay = max(interval + self.random.uniform(-jitter, jitter), 1e-9)
+        self.scheduler.schedule(self.time + delay, self._measure, device, param)
+
+    def run(self, duration):
+        """
+        Runs events of the next *duration* virtual seconds
+
+        Returns:
+            (:obj: EventStats) number of events and wall-clock time
+        """
+        start = time.perf_counter()
+        start_time = self.time
+        with metrics.span('events'):
+            events = self.scheduler.run_until(self.time + duration)
+        metrics.count('events', events)
+        wall_seconds = time.perf_counter() - start
+
+        stats = EventStats(
+            events,
+            self.time - start_time,
+            wall_seconds,
+            events / wall_seconds if wall_seconds > 0 else float('inf')
+        )
+        LOG.info("simulated %.1f s in %.2f s (%d events)",
+                 stats.simulated_seconds, stats.wall_seconds, stats.events)
+        return stats
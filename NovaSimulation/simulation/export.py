@@ -0,0 +1,280 @@
+"""
+This module contains offscreen export of the health simulation:
+frames are rendered on Agg canvases into PNG sequences or video
+files, no display is needed and the pyplot backend is not changed.
+
+A headless run only records snapshots, SpO2 of every device
+and the number of alerts sent, after every N-th tick. Frames are
+rendered from the snapshots on a process pool, every worker draws
+its own figure once and later changes only node colours and paths,
+like the live view does.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+from PIL import Image
+
+from device import PatientDevice
+from engine import Alert
+from measurements import MeasurementStore
+from meshgraph import MeshGraph
+from viz import MeasurementsViz, measured_slots
+
+
+Snapshot = namedtuple('Snapshot', 'time spo2 alerts')
+# SpO2 of devices without measurements in a Snapshot
+NO_SPO2 = 255
+# topology and alerts of a recorded run, devices are given by their index
+Scene = namedtuple('Scene', 'coordinates values socket_edges nan_edges grid_size alerts')
+
+FRAME_PATTERN = 'frame_%06d.png'
+# output paths with these suffixes are encoded by ffmpeg
+VIDEO_SUFFIXES = ('.mp4', '.mkv', '.webm', '.avi', '.mov', '.gif')
+FIGSIZE = (8, 8)
+DPI = 100
+# zlib level of PNG frames, higher levels are much slower and hardly smaller
+PNG_COMPRESSION = 1
+
+# renderer of the worker process
+_viz = None
+
+
+class Recorder:
+    """
+    SimulationEngine observer keeping a Snapshot of every call
+
+    Args:
+        devices (list): devices of the engine, Scene and Snapshots
+            refer to them by index in this list
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        self.position = {dev: i for i, dev in enumerate(self.devices)}
+        self.snapshots = []
+        self.alerts = []
+        self._sources = measured_slots(self.devices)
+
+    def __call__(self, engine):
+        for alert in engine.alerts[len(self.alerts):]:
+            paths = None
+            if alert.paths is not None:
+                paths = tuple(None if path is None else [self.position[dev] for dev in path]
+                              for path in alert.paths)
+            self.alerts.append(Alert(alert.timestamp, self.position[alert.source],
+                                     self.position[alert.destination], paths))
+        spo2 = np.full(len(self.devices), NO_SPO2, dtype=np.uint8)
+        for store, slots, positions in self._sources:
+            if 'spo2' in store:
+                _, values, measured = store.last('spo2')
+                spo2[positions] = np.where(measured[slots], np.clip(values[slots], 0, NO_SPO2 - 1), NO_SPO2)
+        self.snapshots.append(Snapshot(engine.time, spo2, len(self.alerts)))
+
+    def scene(self, socket_graph, nan_graph, grid_size):
+        """
+        Scene of the recorded run, MeshGraphs must
+        have devices in the order of the recorder
+        """
+        return Scene(
+            [dev.coordinates for dev in self.devices],
+            [dev.value for dev in self.devices],
+            socket_graph.edges,
+            nan_graph.edges,
+            grid_size,
+            self.alerts,
+        )
+
+
+class Replay:
+    """
+    Stands for the engine of a recorded run: devices are rebuilt
+    from a Scene and every loaded Snapshot is put into their
+    MeasurementStore, so MeasurementsViz draws it like a live run
+    """
+
+    def __init__(self, scene):
+        self.store = MeasurementStore(len(scene.values), capacity=1)
+        self.devices = [
+            PatientDevice(tuple(coords), value, patient=None, store=self.store, slot=i)
+            for i, (coords, value) in enumerate(zip(scene.coordinates, scene.values))
+        ]
+        self._alerts = [
+            Alert(alert.timestamp, self.devices[alert.source], self.devices[alert.destination],
+                  None if alert.paths is None else tuple(
+                      None if path is None else [self.devices[i] for i in path]
+                      for path in alert.paths))
+            for alert in scene.alerts
+        ]
+        self.time = 0.0
+        self.alerts = []
+
+    def graph(self, edges):
+        graph = MeshGraph(self.devices)
+        if len(edges):
+            graph.add_edges(edges[:, 0], edges[:, 1])
+        return graph
+
+    def load(self, snapshot):
+        self.time = snapshot.time
+        measured = snapshot.spo2 != NO_SPO2
+        self.store.append('spo2', snapshot.time, snapshot.spo2[measured], np.flatnonzero(measured))
+        self.store.clear('spo2', ~measured)
+        self.alerts = self._alerts[:snapshot.alerts]
+
+
+class FrameViz(MeasurementsViz):
+    """
+    MeasurementsViz drawing Snapshots of a Scene on an offscreen
+    figure, with simulated time in the corner
+
+    Args:
+        scene (:obj: Scene): recorded run
+        figsize (tuple): size of frames in inches
+        dpi (int): pixels per inch
+    """
+
+    def __init__(self, scene, *, figsize=FIGSIZE, dpi=DPI):
+        self.replay = Replay(scene)
+        self.figsize = figsize
+        self.dpi = dpi
+        self._clock = None
+        super().__init__(
+            self.replay.graph(scene.socket_edges),
+            scene.grid_size,
+            disable_labels=True,
+            nan_graph=self.replay.graph(scene.nan_edges),
+            engine=self.replay
+        )
+
+    def create_plot(self):
+        # own Agg canvas, pyplot and its backend are left alone
+        fig = Figure(figsize=self.figsize, dpi=self.dpi)
+        FigureCanvasAgg(fig)
+        return fig, fig.add_subplot()
+
+    def subscribe_on_click(self):
+        # nothing can be clicked offscreen
+        pass
+
+    def draw(self):
+        super().draw()
+        self._clock = self.ax.text(0.01, 0.01, '', transform=self.ax.transAxes,
+                                   animated=True, backgroundcolor='w')
+
+    def _draw_animated(self):
+        super()._draw_animated()
+        self.fig.draw_artist(self._clock)
+
+    def render(self, snapshot):
+        """
+        Draws *snapshot*
+
+        Returns:
+            (array) RGBA pixels of the frame, valid until the next render
+        """
+        if self.fig is None:
+            self._before_show()
+        if snapshot.alerts < self.drawn_alerts:
+            # frames came out of order, paths are drawn again
+            self.drawn_alerts = 0
+            self.show_paths(None, None)
+        self.replay.load(snapshot)
+        self._clock.set_text(f"{snapshot.time:.1f} s")
+        self.draw_frame(self.replay)
+        return np.asarray(self.fig.canvas.buffer_rgba())
+
+
+def _load(scene, figsize, dpi):
+    global _viz
+    _viz = FrameViz(scene, figsize=figsize, dpi=dpi)
+
+
+def _render_chunk(frames):
+    for output_path, snapshot in frames:
+        Image.fromarray(_viz.render(snapshot)).save(output_path, compress_level=PNG_COMPRESSION)
+    return len(frames)
+
+
+def render_frames(scene, snapshots, output_dir, *, workers=None, figsize=FIGSIZE, dpi=DPI):
+    """
+    Renders every snapshot as PNG file named after FRAME_PATTERN
+
+    Frames are split into contiguous chunks, so a worker mostly
+    renders consecutive frames and only redraws changed artists.
+
+    Args:
+        scene (:obj: Scene): recorded run
+        snapshots (list): Snapshots of the run
+        output_dir (str): directory of frames, created if missing
+        workers (int): number of worker processes, all cores if None,
+            1 renders everything in this process
+
+    Returns:
+        list of paths of the frames
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, FRAME_PATTERN % i) for i in range(len(snapshots))]
+    frames = list(zip(paths, snapshots))
+    if workers == 1:
+        _load(scene, figsize, dpi)
+        _render_chunk(frames)
+        return paths
+    workers = workers or os.cpu_count()
+    size = max(1, math.ceil(len(frames) / (4 * workers)))
+    chunks = [frames[i:i + size] for i in range(0, len(frames), size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load,
+                             initargs=(scene, figsize, dpi)) as pool:
+        list(pool.map(_render_chunk, chunks))
+    return paths
+
+
+def _ffmpeg(output_path):
+    ffmpeg = shutil.which(matplotlib.rcParams['animation.ffmpeg_path'])
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is needed to write %s, export PNG frames "
+                           "into a directory instead" % output_path)
+    return ffmpeg
+
+
+def encode_video(frame_dir, output_path, fps):
+    """
+    Encodes frames of render_frames into a video with ffmpeg,
+    format is chosen by suffix of *output_path*
+    """
+    command = [_ffmpeg(output_path), '-y', '-loglevel', 'error', '-framerate', str(fps),
+               '-i', os.path.join(frame_dir, FRAME_PATTERN)]
+    if not output_path.lower().endswith('.gif'):
+        # most players need even sizes and 4:2:0 chroma
+        command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p']
+    subprocess.run(command + [output_path], check=True)
+
+
+def export(scene, snapshots, output_path, *, fps=10, **options):
+    """
+    Renders snapshots into a directory of PNG frames, or into
+    a video if *output_path* ends with one of VIDEO_SUFFIXES
+
+    Args:
+        scene (:obj: Scene): recorded run
+        snapshots (list): Snapshots of the run
+        output_path (str): directory or video file
+        fps (int): frames per second of the video
+        options: keyword arguments of render_frames
+    """
+    if not output_path.lower().endswith(VIDEO_SUFFIXES):
+        render_frames(scene, snapshots, output_path, **options)
+        return
+    # fails before anything is rendered
+    _ffmpeg(output_path)
+    with tempfile.TemporaryDirectory() as frame_dir:
+        render_frames(scene, snapshots, frame_dir, **options)
+        encode_video(frame_dir, output_path, fps)
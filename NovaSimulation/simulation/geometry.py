@@ -5,10 +5,22 @@ to calculate relative position of devices.
 import logging
 import math
 
+import numpy as np
+
 
 LOG = logging.getLogger(__name__)
 
 
+# maximum number of 1-unit changes of radiuses while looking for intersection
+OBSERVATIONAL_ERROR = 5000
+
+# status of a pair of circles
+INTERSECTING = 0
+SEPARATE = 1
+CONTAINED = 2
+COINCIDENT = 3
+
+
 # pylint: disable=invalid-name, too-many-arguments, too-many-locals
 def get_intersection_of_two_circles(dev1_coords, r0, dev2_coords, r1):
     """
@@ -63,6 +75,9 @@ def observational_err_handler(d, rn, rm):
     don't intersect, stop at maximum
     observational error value specified
 
+    Gives the same result as increasing or decreasing
+    radiuses by 1 until circles intersect, see reconcile_radii.
+
     Args:
         d (float): distance between nodes
         rn (float): distance (radius) from known device n
@@ -73,38 +88,124 @@ def observational_err_handler(d, rn, rm):
     Returns:
         rn, nm (float): updated radiuses
     """
-    obs_err = 5000
-    iterator = 0
+    if d != 0 and abs(rn - rm) <= d <= rn + rm:
+        return rn, rm # circles intersect already
 
-    # circles are separate
-    while d > rn + rm:
-        if iterator <= 5000:
-            rn += 1
-            rm += 1
-            iterator += 1
-        else:
-            LOG.error("Circles are separate")
-            return None
-
-    # one circle contained within the other
-    while d < abs(rn - rm):
-        if iterator <= obs_err:
-            rn += 1
-            rm -= 1
-            iterator += 1
-        if iterator >= obs_err:
-            rn -= 1
-            rm += 1
-            iterator += 1
-        if iterator >= 3 * obs_err:
-            LOG.error("Circles are contained within each other")
-            return None
-
-    if d == 0 and rn == rm:
+    new_rn, new_rm, status = reconcile_radii(d, rn, rm)
+    if status == SEPARATE:
+        LOG.error("Circles are separate")
+        return None
+    if status == CONTAINED:
+        LOG.error("Circles are contained within each other")
+        return None
+    if status == COINCIDENT:
         LOG.error("Coincident circle, possible duplicate reading")
         return None
 
-    return rn, rm
+    # radiuses change by whole steps, so their type is kept
+    return rn + int(round(float(new_rn) - rn)), rm + int(round(float(new_rm) - rm))
+
+
+def reconcile_radii(d, rn, rm):
+    """
+    Closed-form version of changing radiuses in steps of 1
+    until circles intersect, for many pairs of circles at once
+
+    Separate circles: both radiuses grow, at most
+    OBSERVATIONAL_ERROR + 1 times. One circle contained within
+    the other: rn grows and rm shrinks until OBSERVATIONAL_ERROR
+    steps in total are made, then rn shrinks and rm grows,
+    until 3 * OBSERVATIONAL_ERROR steps are made.
+
+    Args:
+        d (array like): distances between centres of circles
+        rn (array like): radiuses of first circles
+        rm (array like): radiuses of second circles
+
+    Returns:
+        (tuple) arrays of updated rn, rm and status of each pair:
+            INTERSECTING, SEPARATE, CONTAINED or COINCIDENT,
+            radiuses of pairs with other status than INTERSECTING
+            are meaningless
+    """
+    d, rn, rm = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (d, rn, rm)))
+    rn, rm = rn.copy(), rm.copy()
+    status = np.full(d.shape, INTERSECTING, dtype=np.int8)
+    obs_err = OBSERVATIONAL_ERROR
+
+    # circles are separate
+    steps = np.where(d > rn + rm, np.ceil((d - rn - rm) / 2), 0)
+    status[steps > obs_err + 1] = SEPARATE
+    rn += steps
+    rm += steps
+
+    # one circle contained within the other, first rn grows
+    contained = (status == INTERSECTING) & (d < np.abs(rn - rm))
+    diff = rn - rm
+    grow_steps = np.maximum(obs_err - 1 - steps, 0)
+    needed = np.ceil((-diff - d) / 2)
+    grown = contained & (diff < 0) & (needed <= grow_steps) & (np.abs(diff + 2 * needed) <= d)
+    change = np.where(grown, needed, np.where(contained, grow_steps, 0))
+    rn += change
+    rm -= change
+
+    # then rn shrinks, one step is lost at the switch
+    contained &= ~grown
+    diff = rn - rm
+    steps_made = np.where(steps == obs_err, obs_err + 2, obs_err + 1)
+    needed = np.ceil((diff - d) / 2)
+    shrunk = (contained & (diff > 0) & (needed <= 3 * obs_err - 1 - steps_made)
+              & (np.abs(diff - 2 * needed) <= d))
+    change = np.where(shrunk, needed, 0)
+    rn -= change
+    rm += change
+    status[contained & ~shrunk] = CONTAINED
+
+    status[(status == INTERSECTING) & (d == 0) & (rn == rm)] = COINCIDENT
+    return rn, rm, status
+
+
+def get_intersections_of_circles(centers_1, r0, centers_2, r1, reconcile=True):
+    """
+    Vectorized get_intersection_of_two_circles for many pairs of circles
+
+    Args:
+        centers_1 (array like): (k, 2) centres of first circles
+        r0 (array like): radiuses of first circles
+        centers_2 (array like): (k, 2) centres of second circles
+        r1 (array like): radiuses of second circles
+        reconcile (bool): change radiuses of circles that don't
+            intersect like observational_err_handler does
+
+    Returns:
+        (tuple) (k, 2) array of intersections, the one not below x axis
+            if possible, NaN for pairs that don't intersect,
+            and array of status of each pair: INTERSECTING,
+            SEPARATE, CONTAINED or COINCIDENT
+    """
+    c0 = np.asarray(centers_1, dtype=np.float64).reshape(-1, 2)
+    c1 = np.asarray(centers_2, dtype=np.float64).reshape(-1, 2)
+    delta = c1 - c0
+    d = np.hypot(delta[:, 0], delta[:, 1])
+    if reconcile:
+        r0, r1, status = reconcile_radii(d, r0, r1)
+    else:
+        r0, r1 = np.broadcast_arrays(np.asarray(r0, dtype=np.float64),
+                                     np.asarray(r1, dtype=np.float64), d)[:2]
+        status = np.full(d.shape, INTERSECTING, dtype=np.int8)
+        status[d > r0 + r1] = SEPARATE
+        status[d < np.abs(r0 - r1)] = CONTAINED
+        status[(d == 0) & (r0 == r1)] = COINCIDENT
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = (r0 ** 2 - r1 ** 2 + d ** 2) / (2 * d)
+        h = np.sqrt(np.maximum(r0 ** 2 - a ** 2, 0))
+        middle = c0 + (a / d)[:, None] * delta
+        offset = (h / d)[:, None] * np.column_stack((delta[:, 1], -delta[:, 0]))
+    upper = middle + offset
+    points = np.where((upper[:, 1] < 0)[:, None], middle - offset, upper)
+    points[status != INTERSECTING] = np.nan
+    return points, status
 
 
 def centroid(pos_1, pos_2, pos_3):
@@ -130,7 +231,7 @@ def centroid(pos_1, pos_2, pos_3):
     return (x, y)
 
 
-def distance_simulation_loop(distances):
+def distance_simulation_loop(distances, solver='legacy'):
     """
     Main loop of distance based simulation
 
@@ -148,10 +249,19 @@ def distance_simulation_loop(distances):
 
     Args:
         distances (dict) - result of DistanceFile.avg_dict
+        solver (str) - 'legacy' - described above,
+            'lstsq' - least-squares multilateration using
+            all placed devices, see localization.localize
     Returns:
         (list of tuples) device coordinates obtained
             by trilateration
     """
+    if solver == 'lstsq':
+        from localization import localize
+        return localize(distances)
+    if solver != 'legacy':
+        raise ValueError("unknown solver: %s" % solver)
+
     unknown_pos = list(distances)
     known_pos = []
 
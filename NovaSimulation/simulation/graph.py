@@ -4,68 +4,129 @@ and modification of graph objects
 """
 from itertools import zip_longest
 import logging
-import math
-import time
 
+from clustering import elect_masters
 from device import Device
 from distance import DistanceFile
 from geometry import distance_simulation_loop
+from meshgraph import MeshGraph
+import metrics
+from routing import RouteCache
+from spatial import CSRNeighbours, GridIndex, range_csr
 
 import networkx as nx
+import numpy as np
 
 
 LOG = logging.getLogger(__name__)
 
 
+@metrics.timed()
 def scan_in_range(graph, radius):
     """
-    Iterates twice over all devices,
-    checks if one is in radius of another
-    if yes: saves it in object state
+    Finds devices that are in range of each other
+    using a grid index built once from device coordinates,
+    if one is in radius of another saves it in object state
 
     Args:
         graph (:obj:) - networkx graph
         radius (int) - range of devices
     """
-    start = time.time()
-    for dev_a in graph:
-        for dev_b in graph:
-            distance = math.dist(dev_a.coordinates, dev_b.coordinates)
-            if dev_a.coordinates != dev_b.coordinates and distance <= radius:
-                dev_a.add_device_in_range(dev_b, distance)
-    LOG.error("scan_in_range: %.2f s", time.time() - start)
+    devices = list(graph)
 
+    with metrics.span('build_index'):
+        index = GridIndex([dev.coordinates for dev in devices], radius or 1)
 
-def create_socket_edges(graph, device_limit):
+    with metrics.span('query'):
+        for i, dev_a in enumerate(devices):
+            for j, distance in index.neighbours(i, radius):
+                dev_a.add_device_in_range(devices[j], distance)
+
+
+@metrics.timed()
+def scan_in_range_batch(graph, radius, tile_size=1024):
     """
-    Add socket edges to graph, algorithm
-    prioritizes picking slaves by shortest
-    distance to master device
+    NumPy batch version of scan_in_range
+
+    Distances are computed in tiles and kept in flat arrays
+    instead of devices_in_range dicts, device i is the i-th
+    node of the graph.
 
     Args:
-        graph (:obj:) - networkx graph
-        device_limit (int) - limits how many slaves
-            should one master have
-    """
-    start = time.time()
-    g_list = set(graph)
+        graph (:obj:) - networkx graph or MeshGraph
+        radius (int) - range of devices
+        tile_size (int) - number of devices compared at once
 
-    while g_list:
-        lowest = min(g_list)
-        lowest.is_master = True
+    Returns:
+        (:obj: CSRNeighbours) neighbours sorted by distance
+    """
+    if isinstance(graph, MeshGraph):
+        neighbours = graph.scan_in_range(radius, tile_size)
+    else:
+        neighbours = range_csr([dev.coordinates for dev in graph], radius, tile_size)
+    metrics.count('neighbour_pairs', len(neighbours.indices))
+    return neighbours
 
-        neighbours = lowest.devices_in_range
-        temp_list = [node for node in sorted(neighbours, key=neighbours.get) if node in g_list]
 
-        for device in temp_list[:device_limit]:
-            graph.add_edge(lowest, device)
-            lowest.add_connections(device)
-            g_list.remove(device)
-        g_list.remove(lowest)
-    LOG.error("create_socket_edges: %.2f s", time.time() - start)
+def neighbours_from_devices(graph):
+    """
+    Turns devices_in_range dicts filled by scan_in_range
+    into CSRNeighbours, device i is the i-th node of the graph
+    """
+    nodes = list(graph)
+    position = {node: i for i, node in enumerate(nodes)}
+    indptr, indices, distances = [0], [], []
+    for node in nodes:
+        in_range = node.devices_in_range
+        for other in sorted(in_range, key=in_range.get):
+            indices.append(position[other])
+            distances.append(in_range[other])
+        indptr.append(len(indices))
+    return CSRNeighbours(
+        np.asarray(indptr, dtype=np.intp),
+        np.asarray(indices, dtype=np.intp),
+        np.asarray(distances, dtype=np.float64)
+    )
+
+
+@metrics.timed()
+def create_socket_edges(graph, device_limit, neighbours=None):
+    """
+    Add socket edges to graph, algorithm
+    prioritizes picking slaves by shortest
+    distance to master device, see clustering.elect_masters
 
+    Args:
+        graph (:obj:) - networkx graph or MeshGraph
+        device_limit (int) - limits how many slaves
+            should one master have
+        neighbours (:obj: CSRNeighbours) - result of scan_in_range_batch,
+            if not given devices_in_range of every device is used
 
-def create_nan_edges(graph):
+    Returns:
+        (:obj: Election) masters and slaves as device indices
+    """
+    nodes = list(graph)
+    if neighbours is None:
+        neighbours = neighbours_from_devices(nodes)
+    election = elect_masters([node.value for node in nodes], neighbours, device_limit)
+
+    for master in election.masters.tolist():
+        nodes[master].is_master = True
+    edges = [(nodes[master], nodes[slave]) for master, slave in election.edges.tolist()]
+    if isinstance(graph, MeshGraph):
+        graph.add_edges(election.edges[:, 0], election.edges[:, 1])
+    else:
+        graph.add_edges_from(edges)
+    for master, slave in edges:
+        master.add_connections(slave)
+    metrics.count('masters_elected', len(election.masters))
+    metrics.count('socket_edges', len(edges))
+    return election
+
+
+@metrics.timed()
+def create_nan_edges(graph, neighbours=None):
     """
     Adds edges for NAN simulation
 
@@ -74,17 +135,95 @@ def create_nan_edges(graph):
     the device limit
 
     Args:
-        graph (:obj:) - networkx graph, if both
+        graph (:obj:) - networkx graph or MeshGraph, if both
             nan and sockets are used, it has to be
             copy of the same graph
+        neighbours (:obj: CSRNeighbours) - result of scan_in_range_batch,
+            if not given devices_in_range of every device is used
     """
+    if neighbours is not None:
+        nodes = list(graph)
+        for i, node in enumerate(nodes):
+            node.connections += [nodes[j] for j in neighbours.neighbours(i)[0].tolist()]
+
+        # devices without neighbours get a self loop, like zip_longest gives below
+        counts = np.diff(neighbours.indptr)
+        src = np.repeat(np.arange(len(nodes)), np.maximum(counts, 1))
+        dst = src.copy()
+        dst[np.repeat(counts > 0, np.maximum(counts, 1))] = neighbours.indices
+        if isinstance(graph, MeshGraph):
+            graph.add_edges(src, dst)
+        else:
+            graph.add_edges_from((nodes[u], nodes[v]) for u, v in zip(src.tolist(), dst.tolist()))
+        metrics.count('nan_edges', len(src))
+        return
+
     for node in graph.nodes:
         graph.add_edges_from(zip_longest([node], node.devices_in_range, fillvalue=node))
         node.connections += node.devices_in_range
+        metrics.count('nan_edges', max(len(node.devices_in_range), 1))
+
+
+@metrics.timed()
+def build_topology(devices, radius, device_limit):
+    """
+    Creates socket and NAN graphs of devices
+
+    Args:
+        devices (list) - Device objects
+        radius (int) - range of devices
+        device_limit (int) - limits how many slaves
+            should one master have
+
+    Returns:
+        (tuple) socket MeshGraph and NAN MeshGraph
+    """
+    socket_graph = MeshGraph(devices)
+    nan_graph = socket_graph.copy()
 
+    neighbours = scan_in_range_batch(socket_graph, radius)
+    create_socket_edges(socket_graph, device_limit, neighbours=neighbours)
+    create_nan_edges(nan_graph, neighbours=neighbours)
+    return socket_graph, nan_graph
 
-def distance_map_plot():
-    result = distance_simulation_loop(DistanceFile('./input/distances.json').avg_dict)
+
+def calculate_path_between(graph, node_1, node_2):
+    """
+    Finds main path between two devices and a backup
+    path that shares no intermediate device with it,
+    the graph itself is left unchanged
+
+    Args:
+        graph (:obj:) - RouteCache, MeshGraph or networkx graph
+        node_1 (:obj: Device) - source device
+        node_2 (:obj: Device) - target device
+
+    Returns:
+        (tuple) main and backup path as lists of devices,
+            None in place of a path that does not exist
+    """
+    if isinstance(graph, RouteCache):
+        return graph.paths(node_1, node_2)
+    if isinstance(graph, MeshGraph):
+        main_path = graph.shortest_path(node_1, node_2)
+        if main_path is None:
+            return None, None
+        backup_path = graph.shortest_path(node_1, node_2, blocked=main_path[1:-1])
+        return main_path, backup_path
+
+    try:
+        main_path = nx.shortest_path(graph, node_1, node_2)
+    except nx.NetworkXNoPath:
+        return None, None
+    try:
+        backup_path = nx.shortest_path(nx.restricted_view(graph, main_path[1:-1], []), node_1, node_2)
+    except nx.NetworkXNoPath:
+        backup_path = None
+    return main_path, backup_path
+
+
+def distance_map_plot(solver='legacy'):
+    result = distance_simulation_loop(DistanceFile('./input/distances.json').avg_dict, solver)
     G = nx.Graph()
 
     devices = []
@@ -0,0 +1,110 @@
+"""
+This module contains reading and writing of grid files,
+which hold coordinates and values of devices.
+
+Two formats are supported, detected automatically:
+
+- dense: comma separated matrix, a device is every non-zero cell,
+  its coordinates are (column, row),
+- sparse: one device per line, 'x,y,value' header line
+  followed by comma separated coordinates and value,
+  or .npy file with structured array of x, y and value fields.
+"""
+import numpy as np
+
+
+SPARSE_HEADER = 'x,y,value'
+SPARSE_DTYPE = np.dtype([('x', np.int64), ('y', np.int64), ('value', np.int64)])
+
+
+def is_sparse(input_path):
+    """
+    Checks if text grid file is in sparse format
+    """
+    with open(input_path, encoding='utf8') as f:
+        for line in f:
+            if line.strip():
+                return line.strip().replace(' ', '') == SPARSE_HEADER
+    return False
+
+
+def load_grid(input_path):
+    """
+    Reads devices from grid file of any format
+
+    Devices are ordered by x, then by y.
+
+    Returns:
+        (tuple) (k, 2) array of coordinates, array of k values
+            and size of the grid: number of rows of dense matrix,
+            the biggest coordinate + 1 for sparse files
+    """
+    if input_path.endswith('.npy'):
+        data = np.load(input_path)
+        if data.dtype.names is None:
+            return dense_to_devices(data)
+        return sparse_to_devices(data['x'], data['y'], data['value'])
+
+    if is_sparse(input_path):
+        data = np.loadtxt(input_path, dtype=np.int64, delimiter=',', skiprows=1, ndmin=2)
+        return sparse_to_devices(data[:, 0], data[:, 1], data[:, 2])
+
+    with open(input_path, encoding='utf8') as f:
+        matrix = np.loadtxt(f, dtype='i', delimiter=',', ndmin=2)
+    return dense_to_devices(matrix)
+
+
+def dense_to_devices(matrix):
+    """
+    Devices of non-zero cells of dense matrix, cell in row j
+    and column i is a device with coordinates (i, j)
+    """
+    x, y = np.nonzero(matrix.T)
+    return np.column_stack((x, y)), matrix.T[x, y], len(matrix)
+
+
+def sparse_to_devices(x, y, values):
+    x, y, values = (np.asarray(column) for column in (x, y, values))
+    keep = values != 0
+    x, y, values = x[keep], y[keep], values[keep]
+    order = np.lexsort((y, x))
+    size = int(max(x.max(), y.max())) + 1 if len(x) else 0
+    return np.column_stack((x[order], y[order])), values[order], size
+
+
+def random_grid(width, length, device_count, seed=None):
+    """
+    Places exactly *device_count* devices on random, distinct cells
+
+    Args:
+        width (int): number of rows of the grid
+        length (int): number of columns of the grid
+        device_count (int): number of devices, values are 1..device_count
+        seed (int): seed of random generator
+
+    Returns:
+        (tuple) rows, columns and values of devices
+    """
+    if device_count > width * length:
+        raise ValueError("%d devices don't fit on %dx%d grid" % (device_count, width, length))
+    rng = np.random.default_rng(seed)
+    cells = rng.choice(width * length, size=device_count, replace=False)
+    return cells // length, cells % length, np.arange(1, device_count + 1)
+
+
+def save_grid(output_path, width, length, rows, columns, values, sparse=False):
+    """
+    Writes devices to grid file, sparse if *sparse* is set
+    or the path ends with .npy, dense otherwise
+    """
+    if output_path.endswith('.npy'):
+        data = np.empty(len(values), dtype=SPARSE_DTYPE)
+        data['x'], data['y'], data['value'] = columns, rows, values
+        np.save(output_path, data)
+    elif sparse:
+        data = np.column_stack((columns, rows, values))
+        np.savetxt(output_path, data, fmt='%d', delimiter=',', header=SPARSE_HEADER, comments='')
+    else:
+        matrix = np.zeros((width, length), dtype='i')
+        matrix[rows, columns] = values
+        np.savetxt(output_path, matrix, fmt="%.1i", delimiter=',')
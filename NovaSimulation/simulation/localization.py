@@ -0,0 +1,217 @@
+"""
+This module contains localization of devices from
+distances between them, solved as batched linear
+least-squares problems.
+"""
+import math
+
+import numpy as np
+
+from geometry import centroid, get_intersection_of_two_circles
+
+
+# rows solved at once, bounds memory used for (rows x anchors) arrays
+CHUNK_SIZE = 1024
+# minimal ratio of the narrower spread of anchors to the wider one
+MIN_SPREAD = 1e-2
+
+
+def distance_matrix(distances):
+    """
+    Turns dict of distances into matrix
+
+    Args:
+        distances (dict): {devA: {devB: distance}}, e.g. DistanceFile.avg_dict,
+            negative distances are missing readings
+
+    Returns:
+        (tuple) list of device names and (n x n) matrix of distances,
+            missing distances are NaN
+    """
+    names = list(distances)
+    position = {name: i for i, name in enumerate(names)}
+    matrix = np.full((len(names), len(names)), np.nan)
+    for name, row in distances.items():
+        for other, distance in row.items():
+            if other in position and distance >= 0:
+                matrix[position[name], position[other]] = distance
+    np.fill_diagonal(matrix, 0)
+    return names, matrix
+
+
+def multilaterate(anchors, distances, min_spread=MIN_SPREAD):
+    """
+    Positions of many devices from distances to anchors
+
+    Every device is solved separately with linear least squares:
+    equations |p - a_i|^2 = d_i^2 are made linear by subtracting
+    their mean, which leaves one 2x2 normal system per device.
+    All systems are built and solved at once.
+
+    Args:
+        anchors (array like): (m, 2) coordinates of anchors
+        distances (array like): (k, m) distances from k devices
+            to the anchors, NaN if not known
+        min_spread (float): devices whose anchors are closer
+            to a line are not solved
+
+    Returns:
+        (:obj: numpy.ndarray) (k, 2) coordinates, NaN for devices
+            with less than 3 known distances or (nearly) collinear anchors
+    """
+    anchors = np.asarray(anchors, dtype=np.float64).reshape(-1, 2)
+    distances = np.asarray(distances, dtype=np.float64).reshape(-1, len(anchors))
+    known = np.isfinite(distances)
+    weight = known.astype(np.float64)
+    count = weight.sum(axis=1)
+
+    # c_i = d_i^2 - |a_i|^2, zero for unknown distances (their weight is zero)
+    c = np.where(known, distances, 0) ** 2 - (anchors ** 2).sum(axis=1)
+    c *= weight
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = weight @ anchors / count[:, None]
+    xx = weight @ (anchors[:, 0] * anchors[:, 0]) - count * mean[:, 0] * mean[:, 0]
+    xy = weight @ (anchors[:, 0] * anchors[:, 1]) - count * mean[:, 0] * mean[:, 1]
+    yy = weight @ (anchors[:, 1] * anchors[:, 1]) - count * mean[:, 1] * mean[:, 1]
+    bx = -0.5 * (c @ anchors[:, 0] - mean[:, 0] * c.sum(axis=1))
+    by = -0.5 * (c @ anchors[:, 1] - mean[:, 1] * c.sum(axis=1))
+
+    # det / trace^2 is close to the ratio of the narrower spread of anchors
+    # to the wider one, nearly collinear anchors make solution unstable
+    det = xx * yy - xy * xy
+    solvable = (count >= 3) & (det > min_spread * (xx + yy) ** 2)
+    det = np.where(solvable, det, np.nan)
+    return np.column_stack(((yy * bx - xy * by) / det, (xx * by - xy * bx) / det))
+
+
+def localize(distances, *, max_range=None, refine=1):
+    """
+    Coordinates of all devices from distances between them
+
+    Same frame as geometry.distance_simulation_loop: first device
+    is at (0, 0), second one on the negative x axis, third one above it.
+    Every following round places all devices that have known distances
+    to at least 3 placed devices within *max_range*, using all of them
+    as anchors. Then positions are refined *refine* times, each device
+    (but the first three, which define the frame) is solved again
+    with all other devices as anchors.
+
+    Args:
+        distances (dict): {devA: {devB: distance}}, e.g. DistanceFile.avg_dict
+        max_range (float): longer distances are not used, all are used if None
+        refine (int): number of refinement rounds
+
+    Returns:
+        (list of tuples) [(device, (x, y)), ...] in order of placement
+
+    Raises:
+        ValueError: if a device can't be placed
+    """
+    names, matrix = distance_matrix(distances)
+    if max_range is not None:
+        matrix[matrix > max_range] = np.nan
+    size = len(names)
+    positions = np.full((size, 2), np.nan)
+    order = []
+
+    def place(index, coords):
+        positions[index] = coords
+        order.append(index)
+
+    place(0, (0, 0))
+    if size > 1:
+        second = names.index(next(iter(distances[names[0]])))
+        place(second, (-matrix[0, second], 0))
+    if size > 2:
+        third = next(i for i in range(1, size) if i != second)
+        place(third, get_intersection_of_two_circles(
+            positions[0], matrix[0, third], positions[second], matrix[second, third]))
+
+    while len(order) < size:
+        placed = np.array(order)
+        unknown = np.setdiff1d(np.arange(size), placed)
+        solved = _solve(positions[placed], matrix[np.ix_(unknown, placed)])
+        found = np.isfinite(solved[:, 0])
+        if not found.any():
+            # anchors are (nearly) on a line, next device is placed
+            # like in geometry.distance_simulation_loop
+            index, coords = _trilaterate(positions[placed], matrix[np.ix_(unknown, placed)])
+            if index is None:
+                raise ValueError("device %s has less than 2 placed devices in range"
+                                 % names[unknown[0]])
+            place(unknown[index], coords)
+            continue
+        for index, coords in zip(unknown[found], solved[found]):
+            place(index, coords)
+
+    movable = np.array(order[3:], dtype=np.intp)
+    for _ in range(refine if len(movable) else 0):
+        others = matrix[movable].copy()
+        others[np.arange(len(movable)), movable] = np.nan
+        solved = _solve(positions, others)
+        found = np.isfinite(solved[:, 0])
+        positions[movable[found]] = solved[found]
+
+    return [(names[i], tuple(positions[i].tolist())) for i in order]
+
+
+def _trilaterate(anchors, distances):
+    """
+    Places first device with at least 2 known distances using
+    intersections of circles around its last 3 (or 2) anchors
+
+    Returns:
+        (tuple) row of placed device and its coordinates,
+            (None, None) if no device can be placed
+    """
+    for row, row_distances in enumerate(distances):
+        known = np.nonzero(np.isfinite(row_distances))[0][-3:].tolist()
+        if len(known) < 2:
+            continue
+        circles = [(tuple(anchors[i]), row_distances[i]) for i in known]
+        intersections = [
+            get_intersection_of_two_circles(*circles[i], *circles[j])
+            for i, j in ((0, 1), (0, 2), (1, 2)) if j < len(circles)
+        ]
+        if len(intersections) == 1:
+            return row, intersections[0]
+        return row, centroid(*intersections)
+    return None, None
+
+
+def _solve(anchors, distances):
+    solved = np.empty((len(distances), 2))
+    for start in range(0, len(distances), CHUNK_SIZE):
+        stop = start + CHUNK_SIZE
+        solved[start:stop] = multilaterate(anchors, distances[start:stop])
+    return solved
+
+
+def placement_error(result, truth):
+    """
+    Mean and max distance between localized and true coordinates
+
+    True coordinates are first moved to the frame of *result*: first
+    device at (0, 0), second one on the negative x axis, third one above it.
+
+    Args:
+        result (list of tuples): [(device, (x, y)), ...] from localize
+            or geometry.distance_simulation_loop
+        truth (dict): {device: (x, y)} true coordinates
+
+    Returns:
+        (tuple) mean and max error
+    """
+    names = [name for name, _ in result]
+    found = np.array([coords for _, coords in result], dtype=np.float64)
+    expected = np.array([truth[name] for name in names], dtype=np.float64)
+    expected -= expected[0]
+    angle = math.atan2(expected[1, 1], expected[1, 0])
+    # rotate second device onto the negative x axis
+    rotation = math.pi - angle
+    cos, sin = math.cos(rotation), math.sin(rotation)
+    expected = expected @ np.array([[cos, sin], [-sin, cos]])
+    if len(expected) > 2 and expected[2, 1] < 0:
+        expected[:, 1] *= -1
+    errors = np.hypot(*(found - expected).T)
+    return float(errors.mean()), float(errors.max())
@@ -0,0 +1,153 @@
+"""
+This module contains storage for history
+of measurements of many devices.
+"""
+import numpy as np
+
+import metrics
+
+
+class MeasurementStore:
+    """
+    Fixed-capacity ring buffers of measurements
+
+    Every param has one 2-D array of values and one of timestamps
+    (device x slot), shared by all devices of the store, allocated
+    when the param is first recorded. Each slot is written twice,
+    at position p and p + capacity, so the last *capacity*
+    measurements of a device are always a contiguous slice and
+    can be read in chronological order without copying.
+
+    Args:
+        device_count (int): number of devices, device is a row
+        capacity (int): number of kept measurements per device and param
+        dtype: type of measured values
+        timestamp_dtype: type of timestamps
+    """
+
+    def __init__(self, device_count, capacity=10, *, dtype=np.int32, timestamp_dtype=np.float64):
+        if capacity < 1:
+            raise ValueError("capacity must be positive, got: %s" % capacity)
+        self.device_count = device_count
+        self.capacity = capacity
+        self.dtype = dtype
+        self.timestamp_dtype = timestamp_dtype
+        self._values = {}
+        self._timestamps = {}
+        self._head = {}
+        self._count = {}
+        self._faulty = {}
+
+    def __contains__(self, param):
+        return param in self._values
+
+    def _buffers(self, param):
+        if param not in self._values:
+            shape = (self.device_count, 2 * self.capacity)
+            self._values[param] = np.zeros(shape, dtype=self.dtype)
+            self._timestamps[param] = np.zeros(shape, dtype=self.timestamp_dtype)
+            self._head[param] = np.zeros(self.device_count, dtype=np.intp)
+            self._count[param] = np.zeros(self.device_count, dtype=np.intp)
+        return self._values[param], self._timestamps[param], self._head[param], self._count[param]
+
+    def append(self, param, timestamp, values, devices=None):
+        """
+        Records one measurement for many devices at once
+
+        Args:
+            param (str): measured param
+            timestamp (float): time of measurement, same for all devices
+            values (array like): measured values, one per device
+            devices (array like): indices of measured devices,
+                all devices if not given
+        """
+        buffer, timestamps, head, count = self._buffers(param)
+        if devices is None:
+            devices = np.arange(self.device_count)
+        devices = np.asarray(devices, dtype=np.intp)
+        values = np.asarray(values, dtype=self.dtype)
+
+        position = head[devices]
+        for offset in (0, self.capacity):
+            buffer[devices, position + offset] = values
+            timestamps[devices, position + offset] = timestamp
+        head[devices] = (position + 1) % self.capacity
+        count[devices] = np.minimum(count[devices] + 1, self.capacity)
+        metrics.count('measurements', len(devices))
+
+    def append_one(self, param, timestamp, value, device):
+        """
+        Records one measurement of a single device,
+        cheaper than append for one device
+        """
+        buffer, timestamps, head, count = self._buffers(param)
+        position = head[device]
+        buffer[device, position] = buffer[device, position + self.capacity] = value
+        timestamps[device, position] = timestamps[device, position + self.capacity] = timestamp
+        head[device] = (position + 1) % self.capacity
+        if count[device] < self.capacity:
+            count[device] += 1
+        metrics.count('measurements')
+
+    def count(self, param, device=None):
+        """
+        Number of kept *param* measurements of a device,
+        or array of counts of all devices
+        """
+        if param not in self:
+            return 0 if device is not None else np.zeros(self.device_count, dtype=np.intp)
+        counts = self._count[param]
+        return int(counts[device]) if device is not None else counts.copy()
+
+    def faulty(self, param, device=None):
+        """
+        Whether *param* sensor of a device is faulty,
+        or boolean array of all devices
+        """
+        if param not in self._faulty:
+            return False if device is not None else np.zeros(self.device_count, dtype=bool)
+        faulty = self._faulty[param]
+        return bool(faulty[device]) if device is not None else faulty.copy()
+
+    def set_faulty(self, param, device, faulty=True):
+        """
+        Marks *param* sensor of a device faulty or repaired
+        """
+        if param not in self._faulty:
+            self._faulty[param] = np.zeros(self.device_count, dtype=bool)
+        self._faulty[param][device] = faulty
+
+    def history(self, param, device):
+        """
+        Kept *param* measurements of a device, oldest first
+
+        Returns:
+            (tuple) read-only views of timestamps and values
+        """
+        if param not in self:
+            empty = np.empty(0, dtype=self.dtype)
+            return np.empty(0, dtype=self.timestamp_dtype), empty
+        buffer, timestamps, head, count = self._buffers(param)
+        start = (head[device] - count[device]) % self.capacity
+        window = slice(start, start + count[device])
+        values, times = buffer[device, window], timestamps[device, window]
+        values.flags.writeable = times.flags.writeable = False
+        return times, values
+
+    def last(self, param):
+        """
+        Last *param* measurement of every device
+
+        Returns:
+            (tuple) timestamps and values of all devices and mask
+                of devices having any, entries of the others
+                are stale or zeros and must not be used
+        """
+        buffer, timestamps, head, count = self._buffers(param)
+        rows = np.arange(self.device_count)
+        last = (head - 1) % self.capacity
+        return timestamps[rows, last], buffer[rows, last], count > 0
+
+    def clear(self, param, device):
+        if param in self:
+            self._count[param][device] = 0
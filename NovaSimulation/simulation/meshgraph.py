@@ -0,0 +1,228 @@
+"""
+This module contains integer-indexed graph used
+on hot paths of the simulation instead of networkx.
+"""
+from collections import deque
+
+import networkx as nx
+import numpy as np
+
+from spatial import CSRNeighbours, range_csr
+
+
+class MeshGraph:
+    """
+    Undirected graph of devices kept as edge arrays
+
+    Device i is the i-th device given on creation, edges are
+    stored as pairs of indices and added in bulk.
+    Adjacency in CSR form and networkx graph are built lazily
+    and cached until edges change, so a networkx graph is only
+    created when a visualization asks for it.
+
+    Iterating over MeshGraph, `nodes`, `add_edge` and `add_edges_from`
+    work like in networkx.Graph, so functions in graph module
+    accept both.
+
+    Args:
+        devices (iterable): Device objects, nodes of the graph
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        self.position = {dev: i for i, dev in enumerate(self.devices)}
+        self.neighbours = None
+        self._edge_chunks = []
+        self._edges = None
+        self._adjacency = None
+        self._networkx = None
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __contains__(self, device):
+        return device in self.position
+
+    @property
+    def nodes(self):
+        return self.devices
+
+    def copy(self):
+        """
+        Copy sharing devices, but not edges
+        """
+        graph = MeshGraph.__new__(MeshGraph)
+        graph.devices = self.devices
+        graph.position = self.position
+        graph.neighbours = self.neighbours
+        graph._edge_chunks = list(self._edge_chunks)
+        graph._edges = self._edges
+        graph._adjacency = self._adjacency
+        graph._networkx = None
+        return graph
+
+    def coordinates(self):
+        return np.array([dev.coordinates for dev in self.devices], dtype=np.float64).reshape(-1, 2)
+
+    def scan_in_range(self, radius, tile_size=1024):
+        """
+        Finds devices in range of each other, see spatial.range_csr
+
+        Returns:
+            (:obj: CSRNeighbours) neighbours sorted by distance
+        """
+        self.neighbours = range_csr(self.coordinates(), radius, tile_size)
+        return self.neighbours
+
+    def add_edges(self, src, dst):
+        """
+        Adds many edges at once
+
+        Args:
+            src (array like): indices of first ends of edges
+            dst (array like): indices of second ends of edges
+        """
+        src = np.asarray(src, dtype=np.intp).ravel()
+        dst = np.asarray(dst, dtype=np.intp).ravel()
+        if src.shape != dst.shape:
+            raise ValueError("src and dst must have the same length")
+        if len(src):
+            self._edge_chunks.append(np.column_stack((src, dst)))
+            self._edges = self._adjacency = self._networkx = None
+
+    def add_edges_from(self, edges):
+        pairs = [(self.position[u], self.position[v]) for u, v in edges]
+        if pairs:
+            pairs = np.asarray(pairs, dtype=np.intp)
+            self.add_edges(pairs[:, 0], pairs[:, 1])
+
+    def add_edge(self, u, v):
+        self.add_edges_from([(u, v)])
+
+    @property
+    def edges(self):
+        """
+        (k, 2) array of unique edges, smaller index first
+        """
+        if self._edges is None:
+            if self._edge_chunks:
+                pairs = np.concatenate(self._edge_chunks)
+                # one integer key per pair, smaller index first, sorts much
+                # faster than rows and in the same order
+                count = len(self)
+                keys = (np.minimum(pairs[:, 0], pairs[:, 1]).astype(np.int64) * count
+                        + np.maximum(pairs[:, 0], pairs[:, 1]))
+                keys.sort()
+                keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+                self._edges = np.column_stack((keys // count, keys % count)).astype(np.intp)
+            else:
+                self._edges = np.empty((0, 2), dtype=np.intp)
+            self._edge_chunks = [self._edges] if len(self._edges) else []
+        return self._edges
+
+    def number_of_edges(self):
+        return len(self.edges)
+
+    def adjacency(self):
+        """
+        Adjacency in CSR form, self loops are skipped,
+        distances are lengths of edges
+
+        Returns:
+            (:obj: CSRNeighbours) neighbours of every device
+        """
+        if self._adjacency is None:
+            edges = self.edges
+            edges = edges[edges[:, 0] != edges[:, 1]]
+            rows = np.concatenate((edges[:, 0], edges[:, 1]))
+            cols = np.concatenate((edges[:, 1], edges[:, 0]))
+            coords = self.coordinates()
+            lengths = np.hypot(*(coords[rows] - coords[cols]).T) if len(rows) else np.empty(0)
+
+            order = np.lexsort((cols, lengths, rows))
+            indptr = np.zeros(len(self) + 1, dtype=np.intp)
+            np.cumsum(np.bincount(rows, minlength=len(self)), out=indptr[1:])
+            self._adjacency = CSRNeighbours(indptr, cols[order], lengths[order])
+        return self._adjacency
+
+    def degree(self):
+        return np.diff(self.adjacency().indptr)
+
+    def components(self):
+        """
+        Connected component of every device
+
+        Edges hook the root of the bigger label under the smaller one,
+        then labels jump to their roots, until both ends of every
+        edge have the same label.
+
+        Returns:
+            array of labels, the smallest device index of the component
+        """
+        labels = np.arange(len(self))
+        src, dst = self.edges.T
+        while True:
+            low = np.minimum(labels[src], labels[dst])
+            np.minimum.at(labels, labels[src], low)
+            np.minimum.at(labels, labels[dst], low)
+            while True:
+                roots = labels[labels]
+                if np.array_equal(roots, labels):
+                    break
+                labels = roots
+            if np.array_equal(labels[src], labels[dst]):
+                return labels
+
+    def shortest_path(self, source, target, blocked=()):
+        """
+        Breadth-first search for path with the least hops,
+        graph is not modified
+
+        Args:
+            source (:obj: Device): first device of the path
+            target (:obj: Device): last device of the path
+            blocked (iterable): devices the path must not go through
+
+        Returns:
+            list of Devices, None if there is no path
+        """
+        adjacency = self.adjacency()
+        start, goal = self.position[source], self.position[target]
+        parent = np.full(len(self), -1, dtype=np.intp)
+        visited = np.zeros(len(self), dtype=bool)
+        for dev in blocked:
+            visited[self.position[dev]] = True
+        visited[start] = True
+
+        queue = deque([start])
+        while queue and not visited[goal]:
+            current = queue.popleft()
+            for other in adjacency.neighbours(current)[0].tolist():
+                if not visited[other]:
+                    visited[other] = True
+                    parent[other] = current
+                    queue.append(other)
+
+        if start != goal and parent[goal] < 0:
+            return None
+        path = [goal]
+        while path[-1] != start:
+            path.append(parent[path[-1]])
+        return [self.devices[i] for i in reversed(path)]
+
+    def to_networkx(self):
+        """
+        networkx graph with the same nodes and edges,
+        built once and cached until edges change
+        """
+        if self._networkx is None:
+            graph = nx.Graph()
+            graph.add_nodes_from((dev, {'pos': dev.coordinates, 'value': dev.value})
+                                 for dev in self.devices)
+            graph.add_edges_from((self.devices[u], self.devices[v])
+                                 for u, v in self.edges.tolist())
+            self._networkx = graph
+        return self._networkx
@@ -0,0 +1,288 @@
+"""
+This module contains instrumentation of simulation runs:
+timing spans, counters and histograms.
+
+Everything is recorded into one registry, which is disabled
+by default. While disabled span() returns a shared no-op context
+manager and count() and observe() return right away, so
+instrumented code costs one function call. Use enable() before
+a run and report() or Metrics.format() after it.
+
+Spans can be nested, a span is reported under the path of
+spans open when it started, e.g. 'build_topology/scan_in_range_batch'.
+"""
+from collections import Counter, defaultdict
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import logging
+import pstats
+import time
+
+import numpy as np
+
+
+LOG = logging.getLogger(__name__)
+
+
+PERCENTILES = (50, 90, 99)
+# number of functions listed in profile of a report
+PROFILE_LIMIT = 20
+
+_NOOP = contextlib.nullcontext()
+_metrics = None
+
+
+class SpanStats:
+    """
+    Number of calls, total and longest time of one span
+    """
+    __slots__ = ('calls', 'seconds', 'max_seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds):
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+
+class Metrics:
+    """
+    Spans, counters and histograms of one run
+
+    Args:
+        profile (str): name of span profiled with cProfile,
+            all its calls are added to one profile, nested
+            calls of the same span are profiled once
+    """
+
+    def __init__(self, profile=None):
+        self.spans = {}
+        self.counters = Counter()
+        self.histograms = defaultdict(list)
+        self.profile_span = profile
+        self.profiler = None
+        self._open = []
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name, histogram=False):
+        """
+        Measures time of the block
+
+        Args:
+            name (str): name of the span
+            histogram (bool): also add every duration
+                to histogram named by path of the span
+        """
+        self._open.append(name)
+        path = '/'.join(self._open)
+        # created on enter, so spans are kept in order of start
+        stats = self.spans.get(path)
+        if stats is None:
+            stats = self.spans[path] = SpanStats()
+        profiled = name == self.profile_span and self._open.count(name) == 1
+        if profiled:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profiled:
+                self.profiler.disable()
+            self._open.pop()
+            stats.add(seconds)
+            if histogram:
+                self.histograms[path].append(seconds)
+            else:
+                LOG.debug("%s: %.3f s", path, seconds)
+
+    def report(self):
+        """
+        Returns:
+            (dict) JSON serializable report of the run
+        """
+        return {
+            'wall_seconds': time.perf_counter() - self._started,
+            'spans': {
+                path: {'calls': stats.calls, 'seconds': stats.seconds,
+                       'max_seconds': stats.max_seconds}
+                for path, stats in self.spans.items()
+            },
+            'counters': dict(sorted(self.counters.items())),
+            'histograms': {name: summarize(values) for name, values in self.histograms.items()},
+            'profile': self.profile_rows() if self.profiler is not None else None,
+        }
+
+    def profile_rows(self, limit=PROFILE_LIMIT):
+        """
+        Functions which took the most cumulative time in the profiled span
+
+        Returns:
+            list of dicts with function, calls, own and cumulative seconds
+        """
+        stats = pstats.Stats(self.profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [
+            {'function': pstats.func_std_string(function), 'calls': calls,
+             'seconds': own, 'cumulative_seconds': cumulative}
+            for function, (_, calls, own, cumulative, _) in rows
+        ]
+
+    def dump_profile(self, output_path):
+        """
+        Writes profile of the profiled span as pstats file,
+        readable by pstats.Stats or snakeviz
+        """
+        if self.profiler is None:
+            raise ValueError("span %r was not profiled" % self.profile_span)
+        self.profiler.dump_stats(output_path)
+
+    def format(self, fmt='text'):
+        """
+        Report as text table or JSON
+
+        Args:
+            fmt (str): 'text' or 'json'
+        """
+        if fmt == 'json':
+            return json.dumps(self.report(), indent=2)
+        if fmt != 'text':
+            raise ValueError("unknown report format: %s" % fmt)
+
+        report = self.report()
+        lines = [f"wall time: {report['wall_seconds']:.3f} s"]
+        if report['spans']:
+            lines.append(f"\n{'span':<40} {'calls':>8} {'total s':>10} {'max s':>10}")
+            for path, stats in report['spans'].items():
+                depth = path.count('/')
+                label = '  ' * depth + path.rsplit('/', 1)[-1]
+                lines.append(f"{label:<40} {stats['calls']:>8} {stats['seconds']:>10.3f} "
+                             f"{stats['max_seconds']:>10.3f}")
+        if report['counters']:
+            lines.append(f"\n{'counter':<40} {'value':>10}")
+            lines += [f"{name:<40} {value:>10}" for name, value in report['counters'].items()]
+        if report['histograms']:
+            header = ''.join(f" {'p%d' % p:>10}" for p in PERCENTILES)
+            lines.append(f"\n{'histogram':<40} {'count':>8} {'mean':>10}{header} {'max':>10}")
+            for name, summary in report['histograms'].items():
+                values = ''.join(f" {summary['p%d' % p]:>10.3g}" for p in PERCENTILES)
+                lines.append(f"{name:<40} {summary['count']:>8} {summary['mean']:>10.3g}"
+                             f"{values} {summary['max']:>10.3g}")
+        if self.profiler is not None:
+            stream = io.StringIO()
+            pstats.Stats(self.profiler, stream=stream).sort_stats('cumulative') \
+                .print_stats(PROFILE_LIMIT)
+            lines.append(f"\nprofile of {self.profile_span}:{stream.getvalue()}")
+        return '\n'.join(lines)
+
+
+def summarize(values):
+    """
+    Count, mean, percentiles and max of histogram values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    summary = {'count': len(values)}
+    if not len(values):
+        return summary
+    summary['mean'] = float(values.mean())
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary['p%d' % percentile] = float(value)
+    summary['max'] = float(values.max())
+    return summary
+
+
+def enable(profile=None):
+    """
+    Starts recording into a new registry
+
+    Args:
+        profile (str): name of span profiled with cProfile
+
+    Returns:
+        (:obj: Metrics) the registry
+    """
+    global _metrics
+    _metrics = Metrics(profile)
+    return _metrics
+
+
+def disable():
+    """
+    Stops recording
+
+    Returns:
+        (:obj: Metrics) registry recorded until now, None if disabled
+    """
+    global _metrics
+    metrics, _metrics = _metrics, None
+    return metrics
+
+
+def current():
+    """
+    Returns:
+        (:obj: Metrics) registry being recorded, None if disabled
+    """
+    return _metrics
+
+
+def span(name, histogram=False):
+    """
+    Context manager measuring time of the block, see Metrics.span
+    """
+    if _metrics is None:
+        return _NOOP
+    return _metrics.span(name, histogram)
+
+
+def timed(name=None, histogram=False):
+    """
+    Decorator measuring every call of a function as a span,
+    named after the function if *name* is not given
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _metrics is None:
+                return function(*args, **kwargs)
+            with _metrics.span(span_name, histogram):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    """
+    Adds *amount* to counter *name*
+    """
+    if _metrics is not None:
+        _metrics.counters[name] += amount
+
+
+def observe(name, value):
+    """
+    Adds *value* to histogram *name*
+    """
+    if _metrics is not None:
+        _metrics.histograms[name].append(value)
+
+
+def report(fmt='text'):
+    """
+    Report of the registry being recorded, see Metrics.format
+    """
+    if _metrics is None:
+        raise RuntimeError("metrics are not enabled")
+    return _metrics.format(fmt)
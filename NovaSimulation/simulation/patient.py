@@ -1,5 +1,7 @@
 import random
 
+import numpy as np
+
 UNIT = {
     'hr': 'bpm',
     'spo2': '%'
@@ -61,3 +63,137 @@ class Patient:
 
     def measure(self, param):
         return self.state[param]
+
+
+class PatientPopulation:
+    """
+    Simulates state of many patients at once.
+
+    State and condition bounds of all patients are kept in NumPy
+    arrays (patient x param), so a tick is one random walk and clip
+    for the whole population. Single patients are available
+    as PatientView objects, which behave like Patient.
+
+    Args:
+        count (int): number of patients
+        ids (iterable): ids of patients, 0..count-1 by default
+        condition (dict): initial condition of every patient,
+            it has to have bounds of all *params*
+        params (iterable): simulated params
+        seed (int): seed of the random generator
+    """
+
+    def __init__(self, count, *, ids=None, condition=RESTING, params=('hr', 'spo2'), seed=None):
+        self.params = tuple(params)
+        self.columns = {param: column for column, param in enumerate(self.params)}
+        self.ids = np.arange(count) if ids is None else np.asarray(list(ids))
+        if len(self.ids) != count:
+            raise ValueError("expected %s ids, got: %s" % (count, len(self.ids)))
+        self.rng = np.random.default_rng(seed)
+
+        self.conditions = []
+        self.condition_index = np.zeros(count, dtype=np.intp)
+        self.low = np.empty((count, len(self.params)), dtype=np.int16)
+        self.high = np.empty_like(self.low)
+        self.set_condition(slice(None), condition)
+        self.state = self.rng.integers(self.low, self.high, endpoint=True).astype(np.int16)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("patient index out of range: %s" % index)
+        return PatientView(self, index % len(self))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield PatientView(self, index)
+
+    def _condition_code(self, condition):
+        # equal conditions share a code, so new dicts with known
+        # bounds don't make the table grow
+        for code, known in enumerate(self.conditions):
+            if known is condition or known == condition:
+                return code
+        self.conditions.append(condition)
+        return len(self.conditions) - 1
+
+    def set_condition(self, index, condition):
+        """
+        Changes condition of patients
+
+        Args:
+            index: index, slice or array of patient indices
+            condition (dict): new condition, e.g. UNWELL
+        """
+        self.condition_index[index] = self._condition_code(condition)
+        bounds = np.array([condition[param] for param in self.params], dtype=np.int16)
+        self.low[index] = bounds[:, 0]
+        self.high[index] = bounds[:, 1]
+
+    def tick(self):
+        """
+        Randomly modifies state of all patients based on their conditions.
+        """
+        self.state += self.rng.integers(-1, 1, size=self.state.shape, dtype=np.int16, endpoint=True)
+        np.clip(self.state, self.low, self.high, out=self.state)
+
+    def measure(self, param):
+        """
+        Returns:
+            (array) current *param* of all patients, a view, not a copy
+        """
+        return self.state[:, self.columns[param]]
+
+
+class PatientView:
+    """
+    Single patient of PatientPopulation, behaves like Patient.
+    """
+    __slots__ = ('population', 'index')
+
+    def __init__(self, population, index):
+        self.population = population
+        self.index = index
+
+    @property
+    def id(self):
+        return self.population.ids[self.index].item()
+
+    @property
+    def condition(self):
+        return self.population.conditions[self.population.condition_index[self.index]]
+
+    @condition.setter
+    def condition(self, condition):
+        self.population.set_condition(self.index, condition)
+
+    @property
+    def state(self):
+        """
+        Copy of patient's state as {param: value}
+        """
+        row = self.population.state[self.index].tolist()
+        return dict(zip(self.population.params, row))
+
+    def tick(self, steps=1):
+        """
+        Randomly modifies this patient's state only, *steps* times,
+        PatientPopulation.tick should be used for all patients.
+        """
+        population = self.population
+        moves = population.rng.integers(-1, 1, size=(steps, len(population.params)), endpoint=True)
+        low, high = population.low[self.index].tolist(), population.high[self.index].tolist()
+        state = population.state[self.index].tolist()
+        for move in moves.tolist():
+            state = [min(max(value + delta, minV), maxV)
+                     for value, delta, minV, maxV in zip(state, move, low, high)]
+        population.state[self.index] = state
+
+    @property
+    def params(self):
+        return iter(self.condition)
+
+    def measure(self, param):
+        return int(self.population.state[self.index, self.population.columns[param]])
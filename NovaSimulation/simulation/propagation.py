@@ -0,0 +1,215 @@
+"""
+This module contains propagation of messages over the mesh:
+one message from a source device is moved a hop at a time
+over NAN or socket edges, and arrival hop and time of every
+device and the number of transmissions are reported.
+
+Every hop is computed at once for the whole frontier from CSR
+adjacency arrays, so a broadcast to all devices costs a few
+array operations per hop, not per device.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+import metrics
+from meshgraph import MeshGraph
+from routing import StationTree
+
+
+PROTOCOLS = ('flood', 'tree', 'unicast')
+# seconds per hop, NAN messages wait for discovery windows,
+# sockets are already connected
+NAN_LATENCY = 0.05
+SOCKET_LATENCY = 0.01
+
+
+class PropagationReport(namedtuple('PropagationReport',
+                                   'protocol source hops times transmissions duplicates')):
+    """
+    Result of one propagation
+
+    hops and times are arrays indexed by device position in the
+    graph, -1 and NaN for devices the message didn't reach.
+    transmissions counts every message sent over a link,
+    duplicates counts messages arriving at a device which
+    already had the message.
+    """
+    __slots__ = ()
+
+    @property
+    def reached(self):
+        return int((self.hops >= 0).sum())
+
+    @property
+    def coverage(self):
+        return self.reached / len(self.hops)
+
+    @property
+    def max_hops(self):
+        return int(self.hops.max())
+
+    @property
+    def mean_hops(self):
+        return float(self.hops[self.hops >= 0].mean())
+
+    @property
+    def max_time(self):
+        return float(np.nanmax(self.times))
+
+
+class Propagation:
+    """
+    Moves messages over the topology of build_topology
+
+    Protocols:
+        flood - over NAN, every device sends the message to all its
+            neighbours but the one it came from, when it gets it first
+        tree - over sockets, a slave sends to its master, a master to
+            its slaves, clusters are joined by NAN links between their
+            devices. The spanning tree is known in advance, so every
+            device gets the message once.
+        unicast - over NAN, one copy per destination along its route
+            from StationTree rooted at the source, the cached
+            shortest-path tree of the source
+
+    Args:
+        socket_graph (:obj: MeshGraph): socket graph, masters and their slaves
+        nan_graph (:obj: MeshGraph): NAN graph of the same devices
+        nan_latency (float): seconds per NAN hop
+        socket_latency (float): seconds per socket hop
+    """
+
+    def __init__(self, socket_graph, nan_graph, *, nan_latency=NAN_LATENCY,
+                 socket_latency=SOCKET_LATENCY):
+        self.socket_graph = socket_graph
+        self.nan_graph = nan_graph
+        self.nan_latency = nan_latency
+        self.socket_latency = socket_latency
+        self._tree_adjacency = self._clusters = None
+        self._routes = {}
+
+    def run(self, source, protocol='flood', **options):
+        """
+        Propagates a message from *source* device with *protocol*,
+        see flood, tree and unicast
+
+        Returns:
+            (:obj: PropagationReport)
+        """
+        if protocol not in PROTOCOLS:
+            raise ValueError("unknown protocol: %s" % protocol)
+        with metrics.span(protocol):
+            return getattr(self, protocol)(source, **options)
+
+    def _tree_graph(self):
+        """
+        Socket edges and NAN edges between different clusters
+        """
+        if self._tree_adjacency is None:
+            self._clusters = self.socket_graph.components()
+            edges = self.nan_graph.edges
+            gateways = edges[self._clusters[edges[:, 0]] != self._clusters[edges[:, 1]]]
+            graph = MeshGraph(self.nan_graph.devices)
+            for part in (self.socket_graph.edges, gateways):
+                if len(part):
+                    graph.add_edges(part[:, 0], part[:, 1])
+            self._tree_adjacency = graph.adjacency()
+        return self._tree_adjacency
+
+    def flood(self, source):
+        """
+        Floods the NAN graph from *source* device
+        """
+        adjacency = self.nan_graph.adjacency()
+        hops, parent = _new_arrays(len(self.nan_graph))
+        start = self.nan_graph.position[source]
+        hops[start] = 0
+        frontier = np.array([start], dtype=np.intp)
+        transmissions = duplicates = 0
+        while len(frontier):
+            src, dst = adjacency.arcs(frontier)
+            sent = dst != parent[src]
+            src, dst = src[sent], dst[sent]
+            transmissions += len(dst)
+            new = hops[dst] < 0
+            dst, first = np.unique(dst[new], return_index=True)
+            duplicates += len(src) - len(dst)
+            parent[dst] = src[new][first]
+            hops[dst] = hops[parent[dst]] + 1
+            frontier = dst
+        metrics.count('transmissions', transmissions)
+        return PropagationReport('flood', start, hops, _times(hops, self.nan_latency),
+                                 transmissions, duplicates)
+
+    def tree(self, source):
+        """
+        Sends message from *source* device along the spanning tree
+        of socket clusters
+        """
+        adjacency = self._tree_graph()
+        hops, parent = _new_arrays(len(self.nan_graph))
+        times = np.full(len(hops), np.nan)
+        start = self.nan_graph.position[source]
+        hops[start], times[start] = 0, 0.0
+        frontier = np.array([start], dtype=np.intp)
+        while len(frontier):
+            src, dst = adjacency.arcs(frontier)
+            new = hops[dst] < 0
+            dst, first = np.unique(dst[new], return_index=True)
+            src = src[new][first]
+            socket = self._clusters[src] == self._clusters[dst]
+            hops[dst] = hops[src] + 1
+            parent[dst] = src
+            times[dst] = times[src] + np.where(socket, self.socket_latency, self.nan_latency)
+            frontier = dst
+        transmissions = int((parent >= 0).sum())
+        metrics.count('transmissions', transmissions)
+        return PropagationReport('tree', start, hops, times, transmissions, 0)
+
+    def unicast(self, source, destinations=None):
+        """
+        Args:
+            source (:obj: Device): sending device
+            destinations (iterable): devices getting a copy,
+                all other devices if None
+        """
+        start = self.nan_graph.position[source]
+        routes = self._routes.get(start)
+        if routes is None:
+            routes = self._routes[start] = StationTree(self.nan_graph, [source])
+        if destinations is None:
+            hops = routes.hops.copy()
+        else:
+            hops, _ = _new_arrays(len(self.nan_graph))
+            chosen = np.array([self.nan_graph.position[dev] for dev in destinations],
+                              dtype=np.intp)
+            hops[chosen] = routes.hops[chosen]
+            hops[start] = 0
+        transmissions = int(hops[hops > 0].sum())
+        metrics.count('transmissions', transmissions)
+        return PropagationReport('unicast', start, hops, _times(hops, self.nan_latency),
+                                 transmissions, 0)
+
+
+def _new_arrays(count):
+    return np.full(count, -1, dtype=np.intp), np.full(count, -1, dtype=np.intp)
+
+
+def _times(hops, latency):
+    return np.where(hops >= 0, hops * latency, np.nan)
+
+
+def format_table(reports):
+    """
+    Reports as text table, one protocol per line
+    """
+    lines = [f"{'protocol':<10} {'reached':>8} {'coverage':>9} {'mean hops':>10} "
+             f"{'max hops':>9} {'max time s':>11} {'transmissions':>14} {'duplicates':>11}"]
+    for report in reports:
+        lines.append(
+            f"{report.protocol:<10} {report.reached:>8} {report.coverage:>9.3f} "
+            f"{report.mean_hops:>10.2f} {report.max_hops:>9} {report.max_time:>11.3f} "
+            f"{report.transmissions:>14} {report.duplicates:>11}"
+        )
+    return '\n'.join(lines)
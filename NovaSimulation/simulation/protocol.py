@@ -0,0 +1,646 @@
+"""
+This module contains simulation of the cluster formation protocol
+of the app: ComplexDevices publish their master ranks over NAN,
+elect masters, connect to them over sockets as clients and link
+clusters through client_server devices. Every device is a coroutine,
+messages go over in-memory channels with latency and loss.
+
+Time is virtual, VirtualClockLoop moves its clock to the next
+scheduled callback instead of sleeping, so thousands of devices
+run minutes of the protocol in seconds and runs with the same
+seed are the same.
+"""
+import asyncio
+from collections import Counter, namedtuple
+import math
+import random
+import selectors
+import time
+
+import metrics
+from device import MAX_CLIENT_COUNT, MAX_MASTER_COUNT, Cluster, ComplexDevice
+from propagation import NAN_LATENCY, SOCKET_LATENCY
+from spatial import range_csr
+
+
+# message types, named as in the app, PUBLISH is a header in NAN publish config
+PUBLISH = 'PUBLISH'
+REQUEST_SOCKET = 'REQUEST_SOCKET'
+ACCEPT_CONNECTION = 'ACCEPT_CONNECTION'
+REJECT_CONNECTION = 'REJECT_CONNECTION'
+REQUEST_CLUSTER_SOCKET = 'REQUEST_CLUSTER_SOCKET'
+ACCEPT_CLUSTER_CONNECTION = 'ACCEPT_CLUSTER_CONNECTION'
+NEW_CLUSTER_CONNECTION_ESTABLISHED = 'NEW_CLUSTER_CONNECTION_ESTABLISHED'
+CLUSTER_CONNECTION_LOST = 'CLUSTER_CONNECTION_LOST'
+# NAN reports a peer which stopped publishing, not sent by anyone
+PEER_LOST = 'PEER_LOST'
+
+# seconds, delays of the app
+DECISION_DELAY = 0.5
+SERVER_WAIT = 1.0
+MAX_SERVER_RESPONSE_TIME = 4.0
+# seconds until a lost publish is repeated in the next discovery window
+DISCOVERY_INTERVAL = 0.5
+# seconds until NAN reports a dead peer as lost
+PEER_TIMEOUT = 3.0
+# devices are switched on within this many seconds
+STARTUP = 1.0
+# a new master waits for its clients before it looks for other clusters
+CLUSTER_DELAY = 1.0
+# seconds between checks whether the protocol settled
+CHECK_INTERVAL = 0.1
+TIMEOUT = 300.0
+
+# statuses of devices which are not looking for a master
+DECIDED = ('MASTER', 'CLIENT', 'CLIENT_SERVER', 'CLIENT_SERVER_AWAITS_RECONNECT')
+
+Header = namedtuple('Header', 'phone_id master_id master_rank status is_master '
+                              'accepts_connection cluster_rank version')
+Message = namedtuple('Message', 'type sender content')
+ProtocolReport = namedtuple(
+    'ProtocolReport',
+    'phase devices converged convergence_time messages dropped by_type masters clients '
+    'client_servers undecided cluster_links backbone_components wall_seconds'
+)
+
+
+class _VirtualSelector(selectors.BaseSelector):
+    """
+    Selector which never waits, it moves the clock of its loop
+    by the timeout instead
+    """
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self):
+        self._selector.close()
+
+    def select(self, timeout=None):
+        ready = self._selector.select(0)
+        if ready or timeout == 0:
+            return ready
+        if timeout is None:
+            raise RuntimeError("nothing is scheduled, every coroutine waits forever")
+        self._loop.advance(timeout)
+        return []
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop with virtual time, asyncio.sleep and timeouts
+    take no wall time
+    """
+
+    def __init__(self):
+        self._now = 0.0
+        super().__init__(_VirtualSelector(self))
+
+    def time(self):
+        return self._now
+
+    def advance(self, seconds):
+        self._now += seconds
+
+
+class Network:
+    """
+    In-memory channels between devices in range of each other
+
+    Socket messages which are lost are gone, the sender notices
+    by timeout. Lost publishes are repeated in the next discovery
+    window, like NAN does, every repetition is counted as a message.
+
+    Args:
+        neighbours (:obj: CSRNeighbours): devices in range of every device
+        nan_latency (float): seconds per publish
+        socket_latency (float): seconds per socket message
+        jitter (float): every delay is longer by up to this part of it
+        loss (float): probability that a message is lost
+        rng (:obj: random.Random): random generator
+    """
+
+    def __init__(self, neighbours, *, nan_latency, socket_latency, jitter, loss, rng):
+        if not 0 <= loss < 1:
+            raise ValueError("loss has to be in [0, 1): %s" % loss)
+        self.neighbours = neighbours
+        self.nan_latency = nan_latency
+        self.socket_latency = socket_latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = rng
+        self.agents = []
+        self.sent = Counter()
+        self.dropped = 0
+        self.in_flight = 0
+        self.last_change = 0.0
+        self._loop = asyncio.get_event_loop()
+
+    @property
+    def time(self):
+        return self._loop.time()
+
+    def _delay(self, latency):
+        return latency * (1 + self.jitter * self.rng.random())
+
+    def _lost(self):
+        return self.loss and self.rng.random() < self.loss
+
+    def _deliver(self, delay, receiver, message):
+        self.in_flight += 1
+        self._loop.call_later(delay, self._arrive, receiver, message)
+
+    def _arrive(self, receiver, message):
+        self.in_flight -= 1
+        agent = self.agents[receiver]
+        if agent.alive:
+            agent.receive(message)
+
+    def send(self, sender, receiver, kind, content=None):
+        """
+        Sends socket message of type *kind* between devices
+        """
+        if not self.agents[sender].alive:
+            return
+        self.sent[kind] += 1
+        if self._lost():
+            self.dropped += 1
+            return
+        self._deliver(self._delay(self.socket_latency), receiver, Message(kind, sender, content))
+
+    def publish(self, sender, header):
+        """
+        Sends *header* to every device in range of *sender*
+        """
+        message = Message(PUBLISH, sender, header)
+        for receiver in self.neighbours.neighbours(sender)[0].tolist():
+            self.sent[PUBLISH] += 1
+            delay = self._delay(self.nan_latency)
+            while self._lost():
+                self.dropped += 1
+                self.sent[PUBLISH] += 1
+                delay += DISCOVERY_INTERVAL
+            self._deliver(delay, receiver, message)
+
+    def fail(self, index):
+        """
+        Switches device off, devices in range
+        lose it after PEER_TIMEOUT
+        """
+        agent = self.agents[index]
+        agent.alive = False
+        agent.device.status = 'CLOSING'
+        for receiver in self.neighbours.neighbours(index)[0].tolist():
+            self._deliver(PEER_TIMEOUT, receiver, Message(PEER_LOST, index, None))
+
+
+class Agent:
+    """
+    ComplexDevice running the protocol of the app
+
+    An undecided device waits DECISION_DELAY, then asks the best
+    master accepting connections for a socket. If there is none and
+    its rank is higher than ranks of all undecided devices in range,
+    it becomes a master, otherwise it waits for one. A master accepts
+    MAX_CLIENT_COUNT clients, later requests are rejected. Masters
+    link their clusters through a client of the other cluster, which
+    becomes client_server and accepts MAX_MASTER_COUNT masters.
+    When its master is lost a client is undecided again, when the
+    linked master is lost a client_server awaits reconnect.
+
+    Args:
+        index (int): position of the device in the network
+        network (:obj: Network): channels of the device
+        rng (:obj: random.Random): random generator of master rank
+    """
+
+    def __init__(self, index, network, rng):
+        self.index = index
+        self.network = network
+        self.device = ComplexDevice(str(index), "phone-%d" % index, _mac_address(index))
+        self.device.update_master_rank(rng)
+        self.cluster = Cluster(index)
+        self.alive = True
+        self.busy = False
+        self.master_id = None
+        self.cluster_rank = None
+        self.headers = {}
+        self.peers = {}
+        self.clients = set()
+        # foreign masters of a client_server
+        self.masters = set()
+        # gateway of every cluster linked to a master
+        self.gateways = {}
+        self._refused = {}
+        self._pending = {}
+        self._version = 0
+        self._delay_links = False
+        self._wake = asyncio.Event()
+        self._handlers = {
+            PUBLISH: self._on_publish,
+            REQUEST_SOCKET: self._on_request_socket,
+            ACCEPT_CONNECTION: self._on_reply,
+            REJECT_CONNECTION: self._on_reply,
+            REQUEST_CLUSTER_SOCKET: self._on_request_cluster_socket,
+            ACCEPT_CLUSTER_CONNECTION: self._on_reply,
+            NEW_CLUSTER_CONNECTION_ESTABLISHED: self._on_new_cluster_connection,
+            CLUSTER_CONNECTION_LOST: self._on_cluster_connection_lost,
+            PEER_LOST: self._on_peer_lost,
+        }
+
+    @property
+    def settled(self):
+        return not self.busy and self.device.status in DECIDED
+
+    def header(self):
+        return Header(self.index, self.master_id, self.device.master_rank, self.device.status,
+                      self.device.is_master, self.device.accepts_connection, self.cluster_rank,
+                      self._version)
+
+    def _publish(self):
+        self._version += 1
+        self.network.publish(self.index, self.header())
+
+    def _set_status(self, status):
+        self.device.status = status
+        self.network.last_change = self.network.time
+        self._publish()
+
+    def _send(self, receiver, kind, content=None):
+        self.network.send(self.index, receiver, kind, content)
+
+    async def _request(self, receiver, kind, content=None):
+        """
+        Sends a request and waits for the reply
+
+        Returns:
+            (:obj: Message) reply, None if there was none
+            within MAX_SERVER_RESPONSE_TIME
+        """
+        reply = self._pending[receiver] = asyncio.get_event_loop().create_future()
+        self._send(receiver, kind, content)
+        try:
+            return await asyncio.wait_for(reply, MAX_SERVER_RESPONSE_TIME)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._pending.pop(receiver, None)
+
+    async def _wait(self, timeout=None):
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, start):
+        """
+        Switches the device on after *start* seconds
+        and runs it until it fails
+        """
+        await asyncio.sleep(start)
+        self._publish()
+        while self.alive:
+            self._wake.clear()
+            if self.device.status == 'UNDECIDED':
+                await self._choose_master()
+            elif self.device.is_master:
+                await self._link_clusters()
+                await self._wake.wait()
+            else:
+                await self._wake.wait()
+
+    async def _choose_master(self):
+        await asyncio.sleep(DECISION_DELAY)
+        rejected = set()
+        while self.alive and self.device.status == 'UNDECIDED':
+            self._wake.clear()
+            servers = [header for header in self.headers.values()
+                       if header.is_master and header.accepts_connection
+                       and header.phone_id not in rejected]
+            if servers:
+                server = max(servers, key=lambda header: header.master_rank).phone_id
+                reply = await self._request(server, REQUEST_SOCKET)
+                if reply is not None and reply.type == ACCEPT_CONNECTION:
+                    self._become_client(server, reply.content)
+                    return
+                rejected.add(server)
+                continue
+            undecided = [self.peers[phone_id] for phone_id, header in self.headers.items()
+                         if header.status == 'UNDECIDED']
+            if all(self.device.select_master(peer) for peer in undecided):
+                self._become_master()
+                return
+            # a device with higher rank decides first
+            await self._wait(SERVER_WAIT)
+            rejected.clear()
+
+    def _become_master(self):
+        self.device.is_master = True
+        self.device.accepts_connection = True
+        self.master_id = self.index
+        self.cluster_rank = self.device.master_rank
+        self.cluster = Cluster(self.index)
+        # settled after it looked for other clusters
+        self.busy = self._delay_links = True
+        self._set_status('MASTER')
+
+    def _become_client(self, master, master_rank):
+        self.master_id = master
+        self.cluster_rank = master_rank
+        self.cluster = Cluster(master)
+        self._set_status('CLIENT')
+
+    async def _link_clusters(self):
+        """
+        Connects the master to clients of clusters it isn't linked to yet
+        """
+        self.busy = True
+        try:
+            if self._delay_links:
+                self._delay_links = False
+                await asyncio.sleep(CLUSTER_DELAY)
+            while self.alive:
+                candidates = [
+                    header for header in self.headers.values()
+                    if header.status in ('CLIENT', 'CLIENT_SERVER_AWAITS_RECONNECT')
+                    and header.master_id not in (None, self.index)
+                    and header.master_id not in self.gateways
+                    and self._refused.get(header.phone_id) != header.version
+                ]
+                if not candidates:
+                    return
+                gateway = max(candidates, key=lambda header: header.master_rank)
+                reply = await self._request(gateway.phone_id, REQUEST_CLUSTER_SOCKET)
+                if reply is None or reply.type != ACCEPT_CLUSTER_CONNECTION:
+                    self._refused[gateway.phone_id] = gateway.version
+                    continue
+                cluster_id, neighbour_id = reply.content
+                self.gateways[cluster_id] = gateway.phone_id
+                if self.cluster.close_neighbour_id is None:
+                    self.cluster.close_neighbour_id = cluster_id
+                    self.cluster.farther_neighbour_id = neighbour_id
+        finally:
+            self.busy = False
+
+    def receive(self, message):
+        self._handlers[message.type](message)
+
+    def _on_reply(self, message):
+        reply = self._pending.get(message.sender)
+        if reply is not None and not reply.done():
+            reply.set_result(message)
+
+    def _on_publish(self, message):
+        header = message.content
+        known = self.headers.get(header.phone_id)
+        if known is not None and known.version >= header.version:
+            # repeated publish overtaken by a newer one
+            return
+        self.headers[header.phone_id] = header
+        peer = self.peers.get(header.phone_id)
+        if peer is None:
+            peer = self.peers[header.phone_id] = ComplexDevice(
+                str(header.phone_id), "phone-%d" % header.phone_id, _mac_address(header.phone_id))
+        peer.master_rank = header.master_rank
+        peer.status = header.status
+        peer.is_master = header.is_master
+        peer.accepts_connection = header.accepts_connection
+        if header.phone_id in self.clients and header.master_id not in (None, self.index):
+            # accept was lost, the client went elsewhere
+            self._release(header.phone_id)
+        self._wake.set()
+
+    def _on_request_socket(self, message):
+        client = message.sender
+        if client not in self.clients:
+            if not (self.device.is_master and self.device.accepts_connection):
+                self._send(client, REJECT_CONNECTION, self.device.status)
+                return
+            self.clients.add(client)
+            self.device.socket_client_count += 1
+            if self.device.socket_client_count == MAX_CLIENT_COUNT:
+                self.device.accepts_connection = False
+                self._publish()
+        self._send(client, ACCEPT_CONNECTION, self.device.master_rank)
+
+    def _release(self, client):
+        self.clients.discard(client)
+        self.device.socket_client_count -= 1
+        if not self.device.accepts_connection and self.device.is_master:
+            self.device.accepts_connection = True
+            self._publish()
+
+    def _on_request_cluster_socket(self, message):
+        master = message.sender
+        if (self.device.status not in ('CLIENT', 'CLIENT_SERVER_AWAITS_RECONNECT')
+                or len(self.masters) >= MAX_MASTER_COUNT or master == self.master_id):
+            self._send(master, REJECT_CONNECTION, self.device.status)
+            return
+        self.masters.add(master)
+        self.cluster.cluster_id_to_reconnect = None
+        self.cluster.close_neighbour_id = master
+        self._send(master, ACCEPT_CLUSTER_CONNECTION, (self.master_id, self.index))
+        self._send(self.master_id, NEW_CLUSTER_CONNECTION_ESTABLISHED, master)
+        self._set_status('CLIENT_SERVER')
+
+    def _on_new_cluster_connection(self, message):
+        if self.device.is_master:
+            self.gateways.setdefault(message.content, message.sender)
+            if self.cluster.close_neighbour_id is None:
+                self.cluster.close_neighbour_id = message.content
+
+    def _on_cluster_connection_lost(self, message):
+        if self.device.is_master and self.gateways.get(message.content) == message.sender:
+            del self.gateways[message.content]
+            self._wake.set()
+
+    def _on_peer_lost(self, message):
+        lost = message.sender
+        self.headers.pop(lost, None)
+        self.peers.pop(lost, None)
+        if lost in self.clients:
+            self._release(lost)
+        if self.device.is_master:
+            for cluster_id in [key for key, gateway in self.gateways.items() if gateway == lost]:
+                del self.gateways[cluster_id]
+            self._wake.set()
+        elif lost == self.master_id:
+            self._master_lost()
+        elif lost in self.masters:
+            self.masters.discard(lost)
+            self.cluster.cluster_id_to_reconnect = lost
+            self._send(self.master_id, CLUSTER_CONNECTION_LOST, lost)
+            self._set_status('CLIENT_SERVER_AWAITS_RECONNECT')
+
+    def _master_lost(self):
+        for master in self.masters:
+            self._send(master, CLUSTER_CONNECTION_LOST, self.master_id)
+        self.masters.clear()
+        self.master_id = self.cluster_rank = None
+        self.cluster = Cluster(self.index)
+        self._set_status('UNDECIDED')
+        self._wake.set()
+
+
+def _mac_address(index):
+    return ':'.join('%02x' % byte for byte in (2, 0) + tuple(index.to_bytes(4, 'big')))
+
+
+class ClusterSimulation:
+    """
+    Cluster formation of devices at *coordinates*, devices in
+    *radius* of each other hear their publishes and can open
+    sockets
+
+    Args:
+        coordinates (array like): (n, 2) coordinates of devices
+        radius (float): range of devices
+        nan_latency (float): seconds per publish
+        socket_latency (float): seconds per socket message
+        jitter (float): every delay is longer by up to this part of it
+        loss (float): probability that a message is lost
+        seed (int): seed of ranks, delays and losses
+    """
+
+    def __init__(self, coordinates, radius, *, nan_latency=NAN_LATENCY,
+                 socket_latency=SOCKET_LATENCY, jitter=0.5, loss=0.0, seed=None):
+        self.neighbours = range_csr(coordinates, radius)
+        self.options = dict(nan_latency=nan_latency, socket_latency=socket_latency,
+                            jitter=jitter, loss=loss)
+        self.seed = seed
+        self.agents = []
+
+    def run(self, *, timeout=TIMEOUT, fail_masters=0.0):
+        """
+        Runs the protocol until every device settled, then
+        switches off *fail_masters* part of masters and runs
+        the reconnect until devices settle again
+
+        Args:
+            timeout (float): simulated seconds of every phase
+            fail_masters (float): part of masters which fail
+
+        Returns:
+            list of ProtocolReports of formation and reconnect phases,
+            no reconnect phase if *fail_masters* is 0
+        """
+        loop = VirtualClockLoop()
+        try:
+            with metrics.span('protocol'):
+                return loop.run_until_complete(self._run(timeout, fail_masters))
+        finally:
+            loop.close()
+
+    async def _run(self, timeout, fail_masters):
+        rng = random.Random(self.seed)
+        network = Network(self.neighbours, rng=rng, **self.options)
+        self.agents = network.agents = [
+            Agent(index, network, rng) for index in range(self.neighbours.node_count)
+        ]
+        tasks = [asyncio.ensure_future(agent.run(rng.uniform(0, STARTUP)))
+                 for agent in self.agents]
+        try:
+            reports = [await self._settle(network, tasks, 'formation', timeout)]
+            if fail_masters:
+                masters = [agent for agent in self.agents if agent.device.is_master]
+                for agent in rng.sample(masters, round(fail_masters * len(masters))):
+                    network.fail(agent.index)
+                reports.append(await self._settle(network, tasks, 'reconnect', timeout))
+            return reports
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _settle(self, network, tasks, phase, timeout):
+        start, wall_start = network.time, time.perf_counter()
+        network.last_change = start
+        sent, dropped = Counter(network.sent), network.dropped
+        alive = [agent for agent in self.agents if agent.alive]
+        converged = False
+        while network.time - start < timeout:
+            await asyncio.sleep(CHECK_INTERVAL)
+            for task in tasks:
+                if task.done() and not task.cancelled():
+                    # raises errors of devices
+                    task.result()
+            if network.in_flight == 0 and all(agent.settled for agent in alive):
+                converged = True
+                break
+        by_type = network.sent - sent
+        metrics.count('messages', sum(by_type.values()))
+        statuses = Counter(agent.device.status for agent in alive)
+        links = self.cluster_links()
+        masters = [agent.index for agent in alive if agent.device.is_master]
+        return ProtocolReport(
+            phase, len(alive), converged,
+            network.last_change - start if converged else math.nan,
+            sum(by_type.values()), network.dropped - dropped, dict(by_type),
+            statuses['MASTER'], statuses['CLIENT'],
+            statuses['CLIENT_SERVER'] + statuses['CLIENT_SERVER_AWAITS_RECONNECT'],
+            statuses['UNDECIDED'] + statuses['CLIENT_OUT'], len(links),
+            _component_count(masters, links), time.perf_counter() - wall_start,
+        )
+
+    def cluster_links(self):
+        """
+        Pairs of masters whose clusters are linked
+        by a client_server, both alive
+        """
+        links = set()
+        for agent in self.agents:
+            if agent.alive and agent.device.status == 'CLIENT_SERVER':
+                for master in agent.masters:
+                    if self.agents[master].alive and self.agents[agent.master_id].alive:
+                        links.add(tuple(sorted((agent.master_id, master))))
+        return sorted(links)
+
+
+def _component_count(nodes, edges):
+    parent = {node: node for node in nodes}
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    count = len(parent)
+    for u, v in edges:
+        u, v = find(u), find(v)
+        if u != v:
+            parent[u] = v
+            count -= 1
+    return count
+
+
+def format_table(reports):
+    """
+    Reports as text table, one phase of a run per line
+    """
+    lines = [f"{'devices':>8} {'phase':<10} {'converged s':>12} {'messages':>9} "
+             f"{'per device':>11} {'dropped':>8} {'masters':>8} {'clients':>8} "
+             f"{'client_servers':>15} {'undecided':>10} {'links':>6} {'backbones':>10} "
+             f"{'wall s':>7}"]
+    for report in reports:
+        lines.append(
+            f"{report.devices:>8} {report.phase:<10} {report.convergence_time:>12.2f} "
+            f"{report.messages:>9} {report.messages / max(report.devices, 1):>11.1f} "
+            f"{report.dropped:>8} {report.masters:>8} {report.clients:>8} "
+            f"{report.client_servers:>15} {report.undecided:>10} {report.cluster_links:>6} "
+            f"{report.backbone_components:>10} {report.wall_seconds:>7.2f}"
+        )
+    return '\n'.join(lines)
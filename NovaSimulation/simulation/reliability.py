@@ -0,0 +1,296 @@
+"""
+This module contains Monte Carlo failure injection: random
+masters and devices die and sensors become faulty, then
+delivery of alerts to monitoring stations is measured.
+
+Topology is built once, every trial is only a mask of alive
+devices on top of it. Reachability of all trials is computed
+at once, trials are packed as bits and a breadth-first search
+moves all of them a level at a time. Backup paths need a
+depth-first search per trial, which can run in worker processes.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import math
+import os
+
+import numpy as np
+
+
+# z of two-sided 95% confidence interval
+Z_95 = 1.959964
+
+Estimate = namedtuple('Estimate', 'mean low high')
+ReliabilityReport = namedtuple(
+    'ReliabilityReport', 'trials nan_delivery nan_backup socket_delivery socket_backup'
+)
+
+
+class FailureInjection:
+    """
+    Failure trials of one topology
+
+    Alerts are sent by every device but stations. Over the NAN
+    graph an alert is delivered if its device is alive, its sensor
+    works and a station can be reached over alive devices. Over
+    sockets a slave sends the alert to its master, which has to be
+    alive and reach a station over NAN, masters send their own.
+    A delivered alert has a backup if there is a second path to
+    a station which shares no device with the first one (stations
+    aside), for sockets the master needs such paths.
+
+    Args:
+        socket_graph (:obj: MeshGraph): socket graph, masters
+            and their slaves
+        nan_graph (:obj: MeshGraph): NAN graph of the same devices
+        stations (iterable): monitoring station devices, they never fail
+        param (str): param whose sensor can be faulty, devices already
+            having it in PatientDevice.faulty are faulty in every trial
+    """
+
+    def __init__(self, socket_graph, nan_graph, stations, *, param='spo2'):
+        self.graph = nan_graph
+        self.devices = nan_graph.devices
+        count = len(self.devices)
+        self.stations = np.array(sorted({nan_graph.position[dev] for dev in stations}),
+                                 dtype=np.intp)
+        if not len(self.stations):
+            raise ValueError("at least one station is required")
+        self.is_station = np.zeros(count, dtype=bool)
+        self.is_station[self.stations] = True
+        self.senders = np.nonzero(~self.is_station)[0]
+
+        self.is_master = np.array([dev.is_master for dev in self.devices], dtype=bool)
+        self.master_of = np.arange(count)
+        edges = socket_graph.edges
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        first_is_master = self.is_master[edges[:, 0]]
+        slaves = np.where(first_is_master, edges[:, 1], edges[:, 0])
+        self.master_of[slaves] = np.where(first_is_master, edges[:, 0], edges[:, 1])
+
+        self.broken = np.array([param in getattr(dev, 'faulty', ()) for dev in self.devices],
+                               dtype=bool)
+        self.adjacency = nan_graph.adjacency()
+        self._dfs_neighbours = None
+
+    def sample(self, trials, *, master_failure=0.1, device_failure=0.05, sensor_failure=0.05,
+               rng=None):
+        """
+        Draws failures of *trials* trials
+
+        Args:
+            trials (int): number of trials
+            master_failure (float): probability that a master dies
+            device_failure (float): probability that any device dies
+            sensor_failure (float): probability that a sensor is faulty
+            rng (:obj: numpy.random.Generator): random generator
+
+        Returns:
+            (tuple) alive devices and working sensors,
+                boolean arrays of shape (trials, devices)
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        shape = (trials, len(self.devices))
+        alive = rng.random(shape) >= device_failure
+        alive &= ~(self.is_master & (rng.random(shape) < master_failure))
+        alive[:, self.stations] = True
+        sensors = (rng.random(shape) >= sensor_failure) & ~self.broken
+        return alive, sensors
+
+    def reachable(self, alive):
+        """
+        Devices which can reach a station over alive NAN devices
+
+        Args:
+            alive (array): boolean (trials, devices) mask
+
+        Returns:
+            boolean (trials, devices) array
+        """
+        alive = np.asarray(alive, dtype=bool)
+        trials = len(alive)
+        indptr, indices = self.adjacency.indptr, self.adjacency.indices
+        # device x bytes of trial bits
+        alive_bits = np.packbits(alive, axis=0).T.copy()
+        reached = np.zeros_like(alive_bits)
+        reached[self.stations] = alive_bits[self.stations]
+        has_neighbours = np.diff(indptr) > 0
+        starts = indptr[:-1][has_neighbours]
+        while len(indices):
+            incoming = np.zeros_like(reached)
+            incoming[has_neighbours] = np.bitwise_or.reduceat(reached[indices], starts, axis=0)
+            grown = reached | (incoming & alive_bits)
+            if np.array_equal(grown, reached):
+                break
+            reached = grown
+        return np.unpackbits(reached.T, axis=0, count=trials).astype(bool)
+
+    def backup(self, alive, workers=1):
+        """
+        Devices with two paths to stations sharing no device,
+        see backup_paths
+
+        Args:
+            alive (array): boolean (trials, devices) mask
+            workers (int): number of worker processes,
+                all cores if None
+
+        Returns:
+            boolean (trials, devices) array
+        """
+        if self._dfs_neighbours is None:
+            self._dfs_neighbours = contracted_neighbours(self.adjacency, self.stations)
+        search = functools.partial(backup_paths, self._dfs_neighbours)
+        rows = np.asarray(alive, dtype=bool).tolist()
+        if workers == 1:
+            return np.array([search(row) for row in rows], dtype=bool).reshape(len(rows), -1)
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunk = max(1, len(rows) // (4 * workers))
+            return np.array(list(pool.map(search, rows, chunksize=chunk)),
+                            dtype=bool).reshape(len(rows), -1)
+
+    def run(self, trials=1000, *, seed=None, backup=True, workers=1, **failures):
+        """
+        Runs *trials* trials
+
+        Args:
+            trials (int): number of trials
+            seed (int): seed of random generator
+            backup (bool): measure backup paths, the slow part
+            workers (int): processes searching backup paths
+            failures: probabilities of failures, see sample
+
+        Returns:
+            (:obj: ReliabilityReport) Estimates of mean ratio of delivered
+                alerts and of delivered alerts with backup, backup
+                Estimates are None if *backup* is not set
+        """
+        alive, sensors = self.sample(trials, rng=np.random.default_rng(seed), **failures)
+        reached = self.reachable(alive)
+        masters = self.master_of[self.senders]
+
+        working = alive[:, self.senders] & sensors[:, self.senders]
+        nan = working & reached[:, self.senders]
+        # a slave only needs its socket to the master, the master relays over NAN
+        socket = working & reached[:, masters]
+
+        report = ReliabilityReport(
+            trials, estimate(nan.mean(axis=1)), None, estimate(socket.mean(axis=1)), None
+        )
+        if backup:
+            has_backup = self.backup(alive, workers)
+            report = report._replace(
+                nan_backup=estimate(_ratio(nan & has_backup[:, self.senders], nan)),
+                socket_backup=estimate(_ratio(socket & has_backup[:, masters], socket)),
+            )
+        return report
+
+
+def _ratio(part, whole):
+    """
+    Per trial ratio, trials with empty *whole* are skipped
+    """
+    counts = whole.sum(axis=1)
+    keep = counts > 0
+    return part.sum(axis=1)[keep] / counts[keep]
+
+
+def estimate(samples):
+    """
+    Mean of per trial ratios with its 95% confidence interval,
+    normal approximation clipped to [0, 1]
+
+    Returns:
+        (:obj: Estimate) NaN values if there are no samples
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if not len(samples):
+        return Estimate(math.nan, math.nan, math.nan)
+    mean = float(samples.mean())
+    if len(samples) < 2:
+        return Estimate(mean, math.nan, math.nan)
+    margin = Z_95 * float(samples.std(ddof=1)) / math.sqrt(len(samples))
+    return Estimate(mean, max(mean - margin, 0.0), min(mean + margin, 1.0))
+
+
+def contracted_neighbours(adjacency, stations):
+    """
+    Neighbour lists with all stations merged into one root,
+    the root is the last list, edges between stations are dropped
+
+    Args:
+        adjacency (:obj: CSRNeighbours): graph of devices
+        stations (array like): station indices
+    """
+    indptr, indices = adjacency.indptr, adjacency.indices
+    count = len(indptr) - 1
+    target = np.arange(count)
+    target[stations] = count
+    neighbours = [target[indices[indptr[i]:indptr[i + 1]]].tolist() for i in range(count)]
+    root = [other for station in np.asarray(stations).tolist()
+            for other in neighbours[station] if other != count]
+    for station in np.asarray(stations).tolist():
+        neighbours[station] = []
+    return neighbours + [root]
+
+
+def backup_paths(neighbours, alive):
+    """
+    Devices with two paths to the root sharing no device
+
+    Depth-first search from the root computes lowpoints, device v
+    is separated from the root by its parent p if no back edge
+    from the subtree of v goes above p, so v has backup paths if
+    neither p nor any device above separates it. A child of the root
+    needs a second edge from its subtree to the root.
+    Parallel edges count, so a device next to two stations
+    has two paths.
+
+    Args:
+        neighbours (list): result of contracted_neighbours
+        alive (list): booleans, dead devices are skipped
+
+    Returns:
+        list of booleans, False for the root's stations
+    """
+    root = len(neighbours) - 1
+    discovered = [-1] * len(neighbours)
+    low = [0] * len(neighbours)
+    parent = [-1] * len(neighbours)
+    parent_edge_skipped = [False] * len(neighbours)
+    discovered[root] = 0
+    order = []
+    path, edges = [root], [iter(neighbours[root])]
+    while path:
+        node = path[-1]
+        for other in edges[-1]:
+            if other != root and not alive[other]:
+                continue
+            if other == parent[node] and not parent_edge_skipped[node]:
+                parent_edge_skipped[node] = True
+                continue
+            if discovered[other] < 0:
+                discovered[other] = low[other] = len(order) + 1
+                parent[other] = node
+                order.append(other)
+                path.append(other)
+                edges.append(iter(neighbours[other]))
+                break
+            if discovered[other] < low[node]:
+                low[node] = discovered[other]
+        else:
+            path.pop()
+            edges.pop()
+            if path and low[node] < low[path[-1]]:
+                low[path[-1]] = low[node]
+
+    result = [False] * root
+    for node in order:
+        above = parent[node]
+        if above == root:
+            result[node] = low[node] == 0
+        else:
+            result[node] = result[above] and low[node] < discovered[above]
+    return result
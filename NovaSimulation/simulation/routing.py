@@ -0,0 +1,550 @@
+"""
+This module contains routing of messages between
+devices, over main and backup paths.
+"""
+from collections import defaultdict, deque
+import heapq
+import math
+
+import numpy as np
+
+import metrics
+
+
+class _LiveGraph:
+    """
+    Failures and repairs applied on top of a MeshGraph,
+    which itself is never modified
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.alive = np.ones(len(graph), dtype=bool)
+        self._adjacency = graph.adjacency()
+        self._removed_edges = set()
+        self._added_edges = defaultdict(set)
+
+    def neighbours(self, index):
+        """
+        Indices of alive devices connected to device *index*
+        """
+        if not self.alive[index]:
+            return []
+        in_range = self._adjacency.neighbours(index)[0].tolist()
+        in_range.extend(self._added_edges.get(index, ()))
+        removed = self._removed_edges
+        return [other for other in in_range
+                if self.alive[other] and (not removed or _edge(index, other) not in removed)]
+
+    def _remove_edge(self, i, j):
+        edge = _edge(i, j)
+        self._removed_edges.add(edge)
+        self._added_edges[i].discard(j)
+        self._added_edges[j].discard(i)
+
+    def _add_edge(self, i, j):
+        edge = _edge(i, j)
+        if edge in self._removed_edges:
+            self._removed_edges.discard(edge)
+        else:
+            self._added_edges[i].add(j)
+            self._added_edges[j].add(i)
+
+
+class RouteCache(_LiveGraph):
+    """
+    Main and backup routes between devices of a MeshGraph
+
+    Main and backup paths are node-disjoint (they share only
+    the source and destination) and are computed without
+    modifying the graph. Results are memoized per (source,
+    destination) pair. Failures are applied to the cache, not
+    to the graph: removing a node or an edge invalidates only
+    routes going through it. Adding an edge or restoring a node
+    can shorten any route, so it invalidates all of them.
+
+    Path lengths are counted in hops.
+
+    Args:
+        graph (:obj: MeshGraph): graph of devices
+        method (str): 'remove' - the shortest path is the main path, backup
+            is the shortest path not using any of its devices (may not be
+            found even if a disjoint pair exists), 'suurballe' - the same,
+            but if removing the shortest path leaves no backup, main and
+            backup are the disjoint pair with the least total number of
+            hops, so the main path can be longer than the shortest one
+    """
+
+    METHODS = ('suurballe', 'remove')
+
+    def __init__(self, graph, *, method='suurballe'):
+        if method not in self.METHODS:
+            raise ValueError("unknown routing method: %s" % method)
+        super().__init__(graph)
+        self.method = method
+        self.hits = self.misses = 0
+        self._routes = {}
+        self._routes_through_node = defaultdict(set)
+        self._routes_through_edge = defaultdict(set)
+
+    def __len__(self):
+        return len(self._routes)
+
+    def paths(self, source, destination):
+        """
+        Main and backup path from *source* to *destination*
+
+        Returns:
+            (tuple) main and backup path as lists of devices,
+                None in place of a path that doesn't exist
+        """
+        start, goal = self.graph.position[source], self.graph.position[destination]
+        key = (start, goal)
+        if key in self._routes:
+            self.hits += 1
+            main, backup = self._routes[key]
+        elif (goal, start) in self._routes:
+            self.hits += 1
+            main, backup = (_reversed(path) for path in self._routes[(goal, start)])
+        else:
+            self.misses += 1
+            metrics.count('paths_computed')
+            main, backup = self._compute(start, goal)
+            self._remember(key, main, backup)
+        return self._devices(main), self._devices(backup)
+
+    def _devices(self, path):
+        if path is None:
+            return None
+        return [self.graph.devices[i] for i in path]
+
+    def _compute(self, start, goal):
+        if not (self.alive[start] and self.alive[goal]):
+            return None, None
+        if start == goal:
+            return [start], None
+        main = self._bfs(start, goal)
+        if main is None:
+            return None, None
+        # a backup of a direct link must not use the same link
+        backup = self._bfs(start, goal, blocked=main[1:-1], skip_link=len(main) == 2)
+        if backup is None and self.method == 'suurballe' and len(main) > 2:
+            # the shortest path may block all disjoint pairs
+            pair = suurballe(self.neighbours, start, goal)
+            if pair[1] is not None:
+                return pair
+        return main, backup
+
+    def _bfs(self, start, goal, blocked=(), skip_link=False):
+        """
+        Shortest path avoiding *blocked* devices, a whole level at
+        once over CSR arrays unless edges were removed or added
+
+        Args:
+            skip_link (bool): don't use one edge between *start*
+                and *goal*, parallel edges can still be used
+        """
+        if self._removed_edges or any(self._added_edges.values()):
+            return self._bfs_live(start, goal, blocked, skip_link)
+        visited = ~self.alive
+        visited[list(blocked)] = True
+        visited[start] = True
+        parent = np.full(len(visited), -1, dtype=np.intp)
+        frontier = np.array([start], dtype=np.intp)
+        while len(frontier) and not visited[goal]:
+            src, dst = self._adjacency.arcs(frontier)
+            if skip_link:
+                skip_link = False
+                direct = np.flatnonzero(dst == goal)[:1]
+                src, dst = np.delete(src, direct), np.delete(dst, direct)
+            new = ~visited[dst]
+            src, dst = src[new], dst[new]
+            # first arc reaching a device wins, frontier keeps the order
+            # of discovery, so paths are the same as of a FIFO queue
+            _, first = np.unique(dst, return_index=True)
+            first.sort()
+            frontier = dst[first]
+            parent[frontier] = src[first]
+            visited[frontier] = True
+        if not visited[goal] or parent[goal] < 0:
+            return None
+        path = [goal]
+        while path[-1] != start:
+            path.append(int(parent[path[-1]]))
+        return path[::-1]
+
+    def _bfs_live(self, start, goal, blocked=(), skip_link=False):
+        parent = {start: None}
+        for index in blocked:
+            parent[index] = None
+        queue = deque([start])
+        while queue:
+            current = queue.popleft()
+            for other in self.neighbours(current):
+                if skip_link and other == goal:
+                    skip_link = False
+                    continue
+                if other not in parent:
+                    parent[other] = current
+                    if other == goal:
+                        return _walk_back(parent, goal)
+                    queue.append(other)
+        return None
+
+    def _remember(self, key, main, backup):
+        self._routes[key] = (main, backup)
+        for path in (main, backup):
+            if path is None:
+                continue
+            for index in path:
+                self._routes_through_node[index].add(key)
+            for u, v in zip(path, path[1:]):
+                self._routes_through_edge[_edge(u, v)].add(key)
+
+    def _forget(self, keys):
+        for key in list(keys):
+            self._routes.pop(key, None)
+
+    def invalidate(self):
+        """
+        Forgets all routes.
+        """
+        self._routes.clear()
+        self._routes_through_node.clear()
+        self._routes_through_edge.clear()
+
+    def remove_node(self, device):
+        """
+        Marks device as dead, routes through it are recomputed when asked for.
+        """
+        index = self.graph.position[device]
+        self.alive[index] = False
+        self._forget(self._routes_through_node.pop(index, ()))
+        # routes which had no path can't get one now, others are unaffected
+
+    def restore_node(self, device):
+        """
+        Marks device as alive again, it may shorten any route.
+        """
+        self.alive[self.graph.position[device]] = True
+        self.invalidate()
+
+    def remove_edge(self, u, v):
+        """
+        Removes connection between devices, routes using it are recomputed.
+        """
+        i, j = self.graph.position[u], self.graph.position[v]
+        self._remove_edge(i, j)
+        self._forget(self._routes_through_edge.pop(_edge(i, j), ()))
+
+    def add_edge(self, u, v):
+        """
+        Adds connection between devices, it may shorten any route.
+        """
+        self._add_edge(self.graph.position[u], self.graph.position[v])
+        self.invalidate()
+
+
+class StationTree(_LiveGraph):
+    """
+    Shortest-path tree rooted at monitoring stations
+
+    One breadth-first search from all stations at once gives every
+    device its nearest station, distance to it in hops and the next
+    device on the way, so a route is found by following parents,
+    in time proportional to its length.
+    Failures detach only the subtree below the failed device or link,
+    which is then attached back to the rest of the tree. Repairs
+    propagate shorter distances from the repaired place only.
+
+    Args:
+        graph (:obj: MeshGraph): graph of devices, socket or NAN
+        stations (iterable): monitoring station devices
+    """
+
+    def __init__(self, graph, stations):
+        super().__init__(graph)
+        self.stations = sorted({graph.position[dev] for dev in stations})
+        if not self.stations:
+            raise ValueError("at least one station is required")
+        self.hops = np.full(len(graph), -1, dtype=np.intp)
+        self.parent = np.full(len(graph), -1, dtype=np.intp)
+        self.station = np.full(len(graph), -1, dtype=np.intp)
+        self._children = defaultdict(set)
+        self._build()
+
+    def _build(self):
+        """
+        Breadth-first search over CSR adjacency, a whole level at once
+        """
+        frontier = np.array(self.stations, dtype=np.intp)
+        self.hops[frontier] = 0
+        self.station[frontier] = frontier
+        depth = 0
+        while len(frontier):
+            depth += 1
+            src, dst = self._adjacency.arcs(frontier)
+            new = self.hops[dst] < 0
+            # first device of the frontier reaching a new device becomes its parent
+            dst, first = np.unique(dst[new], return_index=True)
+            src = src[new][first]
+            self.hops[dst] = depth
+            self.parent[dst] = src
+            self.station[dst] = self.station[src]
+            frontier = dst
+        children = np.nonzero(self.parent >= 0)[0]
+        for child, parent in zip(children.tolist(), self.parent[children].tolist()):
+            self._children[parent].add(child)
+
+    def route(self, device):
+        """
+        Path from *device* to its nearest station
+
+        Returns:
+            list of Devices, first is *device*, last is the station,
+                None if no station can be reached
+        """
+        index = self.graph.position[device]
+        if self.hops[index] < 0:
+            return None
+        path = [index]
+        while self.parent[path[-1]] >= 0:
+            path.append(int(self.parent[path[-1]]))
+        return [self.graph.devices[i] for i in path]
+
+    def station_of(self, device):
+        """
+        Nearest station of *device*, None if none can be reached
+        """
+        station = self.station[self.graph.position[device]]
+        return self.graph.devices[station] if station >= 0 else None
+
+    def _attach(self, index, parent, hops):
+        old_parent = self.parent[index]
+        if old_parent >= 0:
+            self._children[int(old_parent)].discard(index)
+        self.hops[index] = hops
+        self.parent[index] = parent
+        if parent >= 0:
+            self.station[index] = self.station[parent]
+            self._children[parent].add(index)
+        else:
+            self.station[index] = index
+
+    def _detach(self, index):
+        """
+        Removes *index* and all devices routed through it from the tree
+
+        Returns:
+            list of detached devices
+        """
+        parent = self.parent[index]
+        if parent >= 0:
+            self._children[int(parent)].discard(index)
+        detached, stack = [], [index]
+        while stack:
+            current = stack.pop()
+            detached.append(current)
+            stack.extend(self._children.pop(current, ()))
+        self.hops[detached] = self.parent[detached] = self.station[detached] = -1
+        return detached
+
+    def _grow(self, candidates):
+        """
+        Attaches devices to the tree in order of distance,
+        a device is moved only if it gets closer to a station
+
+        Args:
+            candidates (list): (hops, index, parent) tuples
+        """
+        heapq.heapify(candidates)
+        while candidates:
+            hops, index, parent = heapq.heappop(candidates)
+            if 0 <= self.hops[index] <= hops:
+                continue
+            self._attach(index, parent, hops)
+            for other in self.neighbours(index):
+                if not 0 <= self.hops[other] <= hops + 1:
+                    heapq.heappush(candidates, (hops + 1, other, index))
+
+    def _reattach(self, detached):
+        candidates = []
+        for index in detached:
+            for other in self.neighbours(index):
+                if self.hops[other] >= 0:
+                    candidates.append((int(self.hops[other]) + 1, index, other))
+        self._grow(candidates)
+
+    def remove_node(self, device):
+        """
+        Marks device as dead, devices routed through it get new routes.
+        """
+        index = self.graph.position[device]
+        if not self.alive[index]:
+            return
+        self.alive[index] = False
+        self._reattach(self._detach(index)[1:])
+
+    def restore_node(self, device):
+        """
+        Marks device as alive again, devices which get closer
+        to a station through it are routed through it.
+        """
+        index = self.graph.position[device]
+        if self.alive[index]:
+            return
+        self.alive[index] = True
+        if index in self.stations:
+            self._grow([(0, index, -1)])
+        else:
+            self._grow([(int(self.hops[other]) + 1, index, other)
+                        for other in self.neighbours(index) if self.hops[other] >= 0])
+
+    def remove_edge(self, u, v):
+        """
+        Removes connection between devices, if it was a part of the tree
+        devices routed through it get new routes.
+        """
+        i, j = self.graph.position[u], self.graph.position[v]
+        self._remove_edge(i, j)
+        if self.parent[j] == i:
+            self._reattach(self._detach(j))
+        elif self.parent[i] == j:
+            self._reattach(self._detach(i))
+
+    def add_edge(self, u, v):
+        """
+        Adds connection between devices, devices which get closer
+        to a station through it are routed through it.
+        """
+        i, j = self.graph.position[u], self.graph.position[v]
+        self._add_edge(i, j)
+        if self.alive[i] and self.alive[j]:
+            self._grow([(int(self.hops[a]) + 1, b, a)
+                        for a, b in ((i, j), (j, i)) if self.hops[a] >= 0])
+
+
+def _edge(u, v):
+    return (u, v) if u < v else (v, u)
+
+
+def _reversed(path):
+    return None if path is None else path[::-1]
+
+
+def _walk_back(parent, node):
+    path = [node]
+    while parent[path[-1]] is not None:
+        path.append(parent[path[-1]])
+    return path[::-1]
+
+
+def suurballe(neighbours, start, goal):
+    """
+    Two node-disjoint paths with the least total number of hops
+
+    Every node v other than start and goal is split into
+    v_in -> v_out with capacity 1, so paths can't share nodes,
+    then two shortest augmenting paths are found with Dijkstra
+    on reduced costs (Suurballe's algorithm).
+
+    Args:
+        neighbours (callable): neighbours(index) -> list of indices
+        start (int): first node of the paths
+        goal (int): last node of the paths
+
+    Returns:
+        (tuple) shorter and longer path as lists of indices,
+            None in place of a path that doesn't exist
+    """
+    # split node ids: 2v is v_in, 2v + 1 is v_out
+    source, sink = 2 * start + 1, 2 * goal
+    flow = set()
+
+    def arcs(node):
+        v, is_out = divmod(node, 2)
+        if is_out:
+            if (2 * v, node) in flow:
+                yield 2 * v, 0
+            for other in neighbours(v):
+                if (node, 2 * other) not in flow:
+                    yield 2 * other, 1
+        else:
+            if v not in (start, goal) and (node, node + 1) not in flow:
+                yield node + 1, 0
+            for other in neighbours(v):
+                if (2 * other + 1, node) in flow:
+                    yield 2 * other + 1, -1
+
+    distance, parent = _dijkstra(arcs, source, sink)
+    if sink not in distance:
+        return None, None
+    first = _walk_back(parent, sink)
+    flow.update(zip(first, first[1:]))
+
+    # nodes the search didn't settle are at least as far as the sink,
+    # so distance of the sink is a valid potential for them
+    bound = distance[sink]
+    distance_2, parent_2 = _dijkstra(arcs, source, sink,
+                                     lambda node: distance.get(node, bound))
+    if sink not in distance_2:
+        return _unsplit(first), None
+    second = _walk_back(parent_2, sink)
+    for arc in zip(second, second[1:]):
+        reverse = arc[::-1]
+        if reverse in flow:
+            flow.discard(reverse)
+        else:
+            flow.add(arc)
+
+    successors = defaultdict(list)
+    for u, v in flow:
+        successors[u].append(v)
+    paths = []
+    for _ in range(2):
+        path = [source]
+        while path[-1] != sink:
+            path.append(successors[path[-1]].pop())
+        paths.append(_unsplit(path))
+    paths.sort(key=len)
+    return paths[0], paths[1]
+
+
+def _unsplit(path):
+    nodes = []
+    for node in path:
+        v = node // 2
+        if not nodes or nodes[-1] != v:
+            nodes.append(v)
+    return nodes
+
+
+def _dijkstra(arcs, source, sink, potential=None):
+    """
+    Dijkstra on costs reduced by *potential*, stops
+    once *sink* is settled
+
+    Returns:
+        (tuple) reduced distances of settled nodes and parents
+    """
+    tentative, parent = {source: 0}, {source: None}
+    settled = {}
+    queue = [(0, source)]
+    while queue:
+        dist, node = heapq.heappop(queue)
+        if node in settled:
+            continue
+        settled[node] = dist
+        if node == sink:
+            break
+        for other, cost in arcs(node):
+            if other in settled:
+                continue
+            if potential is not None:
+                cost += potential(node) - potential(other)
+            new_dist = dist + cost
+            if new_dist < tentative.get(other, math.inf):
+                tentative[other] = new_dist
+                parent[other] = node
+                heapq.heappush(queue, (new_dist, other))
+    return settled, parent
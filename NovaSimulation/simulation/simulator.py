@@ -3,404 +3,94 @@ Main simulation module, it is responsible
 for graph, node, edge creation
 and simulation display
 """
-import datetime
-from itertools import zip_longest
+import argparse
+import csv
 import logging
-import math
-import random
 import time
 
-import matplotlib.patches as mpatches
-import matplotlib.pyplot as plt
-import mplcursors
-import networkx as nx
 import numpy as np
 
-from device import Device, PatientDevice
-from patient import Patient
-import patient
-from distance import DistanceFile
-from geometry import get_intersection_of_two_circles, centroid
-from graph import create_nan_edges, create_socket_edges, scan_in_range, distance_map_plot
-from plot import draw_distance_map
+import device
+from device import PatientDevice
+from patient import PatientPopulation
+from measurements import MeasurementStore
+from events import EventEngine
+from engine import DEMO_PATIENT_VALUE, DEMO_STATION_VALUE, SimulationEngine, health_scenario
+from graph import build_topology, calculate_path_between, distance_map_plot
+from grid import load_grid, random_grid, save_grid
+import metrics
+from reliability import FailureInjection
+from routing import RouteCache
 
 
 LOG = logging.getLogger(__name__)
-plt.style.use('ggplot')
 
+# range of devices and how many slaves one master can have
+RADIUS = 5
+DEVICE_LIMIT = 5
 
-def generate_random_grid(width, length, device_count):
+
+def generate_random_grid(width, length, device_count, output_path='random.txt', *,
+                         sparse=False, seed=None):
     """
-    Generates 'random.txt' file with grid with
-    devices set on random locations.
+    Generates grid file with devices set on random locations.
 
-    Coordinates are generated randomly, so if you specify
-    device_count as N, it will probaly be less than N,
-    becuase duplicate coordinates might get generated.
+    Exactly device_count devices are placed, every one
+    on a different cell.
 
     Args:
         width (int): width of the grid
         length (int): length of the grid
-        device_count (int): desired amount of devices on grid
-    """
-    temp_matrix = np.zeros((width, length), dtype='i')
-
-    for i in range(0, device_count):
-        x_pos, y_pos = random.randint(0, width-1), random.randint(0, length-1)
-        temp_matrix[x_pos][y_pos] = i + 1
-
-    np.savetxt('random.txt', temp_matrix, fmt="%.1i", delimiter=',')
-
-
-class GraphVisualization:
-
-    def __init__(self, graph, grid_size, *, disable_labels=False, nan_graph=None):
-        self.graph = graph
-        self.grid_size = grid_size
-        self.pos = nx.get_node_attributes(graph, 'pos')
-        self.disable_labels = bool(disable_labels)
-        self.fig, self.ax = None, None
-        self.nan_graph = nan_graph
-
-    def create_plot(self):
-        return plt.subplots()
-
-    def subscribe_on_click(self):
-        cursor = mplcursors.cursor()
-        lookup_object_by_coords = {i.coordinates: i for i in self.graph}
-        @cursor.connect("add")
-        def _(sel):
-            coords, node_value = onlick_return_coordinates(sel, lookup_object_by_coords)
-            self.on_click(coords=coords, node_value=node_value)
-
-    def setup_plot(self):
-        self.ax.invert_yaxis()
-        self.ax.xaxis.tick_top()
-        self.ax.yaxis.tick_left()
-        self.ax.yaxis.set_ticks(np.arange(0, self.grid_size, 1))
-        self.ax.xaxis.set_ticks(np.arange(0, self.grid_size, 1))
-        plt.subplots_adjust(left=0.03, right=0.97, bottom=0.03, top=0.97)
-        plt.margins(0.03)
-        plt.grid(linestyle='--')
-
-    def _before_show(self):
-        self.fig, self.ax = self.create_plot()
-        self.setup_plot()
-        self.draw()
-        # weird but subscribe must come after draw. otherwise, doesn't work
-        self.subscribe_on_click()
-
-    def show(self):
-        self._before_show()
-        plt.show()
-
-    def animate(self, duration=10, redraws_per_second=10):
-        self._before_show()
-        interval = 1 / redraws_per_second
-        start_time = time.time()
-        for frame_no in range(duration * redraws_per_second):
-            self.redraw(
-                frame_no=frame_no,
-                elapsed_seconds=time.time() - start_time
-            )
-            plt.pause(interval)
-
-    @property
-    def default_node_size(self):
-        return 3000 / self.grid_size
-
-    def draw_edges(self, filter_fun=None, **kwargs):
-        if filter_fun:
-            if "edgelist" in kwargs:
-                raise TypeError("must not provide edgelist and filter_fun together")
-            kwargs["edgelist"] = [filter_fun(*uvdata) for uvdata in self.graph.edges(data=True)]
-        nx.draw_networkx_edges(self.graph, self.pos, ax=self.ax, **kwargs)
-
-    def draw_labels(self, **kwargs):
-        if self.disable_labels:
-            return
-        nx.draw_networkx_labels(self.graph, self.pos, ax=self.ax, **kwargs)
-
-    def draw_nodes(self, *, filter_fun=None, **kwargs):
-        if "node_size" not in kwargs:
-            kwargs["node_size"] = self.default_node_size
-        if filter_fun:
-            if "nodelist" in kwargs:
-                raise TypeError("must not provide nodelist and filter_fun together")
-            kwargs["nodelist"] = list(filter(filter_fun, self.graph))
-        nx.draw_networkx_nodes(self.graph, self.pos, ax=self.ax, **kwargs)
-
-    def on_click(self, coords, node_value):
-        pass
-
-    def draw(self):
-        pass
-
-    def redraw(self, **kwargs):
-        pass
-
-
-class MeshViz(GraphVisualization):
-    """
-    Demonstrates mesh network organization, incl. masater-slave roles of nodes.
+        device_count (int): amount of devices on grid
+        output_path (str): written file, sparse .npy if it ends with .npy
+        sparse (bool): write text file in sparse 'x,y,value' format
+        seed (int): seed of random generator
     """
+    rows, columns, values = random_grid(width, length, device_count, seed)
+    save_grid(output_path, width, length, rows, columns, values, sparse=sparse)
 
-    def draw(self):
-        self.draw_nodes(
-            filter_fun=lambda node: node.is_master,
-            node_color="r"
-        )
-        self.draw_nodes(
-            filter_fun=lambda node: not node.is_master,
-            node_color="g"
-        )
-        self.draw_labels()
-        if self.nan_graph is not None:
-            nx.draw_networkx_edges(self.nan_graph, self.pos, ax=self.ax, edge_color='y', alpha=0.7)
-        self.draw_edges(
-            edge_color='b',
-            alpha=0.7
-        )
 
-class MeasurementsViz(MeshViz):
-    """
-    Demonstrates mesh usage for monitoring health parameters of patients.
+def load_patient_devices(input_path):
     """
+    Reads grid file (dense or sparse) and creates
+    patient device for every device in it
 
-    SPO2_COLORS = [
-        (95, 100, (108, 150, 0), (0, 150, 40)),
-        (89, 95, (207, 0, 0), (219, 201, 0))
-    ]
-    
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.mutator = Mutator(self.graph)
-        self.station = self.patientDevice = None
-        for node in self.graph:
-            if node.value == 287:
-                self.patientDevice = node
-                if self.station is not None:
-                    break
-            elif node.value == 1223:
-                self.station = node
-                if self.patientDevice is not None:
-                    break
-        self.step = 1
-
-    def on_click(self, coords, node_value):
-        show_saturation_history(coords, node_value)
-
-    def spo2_to_color(self, value):
-        if value > self.SPO2_COLORS[0][1]:
-            rgb = self.SPO2_COLORS[0][3]
-        elif value < self.SPO2_COLORS[-1][0]:
-            rgb = self.SPO2_COLORS[-1][2]
-        else:
-            for minV, maxV, minColor, maxColor in self.SPO2_COLORS:
-                if minV <= value <= maxV:
-                    factor = (value - minV) / (maxV - minV)
-                    rgb = tuple(
-                        (1 - factor) * minChannel + factor * maxChannel
-                        for minChannel, maxChannel in zip(minColor, maxColor)
-                    )
-                    break
-        return tuple(channel / 255 for channel in rgb)
-
-    def __draw_nodes(self):
-        self.mutator.tick()
-        self.mutator.measure('spo2')
-        self.draw_nodes(
-            filter_fun=lambda node: node not in (self.patientDevice, self.station),
-            node_color=[
-                self.spo2_to_color(node.get_last_measurement('spo2').value)
-                for node in self.graph
-                if node not in (self.patientDevice, self.station)
-            ]
-        )
-        self.draw_nodes(
-            nodelist=[self.patientDevice],
-            node_color=[self.spo2_to_color(self.patientDevice.get_last_measurement('spo2').value)],
-            node_size=self.default_node_size * 2
-        )
-        self.draw_nodes(
-            nodelist=[self.station],
-            node_color=[(0.2, 0.2, 0.2)],
-            node_shape="s",
-            node_size=self.default_node_size * 3
-        )
+    Returns:
+        (tuple) list of PatientDevices and size of the grid
+    """
+    coordinates, values, size = load_grid(input_path)
+    return create_patient_devices(coordinates, values), size
 
-    def draw(self):
-        self.__draw_nodes()
-        self.draw_labels()
-        if self.nan_graph is not None:
-            nx.draw_networkx_edges(self.nan_graph, self.pos, ax=self.ax, edge_color='y', alpha=0.7)
-        self.draw_edges(
-            edge_color='b',
-            alpha=0.7
-        )
 
-    def redraw(self, elapsed_seconds, **kwargs):
-        if self.step == 3 and elapsed_seconds > 13:
-            #self.station.patient.condition = patient.CRITICAL
-            path_onclick_wrapper(
-                [self.patientDevice],
-                self.station,
-                self.nan_graph
-            )
-            self.step += 1
-        if self.step == 2 and elapsed_seconds > 12:
-            self.patientDevice.patient.condition = patient.CRITICAL
-            self.step += 1
-        if self.step == 1 and elapsed_seconds > 5:
-            self.patientDevice.patient.condition = patient.UNWELL
-            self.step += 1
-        self.__draw_nodes()
-
-def path_onclick_wrapper(node_collection, node_value, graph):
-    node_collection.append(node_value)
-    if len(node_collection) > 1:
-        # draw legend
-        red_patch = mpatches.Patch(color='crimson', label='Main path')
-        magenta_patch = mpatches.Patch(color='magenta', label='Backup path')
-        plt.legend(handles=[red_patch, magenta_patch], loc='upper right')
-
-        main_path, backup_path = calculate_path_between(graph, 
-                                                        node_collection[-1], 
-                                                        node_collection[-2])
-        main_graph = create_path_edges(main_path)
-        backup_graph = create_path_edges(backup_path)
-
-        draw_path(backup_graph, 'magenta')
-        draw_path(main_graph, 'crimson')
-        node_collection.clear()
-
-
-def show_saturation_history(coords, node_value):
-    # just a random date for better display (time rather than numbers)
-    start = datetime.datetime(year=2020, month=4, day=26, hour=13, minute=17)
-
-    measurements = node_value.get_measurements('spo2')
-    data = [m.value for m in measurements]
-    x_ticks = [m.timestamp for m in measurements]
-    fake_times = [start + datetime.timedelta(seconds=3 * ts) for ts in x_ticks]
-
-    fig, ax = plt.subplots()
-
-    ax.axhline(90, ls='--', color='red')
-    ax.axhline(95, ls='--', color='yellow')
-
-    ax.bar(x_ticks, data, color='royalblue', tick_label=[x.strftime("%H:%M:%S") for x in fake_times])
-    ax.set_title(f"SpO2 of patient#{node_value.patient.id} against time")
-    ax.set_ylabel("%")
-    ax.set_ylim(50, 100)
-    ax.yaxis.set_ticks(list(range(50, 110, 10)))
-    ax.xaxis.set_ticks(x_ticks)
-    plt.xticks(rotation=45)
-
-    plt.show()
-
-
-def onlick_return_coordinates(sel, lookup_object_by_coords):
-    sel_x = int(round(sel.target[0]))
-    sel_y = int(round(sel.target[1]))
-    node_value = lookup_object_by_coords[(sel_x, sel_y)]
-
-    sel.annotation.set_text(f"{node_value} \n ({sel_x}, {sel_y})")
-    sel.annotation.set_text(f"({sel_x}, {sel_y})")
-    sel.annotation.get_bbox_patch().set(fc="white")
-    sel.annotation.arrow_patch.set(arrowstyle="simple", fc="white", alpha=.5)
-
-    return(sel_x, sel_y), node_value
-
-
-def calculate_path_between(graph, node_1, node_2):
-    main_path = nx.shortest_path(graph, node_1, node_2)
-    graph.remove_nodes_from(main_path[1:-1])
-    backup_path = nx.shortest_path(graph, node_1, node_2)
-    
-    return main_path, backup_path
-
-
-def create_path_edges(path):
+@metrics.timed()
+def create_patient_devices(coordinates, values, seed=None):
     """
-    make connections between nodes
-    """
-    path_graph = nx.Graph()
-    for i, num in enumerate(path):
-        path_graph.add_node(num, pos=num.coordinates, value=num.value)
-        if i < len(path) - 1:
-            path_graph.add_edge(path[i], path[i+1])
-
-    return path_graph
+    Creates patient devices sharing one PatientPopulation
+    and one MeasurementStore
 
+    Args:
+        coordinates (array like): (k, 2) coordinates of devices
+        values (array like): k values of devices
+        seed (int): seed of patients' random walk
 
-def draw_path(graph, color):
-    """
-    draw path on given graph object
+    Returns:
+        list of PatientDevices
     """
-    pos = nx.get_node_attributes(graph, 'pos')
-    nx.draw_networkx_edges(graph, pos, graph.edges, edge_color=color, alpha=1, width=2)
-
-
-class Mutator:
-
-    def __init__(self, devices):
-        self.devices = devices
-        self.timestamp = 0
-        self.__measured = set()
-    
-    @property
-    def patient_devices(self):
-        for dev in self.devices:
-            if isinstance(dev, PatientDevice):
-                yield dev
-    
-    def tick(self):
-        """
-        Moves time forward and mutates state of all patients.
-        """
-        self.timestamp += 1
-        self.__measured.clear()
-        for dev in self.patient_devices:
-            dev.patient.tick()
-    
-    def measure(self, param):
-        """
-        Measures *param* on all patient devices.
-        """
-        if param in self.__measured:
-            return # already measured
-        for dev in self.patient_devices:
-            dev.measure(self.timestamp, param)
+    coordinates = np.asarray(coordinates).reshape(-1, 2)
+    patients = PatientPopulation(len(coordinates), seed=seed)
+    store = MeasurementStore(len(patients))
+    return [
+        PatientDevice(coords, value, patient=patients[patient_id], store=store, slot=patient_id)
+        for patient_id, (coords, value) in enumerate(zip(map(tuple, coordinates.tolist()),
+                                                         np.asarray(values).tolist()))
+    ]
 
 
 def simulation_plot(variant, input_path):
-    with open(input_path, encoding='utf8') as f:
-        matrix = np.loadtxt(f, dtype='i', delimiter=',')
-
-    radius = 5
-    device_limit = 5
-    patient_id = 0
-    
-    devices = []
-    start = time.time()
-    for i, num in enumerate(matrix.transpose()):
-        for j, num2 in enumerate(num):
-            if num2 != 0:
-                devices.append(PatientDevice((i, j), num2, patient=Patient(patient_id)))
-                patient_id += 1
-    LOG.error(f"creating device objects: {time.time() - start :.2f} s")
-
-    G = nx.Graph()
-    for i in devices:
-        G.add_node(i, pos=i.coordinates, value=i.value)
-
-    matrix_size = len(matrix)
-    nan_graph = G.copy()
-
-    scan_in_range(G, radius)
-    create_socket_edges(G, device_limit)
-    create_nan_edges(nan_graph)
+    from viz import MeasurementsViz, MeshViz
+
+    devices, matrix_size = load_patient_devices(input_path)
+    G, nan_graph = build_topology(devices, RADIUS, DEVICE_LIMIT)
     if variant == "mesh":
         MeshViz(
             G,
@@ -417,12 +107,342 @@ def simulation_plot(variant, input_path):
         ).animate(redraws_per_second=4, duration=20)
 
 
+def demo_script(devices, nan_graph):
+    """
+    Scripted changes of the health demo, alerts are routed over
+    *nan_graph*, empty if the grid has no demo patient or station
+    """
+    by_value = {dev.value: dev for dev in devices}
+    if DEMO_PATIENT_VALUE not in by_value or DEMO_STATION_VALUE not in by_value:
+        return ()
+    routes = RouteCache(nan_graph)
+    return health_scenario(
+        by_value[DEMO_PATIENT_VALUE],
+        by_value[DEMO_STATION_VALUE],
+        route=lambda source, destination: calculate_path_between(routes, destination, source)
+    )
+
+
+def simulation_run(argv):
+    """
+    Runs health simulation without display, as fast as possible,
+    *argv* are command line arguments following 'run'
+    """
+    parser = argparse.ArgumentParser(prog="simulator.py run")
+    parser.add_argument("input_path", nargs="?", default="input/input.txt")
+    parser.add_argument("--duration", type=float, default=20,
+                        help="simulated seconds (default: %(default)s)")
+    parser.add_argument("--step", type=float, default=0.25,
+                        help="simulated seconds per tick (default: %(default)s)")
+    parser.add_argument("--render-every", type=int, default=0, metavar="N",
+                        help="draw every N-th tick, 0 disables drawing (default: %(default)s)")
+    parser.add_argument("--events", action="store_true",
+                        help="use discrete-event engine, every device samples params "
+                             "at its own rate instead of every tick")
+    parser.add_argument("--metrics", choices=("text", "json"),
+                        help="print report of stage timings, counters and tick latency")
+    parser.add_argument("--metrics-output", metavar="FILE",
+                        help="write metrics report to FILE instead of printing it")
+    parser.add_argument("--profile", metavar="SPAN",
+                        help="profile span (e.g. build_topology, tick) with cProfile")
+    parser.add_argument("--profile-output", metavar="FILE",
+                        help="write pstats file of the profiled span")
+    args = parser.parse_args(argv)
+    if args.metrics or args.metrics_output or args.profile:
+        metrics.enable(profile=args.profile)
+
+    devices, matrix_size = load_patient_devices(args.input_path)
+    socket_graph, nan_graph = build_topology(devices, RADIUS, DEVICE_LIMIT)
+    script = demo_script(devices, nan_graph)
+    if args.events:
+        engine = EventEngine(devices, script=script)
+    else:
+        engine = SimulationEngine(devices, step=args.step, script=script)
+
+    if args.render_every:
+        from viz import MeasurementsViz
+
+        viz = MeasurementsViz(
+            socket_graph,
+            disable_labels=True,
+            grid_size=matrix_size,
+            nan_graph=nan_graph,
+            engine=engine
+        )
+        if args.events:
+            engine.add_observer(viz.observe, every=args.render_every * args.step)
+        else:
+            engine.add_observer(viz.observe, every=args.render_every)
+
+    stats = engine.run(args.duration)
+    if args.events:
+        print(f"simulated {stats.simulated_seconds:.1f} s ({stats.events} events) "
+              f"in {stats.wall_seconds:.2f} s: {stats.events_per_second:.1f} events/s")
+    else:
+        print(f"simulated {stats.simulated_seconds:.1f} s ({stats.ticks} ticks) "
+              f"in {stats.wall_seconds:.2f} s: {stats.ticks_per_second:.1f} ticks/s")
+    for alert in engine.alerts:
+        main_path = alert.paths[0] if alert.paths else None
+        print(f"alert at {alert.timestamp:.2f} s from {alert.source} to {alert.destination}, "
+              f"main path: {main_path}")
+
+    run_metrics = metrics.disable()
+    if run_metrics is not None:
+        if args.profile and run_metrics.profiler is None:
+            LOG.warning("span %s didn't run, nothing was profiled", args.profile)
+        elif args.profile_output:
+            run_metrics.dump_profile(args.profile_output)
+        report = run_metrics.format(args.metrics or "text")
+        if args.metrics_output:
+            with open(args.metrics_output, "w") as output:
+                output.write(report)
+        else:
+            print(report)
+
+
+def export_run(argv):
+    """
+    Runs health simulation without display and renders its frames
+    offscreen into PNG files or a video, *argv* are command line
+    arguments following 'export'
+    """
+    from export import Recorder, export
+
+    parser = argparse.ArgumentParser(prog="simulator.py export")
+    parser.add_argument("output_path",
+                        help="directory of PNG frames, or video file (.mp4, .gif, ...) "
+                             "written with ffmpeg")
+    parser.add_argument("input_path", nargs="?", default="input/input.txt")
+    parser.add_argument("--duration", type=float, default=20,
+                        help="simulated seconds (default: %(default)s)")
+    parser.add_argument("--step", type=float, default=0.25,
+                        help="simulated seconds per tick (default: %(default)s)")
+    parser.add_argument("--frame-every", type=int, default=4, metavar="N",
+                        help="render every N-th tick (default: %(default)s)")
+    parser.add_argument("--fps", type=int, default=10,
+                        help="frames per second of the video (default: %(default)s)")
+    parser.add_argument("--size", type=float, nargs=2, default=(8, 8), metavar=("WIDTH", "HEIGHT"),
+                        help="size of frames in inches (default: %(default)s)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--workers", type=int,
+                        help="number of rendering processes, 0 for all cores "
+                             "(default: number of cores)")
+    args = parser.parse_args(argv)
+
+    devices, matrix_size = load_patient_devices(args.input_path)
+    socket_graph, nan_graph = build_topology(devices, RADIUS, DEVICE_LIMIT)
+    engine = SimulationEngine(devices, step=args.step, script=demo_script(devices, nan_graph))
+    recorder = Recorder(devices)
+    engine.add_observer(recorder, every=args.frame_every)
+    stats = engine.run(args.duration)
+
+    start = time.perf_counter()
+    export(recorder.scene(socket_graph, nan_graph, matrix_size), recorder.snapshots,
+           args.output_path, fps=args.fps, workers=args.workers or None, figsize=tuple(args.size),
+           dpi=args.dpi)
+    seconds = time.perf_counter() - start
+    print(f"simulated {stats.simulated_seconds:.1f} s in {stats.wall_seconds:.2f} s, "
+          f"rendered {len(recorder.snapshots)} frames in {seconds:.2f} s "
+          f"({len(recorder.snapshots) / seconds:.1f} frames/s) to {args.output_path}")
+
+
+def sweep_run(argv):
+    """
+    Runs headless simulations for every combination of parameters
+    in parallel and prints their metrics, *argv* are command line
+    arguments following 'sweep'
+    """
+    from sweep import format_table, sweep
+
+    parser = argparse.ArgumentParser(prog="simulator.py sweep")
+    parser.add_argument("input_path", nargs="?", default="input/input.txt")
+    parser.add_argument("--radius", type=int, nargs="+", default=[RADIUS])
+    parser.add_argument("--device-limit", type=int, nargs="+", default=[DEVICE_LIMIT])
+    parser.add_argument("--max-clients", type=int, nargs="+", default=[device.MAX_CLIENT_COUNT])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--duration", type=float, default=20,
+                        help="simulated seconds of every run, 0 builds topology only "
+                             "(default: %(default)s)")
+    parser.add_argument("--step", type=float, default=0.25,
+                        help="simulated seconds per tick (default: %(default)s)")
+    parser.add_argument("--pairs", type=int, default=20,
+                        help="random pairs of devices routed in every run (default: %(default)s)")
+    parser.add_argument("--workers", type=int,
+                        help="number of processes, 0 for all cores (default: number of cores)")
+    parser.add_argument("--output", metavar="FILE", help="also write results as CSV")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = sweep(
+        args.input_path, args.radius, args.device_limit, args.max_clients, args.seeds,
+        workers=args.workers or None, duration=args.duration, step=args.step, pairs=args.pairs
+    )
+    print(format_table(results))
+    print(f"{len(results)} runs in {time.perf_counter() - start:.2f} s")
+    if args.output:
+        with open(args.output, "w", newline="") as output:
+            writer = csv.writer(output)
+            writer.writerow(results[0]._fields if results else [])
+            writer.writerows(results)
+
+
+def reliability_run(argv):
+    """
+    Injects random failures into topology of the grid many times
+    and prints how many alerts reach the monitoring station,
+    *argv* are command line arguments following 'reliability'
+    """
+    parser = argparse.ArgumentParser(prog="simulator.py reliability")
+    parser.add_argument("input_path", nargs="?", default="input/input.txt")
+    parser.add_argument("--trials", type=int, default=1000)
+    parser.add_argument("--master-failure", type=float, default=0.1,
+                        help="probability that a master dies (default: %(default)s)")
+    parser.add_argument("--device-failure", type=float, default=0.05,
+                        help="probability that any device dies (default: %(default)s)")
+    parser.add_argument("--sensor-failure", type=float, default=0.05,
+                        help="probability that a sensor is faulty (default: %(default)s)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--no-backup", action="store_true",
+                        help="don't search backup paths, much faster")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes searching backup paths, 0 for all cores (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    devices, _ = load_patient_devices(args.input_path)
+    socket_graph, nan_graph = build_topology(devices, RADIUS, DEVICE_LIMIT)
+    by_value = {dev.value: dev for dev in devices}
+    station = by_value.get(DEMO_STATION_VALUE, devices[0])
+    report = FailureInjection(socket_graph, nan_graph, [station]).run(
+        args.trials, seed=args.seed, backup=not args.no_backup, workers=args.workers or None,
+        master_failure=args.master_failure, device_failure=args.device_failure,
+        sensor_failure=args.sensor_failure
+    )
+
+    print(f"{report.trials} trials, station {station}, mean and 95% confidence interval")
+    print(f"{'graph':<8} {'delivered alerts':>28} {'delivered with backup':>28}")
+    for name, delivery, backup in (("nan", report.nan_delivery, report.nan_backup),
+                                   ("socket", report.socket_delivery, report.socket_backup)):
+        cells = [f"{e.mean:.4f} [{e.low:.4f}, {e.high:.4f}]" if e is not None else "-"
+                 for e in (delivery, backup)]
+        print(f"{name:<8} {cells[0]:>28} {cells[1]:>28}")
+
+
+def propagation_run(argv):
+    """
+    Sends one message from a device to all others with every
+    protocol and prints hops, latency and transmissions,
+    *argv* are command line arguments following 'propagate'
+    """
+    from propagation import PROTOCOLS, Propagation, format_table
+
+    parser = argparse.ArgumentParser(prog="simulator.py propagate")
+    parser.add_argument("input_path", nargs="?", default="input/input.txt")
+    parser.add_argument("--protocols", nargs="+", choices=PROTOCOLS, default=list(PROTOCOLS))
+    parser.add_argument("--source", type=int, default=DEMO_PATIENT_VALUE,
+                        help="value of the sending device, the first device "
+                             "if there is none (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    devices, _ = load_patient_devices(args.input_path)
+    socket_graph, nan_graph = build_topology(devices, RADIUS, DEVICE_LIMIT)
+    source = {dev.value: dev for dev in devices}.get(args.source, devices[0])
+    propagation = Propagation(socket_graph, nan_graph)
+    reports = []
+    for protocol in args.protocols:
+        start = time.perf_counter()
+        reports.append(propagation.run(source, protocol))
+        LOG.info("%s took %.3f s", protocol, time.perf_counter() - start)
+    print(f"message from {source} to {len(devices) - 1} devices")
+    print(format_table(reports))
+
+
+def cluster_run(argv):
+    """
+    Runs the cluster formation protocol of the app on random
+    grids of growing device counts and prints convergence time
+    and messages, *argv* are command line arguments following 'cluster'
+    """
+    from propagation import NAN_LATENCY, SOCKET_LATENCY
+    from protocol import ClusterSimulation, format_table
+
+    parser = argparse.ArgumentParser(prog="simulator.py cluster")
+    parser.add_argument("--devices", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--density", type=float, default=0.2,
+                        help="devices per grid cell (default: %(default)s)")
+    parser.add_argument("--radius", type=float, default=RADIUS)
+    parser.add_argument("--nan-latency", type=float, default=NAN_LATENCY,
+                        help="seconds per NAN publish (default: %(default)s)")
+    parser.add_argument("--socket-latency", type=float, default=SOCKET_LATENCY,
+                        help="seconds per socket message (default: %(default)s)")
+    parser.add_argument("--jitter", type=float, default=0.5,
+                        help="delays are longer by up to this part (default: %(default)s)")
+    parser.add_argument("--loss", type=float, default=0.0,
+                        help="probability that a message is lost (default: %(default)s)")
+    parser.add_argument("--fail-masters", type=float, default=0.0,
+                        help="part of masters switched off after formation, "
+                             "then reconnect is measured (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=300,
+                        help="simulated seconds of every phase (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    reports = []
+    for count in args.devices:
+        side = int(np.ceil(np.sqrt(count / args.density)))
+        rows, columns, _ = random_grid(side, side, count, args.seed)
+        simulation = ClusterSimulation(
+            np.column_stack([rows, columns]), args.radius, nan_latency=args.nan_latency,
+            socket_latency=args.socket_latency, jitter=args.jitter, loss=args.loss,
+            seed=args.seed
+        )
+        reports += simulation.run(timeout=args.timeout, fail_masters=args.fail_masters)
+    print(format_table(reports))
+
+
+def grid_generate(argv):
+    """
+    Generates random grid file, *argv* are command line
+    arguments following 'gengrid'
+    """
+    parser = argparse.ArgumentParser(prog="simulator.py gengrid")
+    parser.add_argument("output_path", nargs="?", default="random.txt",
+                        help="sparse if it ends with .npy (default: %(default)s)")
+    parser.add_argument("--size", type=int, nargs=2, default=(100, 100), metavar=("WIDTH", "LENGTH"))
+    parser.add_argument("--devices", type=int, default=2000,
+                        help="number of devices (default: %(default)s)")
+    parser.add_argument("--sparse", action="store_true",
+                        help="write 'x,y,value' lines instead of dense matrix")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    generate_random_grid(*args.size, args.devices, args.output_path,
+                         sparse=args.sparse, seed=args.seed)
+
+
 if __name__ == "__main__":
     import sys
     USAGE = (
-        "usage: python simulator.py {gengrid|distplot|help}\n"
+        "usage: python simulator.py help\n"
+        "   or: python simulator.py gengrid [OUTPUT_FILE] [--size W L] [--devices N] [--sparse] [--seed S]\n"
+        "   or: python simulator.py distplot [legacy|lstsq]\n"
         "   or: python simulator.py simplot mesh [INPUT_FILE]\n"
-        "   or: python simulator.py simplot health [INPUT_FILE]"
+        "   or: python simulator.py simplot health [INPUT_FILE]\n"
+        "   or: python simulator.py run [INPUT_FILE] [--duration S] [--step S] [--render-every N] [--events]\n"
+        "                               [--metrics text|json] [--metrics-output FILE]\n"
+        "                               [--profile SPAN] [--profile-output FILE]\n"
+        "   or: python simulator.py export OUTPUT [INPUT_FILE] [--duration S] [--step S]\n"
+        "                                  [--frame-every N] [--fps N] [--size W H] [--dpi N]\n"
+        "                                  [--workers N]\n"
+        "   or: python simulator.py sweep [INPUT_FILE] [--radius R ...] [--device-limit N ...]\n"
+        "                                 [--max-clients N ...] [--seeds S ...] [--duration S]\n"
+        "                                 [--pairs N] [--workers N] [--output FILE]\n"
+        "   or: python simulator.py propagate [INPUT_FILE] [--protocols flood|tree|unicast ...]\n"
+        "                                     [--source VALUE]\n"
+        "   or: python simulator.py cluster [--devices N ...] [--density D] [--radius R] [--loss P]\n"
+        "                                   [--nan-latency S] [--socket-latency S] [--jitter J]\n"
+        "                                   [--fail-masters F] [--timeout S] [--seed S]\n"
+        "   or: python simulator.py reliability [INPUT_FILE] [--trials N] [--master-failure P]\n"
+        "                                       [--device-failure P] [--sensor-failure P] [--seed S]\n"
+        "                                       [--no-backup] [--workers N]"
     )
     if len(sys.argv) <= 1 or sys.argv[0] in ("-h", "help", "--help"):
         print(USAGE)
@@ -439,10 +459,25 @@ if __name__ == "__main__":
         else:
             input_path = "input/input.txt"
         simulation_plot(variant, input_path)
+    elif cmd == "run":
+        simulation_run(sys.argv[2:])
+    elif cmd == "export":
+        export_run(sys.argv[2:])
+    elif cmd == "propagate":
+        propagation_run(sys.argv[2:])
+    elif cmd == "cluster":
+        cluster_run(sys.argv[2:])
+    elif cmd == "reliability":
+        reliability_run(sys.argv[2:])
+    elif cmd == "sweep":
+        sweep_run(sys.argv[2:])
     elif cmd == "gengrid":
-        generate_random_grid(100, 100, 2000)
+        grid_generate(sys.argv[2:])
     elif cmd == "distplot":
-        distance_graph = distance_map_plot()
+        solver = sys.argv[2] if len(sys.argv) > 2 else "legacy"
+        if solver not in ("legacy", "lstsq"):
+            sys.exit(f"unknown solver: {solver}\n{USAGE}")
+        distance_graph = distance_map_plot(solver)
         # draw_distance_map(distance_graph)
     else:
         sys.exit(f"unknown command: {cmd}\n{USAGE}")
@@ -0,0 +1,166 @@
+"""
+This module contains spatial structures used
+to find devices that are in range of each other
+without comparing every pair of devices.
+"""
+from collections import defaultdict, namedtuple
+import math
+
+import numpy as np
+
+
+class GridIndex:
+    """
+    Uniform grid of buckets built once from device coordinates.
+
+    Every coordinate is put into a square cell of side *cell_size*,
+    so a range query with radius <= cell_size only has to look
+    at the 3x3 block of cells around the queried point.
+
+    Args:
+        coordinates (list of tuples): [(x, y), ...] coordinates,
+            position on the list is the index returned by queries
+        cell_size (float): side of a single bucket, usually radius
+    """
+
+    def __init__(self, coordinates, cell_size):
+        if cell_size <= 0:
+            raise ValueError("cell size must be positive, got: %s" % cell_size)
+        self.coordinates = list(coordinates)
+        self.cell_size = cell_size
+        self.buckets = defaultdict(list)
+        for index, coords in enumerate(self.coordinates):
+            self.buckets[self.cell_of(coords)].append(index)
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def cell_of(self, coords):
+        return (math.floor(coords[0] / self.cell_size),
+                math.floor(coords[1] / self.cell_size))
+
+    def query(self, coords, radius):
+        """
+        Finds all indexed points within *radius* of *coords*
+
+        Args:
+            coords (tuple): (x, y) queried point
+            radius (float): maximum distance, inclusive
+
+        Returns:
+            list of tuples: [(index, distance), ...] sorted by index
+        """
+        reach = math.ceil(radius / self.cell_size)
+        cell_x, cell_y = self.cell_of(coords)
+
+        candidates = []
+        for i in range(cell_x - reach, cell_x + reach + 1):
+            for j in range(cell_y - reach, cell_y + reach + 1):
+                candidates.extend(self.buckets.get((i, j), ()))
+        candidates.sort()
+
+        found = []
+        for index in candidates:
+            distance = math.dist(coords, self.coordinates[index])
+            if distance <= radius:
+                found.append((index, distance))
+        return found
+
+    def neighbours(self, index, radius):
+        """
+        Same as query, but for an indexed point,
+        point itself and points sharing its coordinates are skipped
+        """
+        coords = self.coordinates[index]
+        return [(other, distance) for other, distance in self.query(coords, radius)
+                if self.coordinates[other] != coords]
+
+
+class CSRNeighbours(namedtuple('CSRNeighbours', 'indptr indices distances')):
+    """
+    Neighbours of every device in compressed sparse row form
+
+    Neighbours of device i are indices[indptr[i]:indptr[i + 1]]
+    with matching distances, sorted by distance, ties by index.
+    """
+    __slots__ = ()
+
+    @property
+    def node_count(self):
+        return len(self.indptr) - 1
+
+    def neighbours(self, index):
+        """
+        Returns:
+            (tuple) arrays of neighbour indices and their distances
+        """
+        start, stop = self.indptr[index], self.indptr[index + 1]
+        return self.indices[start:stop], self.distances[start:stop]
+
+    def arcs(self, nodes):
+        """
+        All arcs leaving *nodes* at once
+
+        Args:
+            nodes (array): device indices
+
+        Returns:
+            (tuple) arrays of source and destination of every arc
+        """
+        starts = self.indptr[nodes]
+        counts = self.indptr[np.asarray(nodes) + 1] - starts
+        src = np.repeat(nodes, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return src, self.indices[np.repeat(starts, counts) + offsets]
+
+
+def range_csr(coordinates, radius, tile_size=1024):
+    """
+    Finds all pairs of points within *radius* of each other
+
+    Points are sorted by x, split into tiles of *tile_size* points
+    and distances are computed only between tiles whose x ranges
+    are closer than radius, so memory stays bounded by tile_size**2
+    no matter how many points there are.
+    Pairs of points sharing coordinates are skipped.
+
+    Args:
+        coordinates (array like): (n, 2) coordinates
+        radius (float): maximum distance, inclusive
+        tile_size (int): number of points compared at once
+
+    Returns:
+        (CSRNeighbours) neighbours of every point
+    """
+    coords = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+    count = len(coords)
+    order = np.argsort(coords[:, 0], kind='stable')
+    sorted_coords = coords[order]
+    sorted_x = sorted_coords[:, 0]
+
+    rows, cols, dists = [], [], []
+    for row_start in range(0, count, tile_size):
+        row_block = sorted_coords[row_start:row_start + tile_size]
+        col_start = np.searchsorted(sorted_x, row_block[0, 0] - radius, side='left')
+        col_stop = np.searchsorted(sorted_x, row_block[-1, 0] + radius, side='right')
+
+        for tile_start in range(col_start, col_stop, tile_size):
+            col_block = sorted_coords[tile_start:min(tile_start + tile_size, col_stop)]
+            delta_x = row_block[:, 0, None] - col_block[None, :, 0]
+            delta_y = row_block[:, 1, None] - col_block[None, :, 1]
+            distance = np.sqrt(delta_x * delta_x + delta_y * delta_y)
+            row, col = np.nonzero((distance <= radius) & (distance > 0))
+            rows.append(order[row + row_start])
+            cols.append(order[col + tile_start])
+            dists.append(distance[row, col])
+
+    if rows:
+        rows, cols, dists = np.concatenate(rows), np.concatenate(cols), np.concatenate(dists)
+    else:
+        rows = cols = np.empty(0, dtype=np.intp)
+        dists = np.empty(0, dtype=np.float64)
+
+    by_distance = np.lexsort((cols, dists, rows))
+    indptr = np.zeros(count + 1, dtype=np.intp)
+    np.cumsum(np.bincount(rows, minlength=count), out=indptr[1:])
+    return CSRNeighbours(indptr, cols[by_distance], dists[by_distance])
@@ -0,0 +1,166 @@
+"""
+This module contains parameter sweeps: headless topology
+and health simulations run for every combination of
+parameters and seeds, in parallel on a process pool.
+
+Every worker process reads the input grid once, runs
+are independent, so results don't depend on the number
+of workers or the order in which runs finish.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import itertools
+import random
+import time
+
+import numpy as np
+
+from engine import DEMO_PATIENT_VALUE, DEMO_STATION_VALUE, SimulationEngine, health_scenario
+from graph import build_topology, calculate_path_between
+from grid import load_grid
+from routing import RouteCache, StationTree
+from simulator import create_patient_devices
+
+
+SweepParams = namedtuple('SweepParams', 'radius device_limit max_clients seed')
+SweepResult = namedtuple('SweepResult', [
+    'radius', 'device_limit', 'max_clients', 'seed',
+    'masters', 'clusters', 'over_limit', 'components', 'unreachable',
+    'mean_hops', 'max_hops', 'mean_path', 'mean_backup', 'backup_ratio',
+    'alerts', 'seconds',
+])
+
+# format of columns of the printed table
+COLUMN_FORMATS = {
+    'mean_hops': '.2f', 'mean_path': '.2f', 'mean_backup': '.2f',
+    'backup_ratio': '.2f', 'seconds': '.3f',
+}
+
+# grid of the worker process: coordinates and values of devices
+_grid = None
+
+
+def _load(input_path):
+    global _grid
+    coordinates, values, _ = load_grid(input_path)
+    _grid = coordinates, values
+
+
+def run_once(params, *, duration=20, step=0.25, pairs=20,
+             station_value=DEMO_STATION_VALUE, patient_value=DEMO_PATIENT_VALUE):
+    """
+    Builds topology of the worker's grid with *params*
+    and runs health simulation on it
+
+    Hops to the station and paths between *pairs* random devices
+    are measured on the NAN graph, where messages are sent.
+    Masters serving more slaves than *max_clients* are counted as
+    over limit, real devices couldn't keep that many sockets.
+
+    Args:
+        params (:obj: SweepParams): parameters of the run
+        duration (float): simulated seconds, 0 skips the simulation
+        step (float): simulated seconds per tick
+        pairs (int): number of random pairs of devices routed
+        station_value (int): value of monitoring station device,
+            the first device is used if there is no such device
+        patient_value (int): value of the device sending the alert,
+            no alert is sent if there is no such device
+
+    Returns:
+        (:obj: SweepResult) metrics of the run
+    """
+    coordinates, values = _grid
+    start = time.perf_counter()
+    devices = create_patient_devices(coordinates, values, seed=params.seed)
+    socket_graph, nan_graph = build_topology(devices, params.radius, params.device_limit)
+
+    masters = [i for i, dev in enumerate(devices) if dev.is_master]
+    slaves = socket_graph.degree()[masters]
+
+    by_value = {dev.value: dev for dev in devices}
+    station = by_value.get(station_value, devices[0])
+    hops = StationTree(nan_graph, [station]).hops
+    reachable = hops[hops >= 0]
+
+    routes = RouteCache(nan_graph)
+    rng = random.Random(params.seed)
+    main_lengths, backup_lengths = [], []
+    for _ in range(pairs if len(devices) > 1 else 0):
+        main, backup = routes.paths(*rng.sample(devices, 2))
+        if main is not None:
+            main_lengths.append(len(main) - 1)
+        if backup is not None:
+            backup_lengths.append(len(backup) - 1)
+
+    alerts = 0
+    if duration > 0:
+        patient_device = by_value.get(patient_value)
+        script = ()
+        if patient_device is not None:
+            script = health_scenario(
+                patient_device, station,
+                route=lambda source, destination: calculate_path_between(routes, destination, source)
+            )
+        engine = SimulationEngine(devices, step=step, script=script)
+        engine.run(duration)
+        alerts = len(engine.alerts)
+
+    return SweepResult(
+        *params,
+        masters=len(masters),
+        clusters=len(np.unique(socket_graph.components())),
+        over_limit=int((slaves > params.max_clients).sum()),
+        components=len(np.unique(nan_graph.components())),
+        unreachable=int((hops < 0).sum()),
+        mean_hops=float(reachable.mean()),
+        max_hops=int(reachable.max()),
+        mean_path=float(np.mean(main_lengths)) if main_lengths else float('nan'),
+        mean_backup=float(np.mean(backup_lengths)) if backup_lengths else float('nan'),
+        backup_ratio=len(backup_lengths) / pairs if pairs else float('nan'),
+        alerts=alerts,
+        seconds=time.perf_counter() - start,
+    )
+
+
+def sweep(input_path, radii, device_limits, max_clients, seeds, *, workers=None, **options):
+    """
+    Runs run_once for every combination of parameters and seeds
+
+    Args:
+        input_path (str): grid file, read once by every worker
+        radii (iterable): ranges of devices
+        device_limits (iterable): how many slaves one master can have
+        max_clients (iterable): socket clients a real device can keep
+        seeds (iterable): seeds of patients and routed pairs
+        workers (int): number of worker processes, all cores if None,
+            1 runs everything in this process
+        options: keyword arguments of run_once
+
+    Returns:
+        list of SweepResults in order of combinations
+    """
+    runs = [SweepParams(*combination) for combination in
+            itertools.product(radii, device_limits, max_clients, seeds)]
+    run = functools.partial(run_once, **options)
+    if workers == 1:
+        _load(input_path)
+        return [run(params) for params in runs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load,
+                             initargs=(input_path,)) as pool:
+        return list(pool.map(run, runs))
+
+
+def format_table(results):
+    """
+    Results as text table, one run per line
+    """
+    widths = {field: max(len(field), 8) for field in SweepResult._fields}
+    lines = [' '.join(f"{field:>{widths[field]}}" for field in SweepResult._fields)]
+    for result in results:
+        lines.append(' '.join(
+            f"{value:>{widths[field]}{COLUMN_FORMATS.get(field, '')}}"
+            for field, value in zip(SweepResult._fields, result)
+        ))
+    return '\n'.join(lines)
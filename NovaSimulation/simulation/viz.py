@@ -0,0 +1,666 @@
+"""
+This module contains interactive visualizations
+of the simulation, it is imported only when
+something is displayed
+"""
+import datetime
+import time
+
+from matplotlib.collections import LineCollection
+import matplotlib.colors
+from matplotlib.image import AxesImage
+import matplotlib.patches as mpatches
+import matplotlib.pyplot as plt
+import mplcursors
+import networkx as nx
+import numpy as np
+
+from engine import DEMO_PATIENT_VALUE, DEMO_STATION_VALUE, Mutator
+from graph import calculate_path_between
+from meshgraph import MeshGraph
+import metrics
+import patient
+from routing import RouteCache
+
+
+plt.style.use('ggplot')
+
+# grids bigger than this get automatic ticks instead of one per cell
+MAX_CELL_TICKS = 100
+# more edges in view are decimated or shaded, see EdgeLayer
+MAX_DRAWN_EDGES = 20000
+DENSITY_BINS = 200
+# keys toggling edge layers
+LAYER_KEYS = {'1': 'socket', '2': 'nan'}
+
+
+class _EdgeCollection(LineCollection):
+    """
+    LineCollection which lets its EdgeLayer choose segments
+    for the current view right before it's drawn
+    """
+
+    def __init__(self, layer, **style):
+        super().__init__([], **style)
+        self.layer = layer
+
+    def draw(self, renderer):
+        self.layer.update()
+        super().draw(renderer)
+
+
+class EdgeLayer:
+    """
+    All edges of a graph drawn as one LineCollection
+
+    Segments are cut from coordinate and edge arrays only when
+    the layer is first shown, so a hidden layer costs nothing.
+    Level of detail: if more than *max_edges* edges are in view,
+    a random subset of them is drawn ('decimate') or their density
+    is shaded as an image ('density'), zooming in brings
+    all edges back. Edges are chosen when the collection is drawn
+    and the view has changed since the last time.
+
+    Args:
+        ax (:obj: Axes): axes to draw on
+        coordinates (array like): (n, 2) coordinates of devices
+        edges (array like): (k, 2) device indices of edges
+        visible (bool): show the layer right away
+        max_edges (int): most edges drawn at once
+        lod (str): 'decimate' or 'density'
+        style: LineCollection arguments, e.g. colors, alpha
+    """
+
+    def __init__(self, ax, coordinates, edges, *, visible=True, max_edges=MAX_DRAWN_EDGES,
+                 lod='decimate', **style):
+        if lod not in ('decimate', 'density'):
+            raise ValueError("unknown level of detail: %s" % lod)
+        self.ax = ax
+        self.coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        self.edges = np.asarray(edges, dtype=np.intp).reshape(-1, 2)
+        self.max_edges = max_edges
+        self.lod = lod
+        self.style = style
+        self.visible = False
+        self.collection = self.density = None
+        self.segments = self._midpoints = self._order = None
+        self._view = None
+        if visible:
+            self.show()
+
+    def _build(self):
+        self.segments = self.coordinates[self.edges]
+        self._midpoints = self.segments.mean(axis=1)
+        # fixed order, so decimation keeps the same edges while panning
+        self._order = np.random.default_rng(0).permutation(len(self.edges))
+        self._margin = float(np.abs(self.segments[:, 0] - self.segments[:, 1]).max(initial=0))
+        self.collection = _EdgeCollection(self, **{'zorder': 1, **self.style})
+        self.ax.add_collection(self.collection, autolim=False)
+        if len(self.segments):
+            self.ax.update_datalim(self.segments.reshape(-1, 2))
+            self.ax.autoscale_view()
+        if self.lod == 'density':
+            # drawn after the collection, which updates it,
+            # added without imshow, which would change limits of the axes
+            self.density = AxesImage(self.ax, origin='lower', interpolation='nearest',
+                                     zorder=1.5, visible=False)
+            self.density.set_data(np.zeros((1, 1, 4)))
+            self.ax.add_image(self.density)
+
+    def show(self):
+        if self.collection is None:
+            self._build()
+        self.visible = True
+        self.collection.set_visible(True)
+
+    def hide(self):
+        self.visible = False
+        if self.collection is not None:
+            self.collection.set_visible(False)
+        if self.density is not None:
+            self.density.set_visible(False)
+
+    def toggle(self):
+        if self.visible:
+            self.hide()
+        else:
+            self.show()
+
+    def in_view(self):
+        """
+        Indices of edges with midpoints in the current view,
+        in the fixed random order
+        """
+        (x0, x1), (y0, y1) = self._view
+        x, y = self._midpoints[self._order].T
+        margin = self._margin / 2
+        inside = (x >= x0 - margin) & (x <= x1 + margin) & (y >= y0 - margin) & (y <= y1 + margin)
+        return self._order[inside]
+
+    def update(self):
+        """
+        Chooses edges drawn in the current view, if it has changed
+        """
+        view = tuple(sorted(self.ax.get_xlim())), tuple(sorted(self.ax.get_ylim()))
+        if not self.visible or view == self._view:
+            return
+        self._view = view
+        shown = self.in_view()
+        if self.lod == 'density' and len(shown) > self.max_edges:
+            self._shade(shown)
+            shown = shown[:0]
+        elif self.density is not None:
+            self.density.set_visible(False)
+        self.collection.set_segments(self.segments[shown[:self.max_edges]])
+
+    def _shade(self, shown):
+        (x0, x1), (y0, y1) = self._view
+        x, y = self._midpoints[shown].T
+        counts, _, _ = np.histogram2d(x, y, bins=DENSITY_BINS, range=((x0, x1), (y0, y1)))
+        image = np.zeros(counts.T.shape + (4,))
+        image[..., :3] = matplotlib.colors.to_rgb(self.style.get('colors', 'k'))
+        image[..., 3] = self.style.get('alpha', 1) * counts.T / max(counts.max(), 1)
+        self.density.set_data(image)
+        self.density.set_extent((x0, x1, y0, y1))
+        self.density.set_visible(True)
+
+
+def edge_arrays(graph):
+    """
+    Coordinates of devices and edges as device indices,
+    self loops are skipped
+
+    Args:
+        graph (:obj:) - MeshGraph or networkx graph with 'pos' attributes
+
+    Returns:
+        (tuple) (n, 2) coordinates and (k, 2) edges
+    """
+    if isinstance(graph, MeshGraph):
+        coordinates, edges = graph.coordinates(), graph.edges
+    else:
+        position = {node: i for i, node in enumerate(graph)}
+        coordinates = np.array([pos for _, pos in graph.nodes(data='pos')], dtype=np.float64)
+        edges = np.array([(position[u], position[v]) for u, v in graph.edges()], dtype=np.intp)
+    edges = edges.reshape(-1, 2)
+    return coordinates, edges[edges[:, 0] != edges[:, 1]]
+
+
+class GraphVisualization:
+
+    def __init__(self, graph, grid_size, *, disable_labels=False, nan_graph=None, hidden_layers=()):
+        # MeshGraphs are kept for routing and edge arrays,
+        # networkx graph of sockets is needed for drawing nodes
+        self.mesh = graph if isinstance(graph, MeshGraph) else None
+        self.nan_mesh = nan_graph if isinstance(nan_graph, MeshGraph) else None
+        self.graph = graph.to_networkx() if self.mesh is not None else graph
+        self.grid_size = grid_size
+        self.pos = nx.get_node_attributes(self.graph, 'pos')
+        self.disable_labels = bool(disable_labels)
+        self.fig, self.ax = None, None
+        self._nan_graph = nan_graph
+        self.routes = RouteCache(self.nan_mesh) if self.nan_mesh is not None else None
+        self.hidden_layers = set(hidden_layers)
+        self.layers = {}
+
+    @property
+    def nan_graph(self):
+        """
+        networkx graph of NAN edges, built when first used
+        """
+        if self.nan_mesh is not None:
+            return self.nan_mesh.to_networkx()
+        return self._nan_graph
+
+    def create_plot(self):
+        return plt.subplots()
+
+    def subscribe_on_click(self):
+        cursor = mplcursors.cursor()
+        lookup_object_by_coords = {i.coordinates: i for i in self.graph}
+        @cursor.connect("add")
+        def _(sel):
+            coords, node_value = onlick_return_coordinates(sel, lookup_object_by_coords)
+            self.on_click(coords=coords, node_value=node_value)
+
+    def setup_plot(self):
+        self.ax.invert_yaxis()
+        self.ax.xaxis.tick_top()
+        self.ax.yaxis.tick_left()
+        if self.grid_size <= MAX_CELL_TICKS:
+            self.ax.yaxis.set_ticks(np.arange(0, self.grid_size, 1))
+            self.ax.xaxis.set_ticks(np.arange(0, self.grid_size, 1))
+        self.fig.subplots_adjust(left=0.03, right=0.97, bottom=0.03, top=0.97)
+        self.ax.margins(0.03)
+        self.ax.grid(linestyle='--')
+
+    def _before_show(self):
+        self.fig, self.ax = self.create_plot()
+        self.setup_plot()
+        self.draw()
+        # weird but subscribe must come after draw. otherwise, doesn't work
+        self.subscribe_on_click()
+        self.fig.canvas.mpl_connect('key_press_event', self._on_key)
+
+    def _on_key(self, event):
+        layer = self.layers.get(LAYER_KEYS.get(event.key))
+        if layer is not None:
+            layer.toggle()
+            self.fig.canvas.draw_idle()
+
+    def show(self):
+        self._before_show()
+        plt.show()
+
+    def animate(self, duration=10, redraws_per_second=10):
+        self._before_show()
+        interval = 1 / redraws_per_second
+        start_time = time.time()
+        for frame_no in range(duration * redraws_per_second):
+            with metrics.span('frame', histogram=True):
+                self.redraw(
+                    frame_no=frame_no,
+                    elapsed_seconds=time.time() - start_time
+                )
+                self.refresh()
+            plt.pause(interval)
+
+    def refresh(self):
+        """
+        Shows changes of the last redraw
+        """
+        self.fig.canvas.draw_idle()
+
+    @property
+    def default_node_size(self):
+        return 3000 / self.grid_size
+
+    def draw_edges(self, mask=None, *, graph=None, layer='socket', **kwargs):
+        """
+        Draws edges of *graph* (socket graph by default) as one EdgeLayer
+
+        Args:
+            mask: boolean array over edges, or function taking (k, 2)
+                array of edges as device indices and returning one
+            graph (:obj:) - MeshGraph or networkx graph
+            layer (str): name of the layer, layers in hidden_layers
+                are not drawn until they are toggled
+            kwargs: EdgeLayer arguments, e.g. colors, alpha, lod
+
+        Returns:
+            (:obj: EdgeLayer)
+        """
+        if graph is None:
+            graph = self.mesh if self.mesh is not None else self.graph
+        coordinates, edges = edge_arrays(graph)
+        if mask is not None:
+            edges = edges[mask(edges) if callable(mask) else np.asarray(mask, dtype=bool)]
+        self.layers[layer] = EdgeLayer(self.ax, coordinates, edges,
+                                       visible=layer not in self.hidden_layers, **kwargs)
+        return self.layers[layer]
+
+    def draw_labels(self, **kwargs):
+        if self.disable_labels:
+            return
+        nx.draw_networkx_labels(self.graph, self.pos, ax=self.ax, **kwargs)
+
+    def draw_nodes(self, *, filter_fun=None, **kwargs):
+        if "node_size" not in kwargs:
+            kwargs["node_size"] = self.default_node_size
+        if filter_fun:
+            if "nodelist" in kwargs:
+                raise TypeError("must not provide nodelist and filter_fun together")
+            kwargs["nodelist"] = list(filter(filter_fun, self.graph))
+        nx.draw_networkx_nodes(self.graph, self.pos, ax=self.ax, **kwargs)
+
+    def on_click(self, coords, node_value):
+        pass
+
+    def draw(self):
+        pass
+
+    def redraw(self, **kwargs):
+        pass
+
+
+class MeshViz(GraphVisualization):
+    """
+    Demonstrates mesh network organization, incl. masater-slave roles of nodes.
+    """
+
+    def draw(self):
+        self.draw_nodes(
+            filter_fun=lambda node: node.is_master,
+            node_color="r"
+        )
+        self.draw_nodes(
+            filter_fun=lambda node: not node.is_master,
+            node_color="g"
+        )
+        self.draw_labels()
+        self.draw_layers()
+
+    def draw_layers(self):
+        if self._nan_graph is not None:
+            self.draw_edges(graph=self._nan_graph, layer='nan', colors='y', alpha=0.7)
+        self.draw_edges(colors='b', alpha=0.7)
+
+class MeasurementsViz(MeshViz):
+    """
+    Demonstrates mesh usage for monitoring health parameters of patients.
+    """
+
+    SPO2_COLORS = [
+        (95, 100, (108, 150, 0), (0, 150, 40)),
+        (89, 95, (207, 0, 0), (219, 201, 0))
+    ]
+    # colours of SpO2 values 0..SPO2_MAX are precomputed
+    SPO2_MAX = 100
+    # colour of nodes without SpO2 measurements
+    NO_DATA_COLOR = (0.8, 0.8, 0.8)
+
+    def __init__(self, *args, engine=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # with an engine, time is moved by the engine and this is only its observer
+        self.engine = engine
+        self.mutator = Mutator(self.graph) if engine is None else None
+        self.station = self.patientDevice = None
+        for node in self.graph:
+            if node.value == DEMO_PATIENT_VALUE:
+                self.patientDevice = node
+                if self.station is not None:
+                    break
+            elif node.value == DEMO_STATION_VALUE:
+                self.station = node
+                if self.patientDevice is not None:
+                    break
+        self.step = 1
+        self.drawn_alerts = 0
+
+        self.spo2_colors = np.array([self.spo2_to_color(value)
+                                     for value in range(self.SPO2_MAX + 1)])
+        # patient's node is coloured too, it's the last one
+        self._colored = [node for node in self.graph
+                         if node not in (self.patientDevice, self.station)]
+        self._others_count = len(self._colored)
+        if self.patientDevice is not None:
+            self._colored.append(self.patientDevice)
+        self._sources = measured_slots(self._colored)
+        self._node_artists = []
+        self._path_artists = []
+        self._background = None
+
+    def on_click(self, coords, node_value):
+        show_saturation_history(coords, node_value)
+
+    def colors_of(self, values, measured=None):
+        """
+        Colours of many SpO2 values at once, see spo2_to_color,
+        values not *measured* get NO_DATA_COLOR
+        """
+        colors = self.spo2_colors[np.clip(values, 0, self.SPO2_MAX)]
+        if measured is not None:
+            colors[~measured] = self.NO_DATA_COLOR
+        return colors
+
+    def last_spo2(self):
+        """
+        Last SpO2 measurement of every coloured node, read from
+        measurement stores of the devices without copying histories
+
+        Returns:
+            (tuple) values and mask of nodes having a measurement
+        """
+        values = np.zeros(len(self._colored), dtype=np.int64)
+        measured = np.zeros(len(self._colored), dtype=bool)
+        for store, slots, positions in self._sources:
+            _, last, has_last = store.last('spo2')
+            values[positions] = last[slots]
+            measured[positions] = has_last[slots]
+        return values, measured
+
+    def spo2_to_color(self, value):
+        if value > self.SPO2_COLORS[0][1]:
+            rgb = self.SPO2_COLORS[0][3]
+        elif value < self.SPO2_COLORS[-1][0]:
+            rgb = self.SPO2_COLORS[-1][2]
+        else:
+            for minV, maxV, minColor, maxColor in self.SPO2_COLORS:
+                if minV <= value <= maxV:
+                    factor = (value - minV) / (maxV - minV)
+                    rgb = tuple(
+                        (1 - factor) * minChannel + factor * maxChannel
+                        for minChannel, maxChannel in zip(minColor, maxColor)
+                    )
+                    break
+        return tuple(channel / 255 for channel in rgb)
+
+    def __measure(self):
+        if self.engine is None:
+            self.mutator.tick()
+            self.mutator.measure('spo2')
+
+    def __draw_nodes(self):
+        """
+        Creates node collections, later frames only change their colours
+        """
+        self.__measure()
+        colors = self.colors_of(*self.last_spo2())
+        count = self._others_count
+        self._node_artists = [nx.draw_networkx_nodes(
+            self.graph, self.pos, ax=self.ax, nodelist=self._colored[:count],
+            node_color=colors[:count], node_size=self.default_node_size
+        )]
+        if self.patientDevice is not None:
+            self._node_artists.append(nx.draw_networkx_nodes(
+                self.graph, self.pos, ax=self.ax, nodelist=[self.patientDevice],
+                node_color=colors[count:], node_size=self.default_node_size * 2
+            ))
+        if self.station is not None:
+            self.draw_nodes(
+                nodelist=[self.station],
+                node_color=[(0.2, 0.2, 0.2)],
+                node_shape="s",
+                node_size=self.default_node_size * 3
+            )
+
+    def __update_nodes(self):
+        self.__measure()
+        colors = self.colors_of(*self.last_spo2())
+        count = self._others_count
+        for artist, part in zip(self._node_artists, (colors[:count], colors[count:])):
+            artist.set_facecolor(part)
+
+    def show_paths(self, main_path, backup_path):
+        """
+        Shows main and backup path in place of the previous ones,
+        a path is None if it doesn't exist
+        """
+        for artist, path in zip(self._path_artists, (backup_path, main_path)):
+            artist.set_segments([] if path is None else
+                                [(u.coordinates, v.coordinates) for u, v in zip(path, path[1:])])
+
+    def _setup_blit(self):
+        """
+        Node colours and paths are animated artists, drawn over a saved
+        background, if the canvas supports blitting
+        """
+        if not self.fig.canvas.supports_blit:
+            return
+        for artist in self._node_artists + self._path_artists:
+            artist.set_animated(True)
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self._node_artists + self._path_artists:
+            self.fig.draw_artist(artist)
+
+    def refresh(self):
+        canvas = self.fig.canvas
+        if self._background is None:
+            super().refresh()
+            return
+        canvas.restore_region(self._background)
+        self._draw_animated()
+        canvas.blit(self.fig.bbox)
+
+    def draw(self):
+        self.__draw_nodes()
+        self.draw_labels()
+        self.draw_layers()
+        self._path_artists = []
+        for color in ('magenta', 'crimson'):
+            artist = LineCollection([], colors=color, linewidths=2, zorder=3)
+            self.ax.add_collection(artist)
+            self._path_artists.append(artist)
+        draw_legend(self.ax)
+        self._setup_blit()
+
+    def redraw(self, elapsed_seconds, **kwargs):
+        if self.step == 3 and elapsed_seconds > 13:
+            #self.station.patient.condition = patient.CRITICAL
+            self.show_paths(*calculate_path_between(
+                self.routes if self.routes is not None else self.nan_graph,
+                self.station,
+                self.patientDevice
+            ))
+            self.step += 1
+        if self.step == 2 and elapsed_seconds > 12:
+            self.patientDevice.patient.condition = patient.CRITICAL
+            self.step += 1
+        if self.step == 1 and elapsed_seconds > 5:
+            self.patientDevice.patient.condition = patient.UNWELL
+            self.step += 1
+        self.__update_nodes()
+
+    def observe(self, engine):
+        """
+        SimulationEngine observer, draws state after a tick
+        and paths of alerts sent since the last call
+        """
+        if self.fig is None:
+            self._before_show()
+        self.draw_frame(engine)
+        plt.pause(0.001)
+
+    def draw_frame(self, engine):
+        """
+        Draws state of *engine* (anything with alerts and devices'
+        measurement stores) without handling GUI events
+        """
+        with metrics.span('frame', histogram=True):
+            for alert in engine.alerts[self.drawn_alerts:]:
+                if alert.paths is not None:
+                    self.show_paths(*alert.paths)
+            self.drawn_alerts = len(engine.alerts)
+            self.__update_nodes()
+            self.refresh()
+
+def path_onclick_wrapper(node_collection, node_value, graph):
+    node_collection.append(node_value)
+    if len(node_collection) > 1:
+        main_path, backup_path = calculate_path_between(graph, 
+                                                        node_collection[-1], 
+                                                        node_collection[-2])
+        draw_main_and_backup_paths(main_path, backup_path)
+        node_collection.clear()
+
+
+def draw_legend(ax=None):
+    """
+    Legend of main and backup paths on *ax*, current axes if not given
+    """
+    red_patch = mpatches.Patch(color='crimson', label='Main path')
+    magenta_patch = mpatches.Patch(color='magenta', label='Backup path')
+    (ax or plt.gca()).legend(handles=[red_patch, magenta_patch], loc='upper right')
+
+
+def draw_main_and_backup_paths(main_path, backup_path):
+    draw_legend()
+
+    # a path is None if it doesn't exist
+    if backup_path is not None:
+        draw_path(create_path_edges(backup_path), 'magenta')
+    if main_path is not None:
+        draw_path(create_path_edges(main_path), 'crimson')
+
+
+def measured_slots(devices):
+    """
+    Groups devices by their MeasurementStore
+
+    Returns:
+        list of (store, slots, positions) tuples, positions
+            are indices of the devices in *devices*
+    """
+    groups = {}
+    for position, dev in enumerate(devices):
+        store, slots, positions = groups.setdefault(id(dev.store), (dev.store, [], []))
+        slots.append(dev.slot)
+        positions.append(position)
+    return [(store, np.array(slots), np.array(positions)) for store, slots, positions in groups.values()]
+
+
+def show_saturation_history(coords, node_value):
+    # just a random date for better display (time rather than numbers)
+    start = datetime.datetime(year=2020, month=4, day=26, hour=13, minute=17)
+
+    measurements = node_value.get_measurements('spo2')
+    data = [m.value for m in measurements]
+    x_ticks = [m.timestamp for m in measurements]
+    fake_times = [start + datetime.timedelta(seconds=3 * ts) for ts in x_ticks]
+
+    fig, ax = plt.subplots()
+
+    ax.axhline(90, ls='--', color='red')
+    ax.axhline(95, ls='--', color='yellow')
+
+    ax.bar(x_ticks, data, color='royalblue', tick_label=[x.strftime("%H:%M:%S") for x in fake_times])
+    ax.set_title(f"SpO2 of patient#{node_value.patient.id} against time")
+    ax.set_ylabel("%")
+    ax.set_ylim(50, 100)
+    ax.yaxis.set_ticks(list(range(50, 110, 10)))
+    ax.xaxis.set_ticks(x_ticks)
+    plt.xticks(rotation=45)
+
+    plt.show()
+
+
+def onlick_return_coordinates(sel, lookup_object_by_coords):
+    sel_x = int(round(sel.target[0]))
+    sel_y = int(round(sel.target[1]))
+    node_value = lookup_object_by_coords[(sel_x, sel_y)]
+
+    sel.annotation.set_text(f"{node_value} \n ({sel_x}, {sel_y})")
+    sel.annotation.set_text(f"({sel_x}, {sel_y})")
+    sel.annotation.get_bbox_patch().set(fc="white")
+    sel.annotation.arrow_patch.set(arrowstyle="simple", fc="white", alpha=.5)
+
+    return(sel_x, sel_y), node_value
+
+
+def create_path_edges(path):
+    """
+    make connections between nodes
+    """
+    path_graph = nx.Graph()
+    for i, num in enumerate(path):
+        path_graph.add_node(num, pos=num.coordinates, value=num.value)
+        if i < len(path) - 1:
+            path_graph.add_edge(path[i], path[i+1])
+
+    return path_graph
+
+
+def draw_path(graph, color):
+    """
+    draw path on given graph object
+    """
+    pos = nx.get_node_attributes(graph, 'pos')
+    nx.draw_networkx_edges(graph, pos, graph.edges, edge_color=color, alpha=1, width=2)
+
+
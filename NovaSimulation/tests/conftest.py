@@ -0,0 +1,7 @@
+import os
+import sys
+
+# modules in simulation/ import each other as top-level modules,
+# tests of such modules import them the same way, so that classes
+# are not loaded twice (as simulation.device.Device and device.Device)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'simulation'))
@@ -0,0 +1,50 @@
+import math
+import random
+
+from clustering import elect_masters
+from spatial import range_csr
+
+import pytest
+
+random.seed(11)
+points = [(random.randint(0, 30), random.randint(0, 30)) for _ in range(250)]
+point_values = random.sample(range(1, 10000), len(points))
+
+
+def legacy_election(points, values, radius, device_limit):
+    """
+    Election as create_socket_edges did it before the rewrite
+    """
+    in_range = {
+        i: {j: math.dist(points[i], points[j]) for j in range(len(points))
+            if points[i] != points[j] and math.dist(points[i], points[j]) <= radius}
+        for i in range(len(points))
+    }
+    remaining = set(range(len(points)))
+    masters, edges = [], []
+    while remaining:
+        lowest = min(remaining, key=lambda i: values[i])
+        masters.append(lowest)
+        neighbours = in_range[lowest]
+        free = [i for i in sorted(neighbours, key=neighbours.get) if i in remaining]
+        for slave in free[:device_limit]:
+            edges.append((lowest, slave))
+            remaining.remove(slave)
+        remaining.remove(lowest)
+    return masters, edges
+
+
+class TestElectMasters:
+
+    @pytest.mark.parametrize('radius, device_limit', [(3, 1), (5, 5), (5, 0), (8, 20)])
+    def test_same_as_legacy_election(self, radius, device_limit):
+        election = elect_masters(point_values, range_csr(points, radius), device_limit)
+        masters, edges = legacy_election(points, point_values, radius, device_limit)
+        assert election.masters.tolist() == masters
+        assert [tuple(edge) for edge in election.edges.tolist()] == edges
+
+    def test_master_of(self):
+        csr = range_csr([(0, 0), (1, 0), (2, 0), (9, 9)], 1)
+        election = elect_masters([3, 1, 2, 4], csr, 1)
+        assert election.masters.tolist() == [1, 2, 3]
+        assert election.master_of.tolist() == [1, 1, 2, 3]
@@ -0,0 +1,55 @@
+from devicetable import DeviceTable, DeviceView
+from graph import create_nan_edges, create_socket_edges
+
+import pytest
+
+coordinates = [(0, 0), (1, 0), (0, 2), (5, 5), (6, 5), (9, 9)]
+values = [40, 10, 30, 20, 60, 50]
+
+
+@pytest.fixture
+def table():
+    table = DeviceTable(coordinates, values, patient_ids=range(len(values)))
+    table.scan_in_range(2)
+    return table
+
+
+class TestDeviceTable:
+
+    def test_columns(self, table):
+        assert len(table) == 6
+        assert table.coordinates.dtype.kind == 'i'
+        assert table.battery_level.tolist() == [100] * 6
+        assert table[3].patient_id == 3
+
+    def test_view_behaves_like_device(self, table):
+        view = table[1]
+        assert view.coordinates == (1, 0)
+        assert view.value == 10
+        assert str(view) == "10"
+        assert view == DeviceView(table, 1)
+        assert min(table) == view
+        view.is_master = True
+        assert table.is_master.tolist() == [False, True, False, False, False, False]
+
+    def test_devices_in_range(self, table):
+        assert table[0].devices_in_range == {table[1]: 1.0, table[2]: 2.0}
+        assert table[5].devices_in_range == {}
+
+    def test_connections(self, table):
+        table[0].add_connections(table[1])
+        table[0].connections += [table[2], table[3]]
+        assert table[0].connections == [table[1], table[2], table[3]]
+        table[0].connections = [table[4]]
+        assert table[0].connections == [table[4]]
+        assert table[1].connections == []
+
+    def test_graph_functions(self, table):
+        graph = table.to_graph()
+        nan_graph = graph.copy()
+        create_socket_edges(graph, 1, neighbours=table.neighbours)
+        create_nan_edges(nan_graph, neighbours=table.neighbours)
+        assert [dev.value for dev in table if dev.is_master] == [10, 30, 20, 50]
+        assert sorted((u.value, v.value) for u, v in graph.edges) == [(20, 60), (40, 10)]
+        # device without neighbours gets a self loop, same as with Device objects
+        assert nan_graph.number_of_edges() == 4
@@ -0,0 +1,139 @@
+import json
+import os
+import random
+
+from distance import DistanceFile, iter_json_values
+
+import numpy as np
+import pytest
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'simulation', 'input', 'distances.json')
+
+
+def legacy_average(dist_list):
+    """
+    DistanceFile.calculate_average_distances before matrices were used
+    """
+    avg_list = []
+    for i in dist_list:
+        for j in dist_list:
+            if i[0] + i[1] == j[1] + j[0]:
+                val_one, val_two = float(i[2]), float(j[2])
+                if val_one > 1 and val_two > 1:
+                    mean_val = (val_one + val_two)/2
+                else:
+                    mean_val = val_one if val_one > val_two else val_two
+                avg_list.append([i[0], i[1], mean_val])
+    return avg_list
+
+
+def write_distances(path, readings):
+    """
+    Args:
+        readings (dict): {devA: [(devB, distance), ...]}
+    """
+    data = {
+        str(number): {
+            'phoneName': name,
+            'distanceList': [{'phoneName': other, 'distance': distance}
+                             for other, distance in found]
+        }
+        for number, (name, found) in enumerate(readings.items())
+    }
+    with open(path, 'w') as dist_file:
+        json.dump(data, dist_file)
+    return str(path)
+
+
+@pytest.fixture
+def random_file(tmp_path):
+    rng = random.Random(7)
+    names = ['PHONE_%d' % i for i in range(12)]
+    readings = {
+        name: [(other, rng.choice([-1, 0, 1, rng.randint(2, 20000)]))
+               for other in names if other != name and rng.random() < 0.8]
+        for name in names
+    }
+    return write_distances(tmp_path / 'distances.json', readings)
+
+
+class TestDistanceFile:
+
+    @pytest.mark.parametrize('path', [INPUT_FILE, 'random'])
+    def test_same_averages_as_before(self, path, random_file):
+        distances = DistanceFile(random_file if path == 'random' else path, cache=False)
+        assert distances.avg_list == legacy_average(distances.dist_list)
+        assert list(distances.avg_dict) == list(dict.fromkeys(row[0] for row in distances.avg_list))
+
+    def test_matrix(self, tmp_path):
+        path = write_distances(tmp_path / 'distances.json', {
+            'A': [('B', 100), ('C', -1), ('D', 50)],
+            'B': [('A', 110), ('C', 30)],
+            'C': [('A', -1), ('B', -1)],
+        })
+        distances = DistanceFile(path)
+        a, b, c, d = (distances.index[name] for name in 'ABCD')
+        assert distances.names == ['A', 'B', 'C', 'D']
+        assert distances.readings[a, b] == 100 and distances.readings[b, a] == 110
+        assert distances.matrix[a, b] == distances.matrix[b, a] == 105
+        # one reading is missing, the other one is used
+        assert distances.matrix[b, c] == 30
+        # both readings missing, or reading without the opposite one
+        assert np.isnan(distances.matrix[a, c]) and np.isnan(distances.matrix[a, d])
+        assert distances.known.sum() == 4
+        assert distances.avg_dict == {'A': {'B': 105, 'C': -1}, 'B': {'A': 105, 'C': 30},
+                                      'C': {'A': -1, 'B': 30}}
+
+    def test_names_are_not_concatenated(self, tmp_path):
+        # 'A' + 'BC' == 'AB' + 'C' used to match readings of different pairs
+        path = write_distances(tmp_path / 'distances.json', {
+            'A': [('BC', 10)],
+            'AB': [('C', 20)],
+        })
+        distances = DistanceFile(path)
+        assert distances.avg_list == []
+        assert not distances.known.any()
+
+    def test_cache(self, random_file):
+        written = DistanceFile(random_file)
+        assert os.path.exists(random_file + '.cache')
+        loaded = DistanceFile(random_file)
+        assert isinstance(loaded.matrix, np.memmap)
+        assert loaded.names == written.names
+        np.testing.assert_array_equal(loaded.matrix, written.matrix)
+        assert np.array_equal(loaded.known, written.known)
+        assert loaded.avg_dict == written.avg_dict
+        assert loaded.dist_list == written.dist_list
+
+    def test_cache_invalidated(self, tmp_path):
+        path = write_distances(tmp_path / 'distances.json', {'A': [('B', 100)], 'B': [('A', 110)]})
+        assert DistanceFile(path).matrix[0, 1] == 105
+        stat = os.stat(path)
+        write_distances(path, {'A': [('B', 300)], 'B': [('A', 310)]})
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert DistanceFile(path).matrix[0, 1] == 305
+
+    def test_cut_cache(self, tmp_path):
+        path = write_distances(tmp_path / 'distances.json', {'A': [('B', 100)], 'B': [('A', 110)]})
+        DistanceFile(path)
+        size = os.path.getsize(path + '.cache')
+        # valid header, sections cut by an interrupted write
+        os.truncate(path + '.cache', size - 8)
+        distances = DistanceFile(path)
+        assert distances.matrix[0, 1] == 105
+        assert not isinstance(distances.matrix, np.memmap)
+        assert os.path.getsize(path + '.cache') == size
+        assert sorted(os.listdir(tmp_path)) == ['distances.json', 'distances.json.cache']
+        assert isinstance(DistanceFile(path).matrix, np.memmap)
+
+    def test_without_cache(self, tmp_path):
+        path = write_distances(tmp_path / 'distances.json', {'A': [('B', 100)], 'B': [('A', 110)]})
+        DistanceFile(path, cache=False)
+        assert not os.path.exists(path + '.cache')
+
+    @pytest.mark.parametrize('chunk_size', [1, 5, 64, 1 << 16])
+    def test_iter_json_values(self, chunk_size):
+        with open(INPUT_FILE) as dist_file:
+            expected = list(json.load(dist_file).values())
+        with open(INPUT_FILE) as dist_file:
+            assert list(iter_json_values(dist_file, chunk_size)) == expected
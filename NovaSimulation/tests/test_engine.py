@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+from device import PatientDevice
+from engine import ScriptedChange, SimulationEngine, health_scenario
+from patient import Patient
+import patient
+
+import pytest
+
+SIMULATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'simulation')
+
+
+@pytest.fixture
+def devices():
+    return [PatientDevice((i, 0), i + 1, patient=Patient(i)) for i in range(5)]
+
+
+class TestSimulationEngine:
+
+    def test_run_measures_every_tick(self, devices):
+        engine = SimulationEngine(devices, step=0.5, params=('spo2', 'hr'))
+        stats = engine.run(10)
+        assert stats.ticks == 20
+        assert stats.simulated_seconds == engine.time == 10
+        assert devices[0].get_last_measurement('hr').timestamp == 20
+        assert len(devices[0].get_measurements('spo2')) == 10
+
+    def test_script_and_observers(self, devices):
+        fired, observed = [], []
+        engine = SimulationEngine(devices, script=[
+            ScriptedChange(2, lambda engine: fired.append(('b', engine.time))),
+            ScriptedChange(0.5, lambda engine: fired.append(('a', engine.time))),
+        ])
+        engine.schedule(1, lambda engine: fired.append(('c', engine.time)))
+        engine.add_observer(lambda engine: observed.append(engine.ticks), every=3)
+        engine.run(ticks=10)
+        assert fired == [('a', 0.5), ('c', 1), ('b', 2)]
+        assert observed == [3, 6, 9]
+
+    def test_health_scenario(self, devices):
+        script = health_scenario(devices[0], devices[4], route=lambda src, dst: ([src, dst], None))
+        engine = SimulationEngine(devices, script=script)
+        engine.run(12)
+        assert devices[0].patient.condition is patient.CRITICAL
+        assert engine.alerts == []
+        engine.run(1)
+        assert [alert.paths for alert in engine.alerts] == [([devices[0], devices[4]], None)]
+
+    def test_does_not_import_matplotlib(self):
+        code = "import sys, engine, graph, simulator; print('matplotlib' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], cwd=SIMULATION_DIR,
+                                check=True, capture_output=True, text=True).stdout
+        assert output.strip() == "False"
@@ -0,0 +1,84 @@
+from device import PatientDevice
+from engine import Mutator, ScriptedChange, health_scenario
+from events import EventEngine, EventScheduler, SamplingPlan
+from patient import CRITICAL, RESTING, UNWELL, Patient, PatientPopulation
+
+import pytest
+
+
+@pytest.fixture
+def devices():
+    population = PatientPopulation(4, seed=1)
+    return [PatientDevice((i, 0), i, patient=population[i]) for i in range(4)]
+
+
+class TestEventScheduler:
+
+    def test_runs_due_events_in_order(self):
+        scheduler = EventScheduler()
+        ran = []
+        scheduler.schedule(2, ran.append, 'b')
+        scheduler.schedule(1, ran.append, 'a')
+        scheduler.schedule(2, ran.append, 'c')
+        scheduler.schedule(5, ran.append, 'd')
+        assert scheduler.run_until(3) == 3
+        assert ran == ['a', 'b', 'c']
+        assert scheduler.now == 3
+        with pytest.raises(ValueError):
+            scheduler.schedule(1, ran.append, 'e')
+
+
+class TestEventEngine:
+
+    def test_per_param_sampling(self, devices):
+        engine = EventEngine(devices, sampling={'hr': (10, 0), 'spo2': (2, 0.5)}, seed=0)
+        stats = engine.run(60)
+        assert len(devices[0].get_measurements('hr')) == 7
+        assert len(devices[0].get_measurements('spo2')) == 10
+        assert 4 * (7 + 26) <= stats.events <= 4 * (7 + 41)
+
+    def test_events_not_devices_times_ticks(self, devices):
+        engine = EventEngine(devices, sampling={'hr': SamplingPlan(3600, 0)})
+        assert engine.run(24 * 3600).events == 4 * 25
+
+    def test_condition_change_and_fault(self, devices):
+        engine = EventEngine(devices, sampling={'spo2': (1, 0)},
+                             script=[ScriptedChange(5, lambda engine: engine.alerts.append(engine.time))])
+        engine.schedule_condition_change(10, devices[0], CRITICAL)
+        engine.schedule_fault(10, devices[1], 'spo2', duration=5)
+        engine.run(20)
+        assert engine.alerts == [5]
+        assert devices[0].get_last_measurement('spo2').value <= CRITICAL['spo2'][1]
+        history = [m.value for m in devices[1].get_measurements('spo2')]
+        # history keeps the last 10 samples, taken at 11..20 s
+        assert all(value <= 5 for value in history[:4])
+        assert all(value >= 90 for value in history[4:])
+
+    def test_scripted_condition_after_elapsed_steps(self):
+        device = PatientDevice((0, 0), 0, patient=Patient(0))
+        conditions = []
+        device.patient.tick = lambda: conditions.append(device.patient.condition)
+        station = PatientDevice((1, 0), 1, patient=Patient(1))
+        engine = EventEngine([device], sampling={'hr': (100, 0)},
+                             script=health_scenario(device, station))
+        engine.run(6)
+        # steps of 1..5 s are taken before the patient gets unwell at 5 s
+        assert conditions == [RESTING] * 5
+        assert device.patient.condition is UNWELL
+
+    def test_plain_patient_is_advanced(self):
+        device = PatientDevice((0, 0), 0, patient=Patient(0))
+        ticks = []
+        device.patient.tick = lambda: ticks.append(1)
+        EventEngine([device], sampling={'hr': (4, 0)}, patient_tick=0.5).run(10)
+        assert len(ticks) == 16
+
+
+class TestMutator:
+
+    def test_measures_param_once_per_tick(self, devices):
+        mutator = Mutator(devices)
+        mutator.tick()
+        mutator.measure('hr')
+        mutator.measure('hr')
+        assert len(devices[0].get_measurements('hr')) == 1
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+
+from engine import DEMO_PATIENT_VALUE, DEMO_STATION_VALUE, SimulationEngine
+from export import NO_SPO2, FrameViz, Recorder, Replay, export, render_frames
+from graph import build_topology
+from grid import load_grid
+from simulator import create_patient_devices, demo_script
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+from PIL import Image
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'simulation', 'input', 'input.txt')
+
+
+@pytest.fixture(scope='module')
+def recording():
+    coordinates, values, size = load_grid(INPUT_FILE)
+    devices = create_patient_devices(coordinates, values, seed=0)
+    socket_graph, nan_graph = build_topology(devices, 5, 5)
+    engine = SimulationEngine(devices, step=0.5, script=demo_script(devices, nan_graph))
+    recorder = Recorder(devices)
+    engine.add_observer(recorder, every=4)
+    engine.run(16)
+    yield recorder.scene(socket_graph, nan_graph, size), recorder.snapshots
+    plt.close('all')
+
+
+class TestExport:
+
+    def test_recorded_snapshots(self, recording):
+        scene, snapshots = recording
+        assert [snapshot.time for snapshot in snapshots] == [2.0, 4.0, 6.0, 8.0,
+                                                             10.0, 12.0, 14.0, 16.0]
+        assert [snapshot.alerts for snapshot in snapshots] == [0] * 6 + [1, 1]
+        alert = scene.alerts[0]
+        assert scene.values[alert.source] == DEMO_PATIENT_VALUE
+        assert scene.values[alert.destination] == DEMO_STATION_VALUE
+        main_path, _ = alert.paths
+        assert (main_path[0], main_path[-1]) == (alert.destination, alert.source)
+        assert snapshots[0].spo2.shape == (len(scene.values),)
+        assert (snapshots[0].spo2 <= 100).all()
+
+    def test_unmeasured_devices(self, recording):
+        scene, snapshots = recording
+        recorder = Recorder(Replay(scene).devices)
+        recorder(Replay(scene))
+        assert (recorder.snapshots[0].spo2 == NO_SPO2).all()
+        replay = Replay(scene)
+        replay.load(snapshots[0])
+        replay.load(recorder.snapshots[0]._replace(time=1.0))
+        assert not replay.store.last('spo2')[2].any()
+
+    def test_frames_dont_depend_on_order(self, recording, tmp_path):
+        scene, snapshots = recording
+        paths = render_frames(scene, snapshots, str(tmp_path), workers=1, figsize=(4, 4), dpi=50)
+        assert sorted(os.listdir(tmp_path)) == [os.path.basename(path) for path in paths]
+        frames = [np.asarray(Image.open(path)) for path in paths]
+        assert frames[0].shape == (200, 200, 4)
+        # colours change every frame, paths appear after the alert
+        assert not np.array_equal(frames[0], frames[1])
+        # a renderer starting in the middle draws the same frame
+        alone = FrameViz(scene, figsize=(4, 4), dpi=50).render(snapshots[-1])
+        np.testing.assert_array_equal(alone, frames[-1])
+
+    def test_video_needs_ffmpeg(self, recording, tmp_path, monkeypatch):
+        scene, snapshots = recording
+        monkeypatch.setitem(plt.rcParams, 'animation.ffmpeg_path', 'missing-ffmpeg')
+        with pytest.raises(RuntimeError):
+            export(scene, snapshots, str(tmp_path / 'run.mp4'), workers=1)
+        assert not os.listdir(tmp_path)
+
+    def test_pyplot_left_alone(self, recording):
+        scene, snapshots = recording
+        figures = plt.get_fignums()
+        FrameViz(scene, figsize=(2, 2), dpi=50).render(snapshots[0])
+        assert plt.get_fignums() == figures
+        # importing export doesn't switch the backend of other commands
+        code = "import matplotlib; matplotlib.use('svg'); import export; print(matplotlib.get_backend())"
+        simulation_dir = os.path.join(os.path.dirname(INPUT_FILE), os.pardir)
+        output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True,
+                                text=True, cwd=simulation_dir).stdout
+        assert output.strip() == 'svg'
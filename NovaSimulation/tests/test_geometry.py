@@ -1,7 +1,13 @@
+import random
+
+from simulation import geometry
 from simulation.geometry import centroid
 from simulation.geometry import get_intersection_of_two_circles
+from simulation.geometry import get_intersections_of_circles
 from simulation.geometry import observational_err_handler
+from simulation.geometry import reconcile_radii
 
+import numpy as np
 import pytest
 
 centroid_data = [
@@ -17,6 +23,47 @@ error_handler_data = [
     (0, 54, 54, None),
     (20000, 3000, 200, None)
 ]
+# separate circles reconciled in 5000, 5001 and 5002 steps,
+# contained circles switching direction after a few, many or no steps
+reconcile_data = [
+    (10010, 5, 5), (10011, 5, 5), (10012, 5, 5), (10013, 5, 5), (10015, 7, 5),
+    (0, 3, 1), (0, 4, 1), (0.5, 3, 0), (3, 10, 1), (3, 1, 10), (10, 9000, 5),
+    (2, 20000, 3), (1, 3, 30000), (0, 0, 0), (7, 2.5, 3.5), (0, 5000, 5000),
+]
+random.seed(13)
+reconcile_data += [
+    (random.randint(0, 30000), random.randint(0, 15000), random.randint(0, 15000))
+    for _ in range(30)
+]
+
+
+def legacy_err_handler(d, rn, rm):
+    """
+    observational_err_handler before it was made closed-form
+    """
+    obs_err = 5000
+    iterator = 0
+    while d > rn + rm:
+        if iterator <= 5000:
+            rn += 1
+            rm += 1
+            iterator += 1
+        else:
+            return None
+    while d < abs(rn - rm):
+        if iterator <= obs_err:
+            rn += 1
+            rm -= 1
+            iterator += 1
+        if iterator >= obs_err:
+            rn -= 1
+            rm += 1
+            iterator += 1
+        if iterator >= 3 * obs_err:
+            return None
+    if d == 0 and rn == rm:
+        return None
+    return rn, rm
 
 
 class TestGeometry:
@@ -37,3 +84,39 @@ class TestGeometry:
     def test_observational_error_handler(self, d, rn, rm, expected):
         result = observational_err_handler(d, rn, rm)
         assert result == expected
+
+    @pytest.mark.parametrize('d, rn, rm', reconcile_data)
+    def test_observational_error_handler_matches_loop(self, d, rn, rm):
+        assert observational_err_handler(d, rn, rm) == legacy_err_handler(d, rn, rm)
+
+    def test_reconcile_radii(self):
+        d, rn, rm = np.array(reconcile_data, dtype=np.float64).T
+        new_rn, new_rm, status = reconcile_radii(d, rn, rm)
+        for i, case in enumerate(reconcile_data):
+            expected = legacy_err_handler(*case)
+            if expected is None:
+                assert status[i] != geometry.INTERSECTING
+            else:
+                assert status[i] == geometry.INTERSECTING
+                assert (new_rn[i], new_rm[i]) == expected
+
+    def test_get_intersections_of_circles(self):
+        rng = random.Random(4)
+        pairs = [((rng.uniform(-50, 50), rng.uniform(-50, 50)), rng.uniform(1, 80),
+                  (rng.uniform(-50, 50), rng.uniform(-50, 50)), rng.uniform(1, 80))
+                 for _ in range(200)]
+        c0, r0, c1, r1 = zip(*pairs)
+        points, status = get_intersections_of_circles(c0, r0, c1, r1)
+        assert (status == geometry.INTERSECTING).all()
+        for pair, point in zip(pairs, points):
+            assert np.allclose(point, get_intersection_of_two_circles(*pair))
+
+    def test_get_intersections_of_circles_status(self):
+        centers = [(0, 0), (0, 0), (0, 0), (0, 0)]
+        others = [(20, 0), (30, 0), (1, 0), (0, 0)]
+        points, status = get_intersections_of_circles(centers, 10, others, [10, 10, 2, 10],
+                                                      reconcile=False)
+        assert status.tolist() == [geometry.INTERSECTING, geometry.SEPARATE,
+                                   geometry.CONTAINED, geometry.COINCIDENT]
+        assert points[0].tolist() == [10, 0]
+        assert np.isnan(points[1:]).all()
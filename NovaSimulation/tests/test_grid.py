@@ -0,0 +1,53 @@
+import os
+
+from grid import is_sparse, load_grid, random_grid, save_grid
+
+import numpy as np
+import pytest
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'simulation', 'input', 'input.txt')
+
+dense_matrix = np.array([
+    [0, 5, 0],
+    [7, 0, 0],
+    [0, 0, 9],
+])
+
+
+class TestGrid:
+
+    def test_dense_order_and_coordinates(self):
+        matrix = np.loadtxt(INPUT_FILE, dtype='i', delimiter=',')
+        expected = [((i, j), value) for i, column in enumerate(matrix.transpose())
+                    for j, value in enumerate(column) if value != 0]
+        coordinates, values, size = load_grid(INPUT_FILE)
+        assert list(zip(map(tuple, coordinates.tolist()), values.tolist())) == expected
+        assert size == 100
+        assert not is_sparse(INPUT_FILE)
+
+    @pytest.mark.parametrize('name, sparse', [('grid.txt', False), ('grid.csv', True), ('grid.npy', False)])
+    def test_formats_load_the_same(self, tmp_path, name, sparse):
+        rows, columns = np.nonzero(dense_matrix)
+        path = str(tmp_path / name)
+        save_grid(path, 3, 3, rows, columns, dense_matrix[rows, columns], sparse=sparse)
+        coordinates, values, size = load_grid(path)
+        assert coordinates.tolist() == [[0, 1], [1, 0], [2, 2]]
+        assert values.tolist() == [7, 5, 9]
+        assert size == 3
+
+    def test_sparse_header(self, tmp_path):
+        path = tmp_path / 'grid.csv'
+        path.write_text('x, y, value\n4,1,2\n0,3,8\n')
+        assert is_sparse(str(path))
+        coordinates, values, size = load_grid(str(path))
+        assert coordinates.tolist() == [[0, 3], [4, 1]]
+        assert values.tolist() == [8, 2]
+        assert size == 5
+
+    def test_random_grid_has_no_collisions(self):
+        rows, columns, values = random_grid(10, 20, 200, seed=3)
+        assert len(set(zip(rows.tolist(), columns.tolist()))) == 200
+        assert rows.max() < 10 and columns.max() < 20
+        assert sorted(values.tolist()) == list(range(1, 201))
+        with pytest.raises(ValueError):
+            random_grid(10, 20, 201)
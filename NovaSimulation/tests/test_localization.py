@@ -0,0 +1,76 @@
+from geometry import distance_simulation_loop
+from localization import distance_matrix, localize, multilaterate, placement_error
+
+import numpy as np
+import pytest
+
+# first two devices are on x axis, others are above it
+upper_layout = {
+    'A': (0, 0), 'B': (-10, 0), 'C': (3, 7), 'D': (-6, 12),
+    'E': (9, 2), 'F': (14, 15), 'G': (-2, 4), 'H': (5, 20),
+}
+
+
+def as_distances(layout):
+    return {
+        name: {other: float(np.hypot(x - u, y - v))
+               for other, (u, v) in layout.items() if other != name}
+        for name, (x, y) in layout.items()
+    }
+
+
+class TestMultilaterate:
+
+    def test_exact_distances(self):
+        rng = np.random.default_rng(3)
+        anchors = rng.uniform(0, 100, (6, 2))
+        points = rng.uniform(0, 100, (50, 2))
+        distances = np.hypot(*(points[:, None] - anchors[None]).transpose(2, 0, 1))
+        assert np.allclose(multilaterate(anchors, distances), points)
+
+    def test_missing_and_collinear_anchors(self):
+        anchors = [(0, 0), (10, 0), (0, 10), (20, 0)]
+        point = np.array([4.0, 3.0])
+        distances = np.hypot(*(point - np.array(anchors)).T)
+        rows = np.tile(distances, (3, 1))
+        rows[1, [0, 2]] = np.nan      # only 2 anchors left
+        rows[2, 2] = np.nan           # anchors left are on x axis
+        solved = multilaterate(anchors, rows)
+        assert np.allclose(solved[0], point)
+        assert np.isnan(solved[1:]).all()
+
+
+class TestLocalize:
+
+    def test_distance_matrix(self):
+        names, matrix = distance_matrix({'A': {'B': 2.0, 'C': -1}, 'B': {'A': 2.0}, 'C': {}})
+        assert names == ['A', 'B', 'C']
+        assert matrix[0, 1] == matrix[1, 0] == 2.0
+        assert np.isnan(matrix[0, 2]) and np.isnan(matrix[2, 0])
+        assert matrix[2, 2] == 0
+
+    @pytest.mark.parametrize('solver', ['legacy', 'lstsq'])
+    def test_solvers_share_frame(self, solver):
+        result = distance_simulation_loop(as_distances(upper_layout), solver)
+        assert [name for name, _ in result] == list(upper_layout)
+        assert result[1][1] == (-10, 0)
+        assert placement_error(result[:3], upper_layout)[1] < 1e-6
+
+    def test_lstsq_is_exact(self):
+        result = distance_simulation_loop(as_distances(upper_layout), 'lstsq')
+        assert placement_error(result, upper_layout)[1] < 1e-6
+
+    def test_below_x_axis(self):
+        layout = dict(upper_layout, I=(4, -9), J=(-12, -3))
+        result = localize(as_distances(layout))
+        assert placement_error(result, layout)[1] < 1e-6
+
+    def test_max_range(self):
+        layout = {'%d,%d' % (x, y): (x, y) for x in range(6) for y in range(6)}
+        result = localize(as_distances(layout), max_range=2.5)
+        assert len(result) == len(layout)
+        assert placement_error(result, layout)[1] < 1e-6
+
+    def test_unknown_solver(self):
+        with pytest.raises(ValueError):
+            distance_simulation_loop(as_distances(upper_layout), 'exact')
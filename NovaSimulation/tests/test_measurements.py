@@ -0,0 +1,83 @@
+from device import Measurement, PatientDevice
+from measurements import MeasurementStore
+from patient import Patient
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def store():
+    return MeasurementStore(3, capacity=4)
+
+
+class TestMeasurementStore:
+
+    def test_history_in_chronological_order(self, store):
+        for timestamp in range(1, 7):
+            store.append('spo2', timestamp, [timestamp * 10, 0, timestamp], [0, 1, 2])
+        times, values = store.history('spo2', 0)
+        assert times.tolist() == [3, 4, 5, 6]
+        assert values.tolist() == [30, 40, 50, 60]
+        assert np.shares_memory(values, store._values['spo2'])
+        with pytest.raises(ValueError):
+            values[0] = 1
+
+    def test_partial_history(self, store):
+        store.append('hr', 1, [70, 71], devices=[0, 2])
+        store.append('hr', 2, [72], devices=[2])
+        assert store.count('hr').tolist() == [1, 0, 2]
+        assert store.history('hr', 2)[1].tolist() == [71, 72]
+        assert store.history('spo2', 0)[1].tolist() == []
+
+    def test_last_of_all_devices(self, store):
+        for timestamp in range(5):
+            store.append('hr', timestamp, [timestamp, timestamp + 1, timestamp + 2])
+        times, values, measured = store.last('hr')
+        assert times.tolist() == [4, 4, 4]
+        assert values.tolist() == [4, 5, 6]
+        assert measured.all()
+
+    def test_clear(self, store):
+        store.append('hr', 1, [70, 71, 72])
+        store.clear('hr', 1)
+        assert store.count('hr', 1) == 0
+        assert store.count('hr', 0) == 1
+        assert store.last('hr')[2].tolist() == [True, False, True]
+
+
+class TestPatientDeviceMeasurements:
+
+    def test_same_semantics_as_deque(self):
+        device = PatientDevice((0, 0), 1, patient=Patient(0), buffer_size=3)
+        with pytest.raises(IndexError):
+            device.get_last_measurement('hr')
+        values = [device.measure(timestamp, 'hr') for timestamp in range(5)]
+        assert device.get_last_measurement('hr') == Measurement(4, values[-1])
+        assert device.get_measurements('hr') == tuple(map(Measurement, range(2, 5), values[2:]))
+        assert device.pop_measurements('hr') == tuple(map(Measurement, range(2, 5), values[2:]))
+        assert device.get_measurements('hr') == ()
+        assert device.pop_measurements('spo2') == ()
+
+    def test_shared_store(self):
+        store = MeasurementStore(2)
+        devices = [PatientDevice((i, 0), i, patient=Patient(i), store=store, slot=i) for i in range(2)]
+        devices[1].set_faulty('spo2')
+        devices[0].measure(1, 'spo2')
+        devices[1].measure(1, 'spo2')
+        assert store.last('spo2')[1].tolist() == [devices[0].patient.state['spo2'],
+                                                    devices[1].get_last_measurement('spo2').value]
+        assert 0 <= devices[1].get_last_measurement('spo2').value <= 5
+
+    def test_faulty_sensors_per_slot(self):
+        store = MeasurementStore(3)
+        devices = [PatientDevice((i, 0), i, patient=Patient(i), store=store, slot=i) for i in range(3)]
+        other = PatientDevice((3, 0), 3, patient=Patient(3))
+        devices[2].set_faulty('hr')
+        assert devices[2].faulty == {'hr'}
+        assert store.faulty('hr').tolist() == [False, False, True]
+        assert devices[0].faulty == other.faulty == frozenset()
+        devices[2].set_faulty('hr', False)
+        assert not store.faulty('hr', 2)
+        with pytest.raises(ValueError):
+            devices[0].set_faulty('temperature')
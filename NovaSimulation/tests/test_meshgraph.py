@@ -0,0 +1,86 @@
+import random
+
+from device import Device
+from graph import calculate_path_between
+from meshgraph import MeshGraph
+
+import networkx as nx
+import pytest
+
+random.seed(5)
+grid_devices = [Device((x, y), x * 10 + y) for x in range(6) for y in range(6)]
+
+
+@pytest.fixture
+def mesh():
+    mesh = MeshGraph(grid_devices)
+    neighbours = mesh.scan_in_range(1)
+    src = [i for i in range(len(mesh)) for _ in neighbours.neighbours(i)[0]]
+    mesh.add_edges(src, neighbours.indices)
+    return mesh
+
+
+class TestMeshGraph:
+
+    def test_bulk_edges_are_unique(self, mesh):
+        # every edge was added from both ends
+        assert mesh.number_of_edges() == 2 * 6 * 5
+        assert (mesh.edges[:, 0] < mesh.edges[:, 1]).all()
+
+    def test_adjacency(self, mesh):
+        assert mesh.degree().tolist().count(4) == 16
+        indices, distances = mesh.adjacency().neighbours(0)
+        assert indices.tolist() == [1, 6]
+        assert distances.tolist() == [1.0, 1.0]
+
+    @pytest.mark.parametrize('seed', range(5))
+    def test_components(self, seed):
+        rng = random.Random(seed)
+        mesh = MeshGraph(grid_devices)
+        pairs = [rng.sample(range(len(mesh)), 2) for _ in range(30)]
+        mesh.add_edges(*zip(*pairs))
+        labels = mesh.components()
+        for component in nx.connected_components(mesh.to_networkx()):
+            indices = [mesh.position[dev] for dev in component]
+            assert set(labels[indices].tolist()) == {min(indices)}
+
+    def test_to_networkx(self, mesh):
+        graph = mesh.to_networkx()
+        assert list(graph) == grid_devices
+        assert graph.number_of_edges() == mesh.number_of_edges()
+        assert graph.nodes[grid_devices[7]]['pos'] == (1, 1)
+        assert mesh.to_networkx() is graph
+        mesh.add_edge(grid_devices[0], grid_devices[35])
+        assert mesh.to_networkx() is not graph
+
+    def test_copy_does_not_share_edges(self, mesh):
+        copy = mesh.copy()
+        copy.add_edge(grid_devices[0], grid_devices[35])
+        assert copy.number_of_edges() == mesh.number_of_edges() + 1
+
+    @pytest.mark.parametrize('source, target', [(0, 35), (7, 22), (5, 30), (14, 14)])
+    def test_shortest_path(self, mesh, source, target):
+        graph = mesh.to_networkx()
+        path = mesh.shortest_path(grid_devices[source], grid_devices[target])
+        assert len(path) == nx.shortest_path_length(graph, grid_devices[source], grid_devices[target]) + 1
+        assert all(graph.has_edge(u, v) for u, v in zip(path, path[1:]))
+
+    def test_shortest_path_blocked(self, mesh):
+        blocked = [dev for dev in grid_devices if dev.coordinates[0] == 3]
+        assert mesh.shortest_path(grid_devices[0], grid_devices[35], blocked=blocked) is None
+        assert mesh.number_of_edges() == 60
+
+    def test_paths_between_disconnected(self):
+        mesh = MeshGraph(grid_devices[:3])
+        mesh.add_edge(grid_devices[0], grid_devices[1])
+        assert calculate_path_between(mesh, grid_devices[0], grid_devices[2]) == (None, None)
+
+    def test_paths_between_leave_networkx_graph_alone(self, mesh):
+        graph = mesh.to_networkx().copy()
+        main, backup = calculate_path_between(graph, grid_devices[0], grid_devices[35])
+        assert len(main) == 11
+        assert not set(main[1:-1]) & set(backup)
+        assert graph.number_of_nodes() == 36
+        assert graph.number_of_edges() == 60
+        graph.remove_nodes_from(grid_devices[1:35])
+        assert calculate_path_between(graph, grid_devices[0], grid_devices[35]) == (None, None)
@@ -0,0 +1,97 @@
+import json
+
+from device import PatientDevice
+from engine import SimulationEngine
+from graph import build_topology
+from patient import Patient
+import metrics
+
+import pytest
+
+
+@pytest.fixture
+def recorded():
+    registry = metrics.enable()
+    yield registry
+    metrics.disable()
+
+
+@metrics.timed()
+def stage(value):
+    with metrics.span('inner'):
+        metrics.count('calls')
+    return value
+
+
+class TestMetrics:
+
+    def test_disabled_records_nothing(self):
+        assert metrics.current() is None
+        assert metrics.span('a') is metrics.span('b')
+        assert stage(3) == 3
+        metrics.count('calls')
+        metrics.observe('latency', 1.0)
+        with pytest.raises(RuntimeError):
+            metrics.report()
+
+    def test_nested_spans_and_counters(self, recorded):
+        stage(1)
+        with metrics.span('outer'):
+            stage(2)
+        assert list(recorded.spans) == ['stage', 'stage/inner', 'outer', 'outer/stage',
+                                        'outer/stage/inner']
+        assert recorded.spans['stage'].calls == 1
+        assert recorded.counters['calls'] == 2
+        assert metrics.disable() is recorded
+        assert metrics.current() is None
+
+    def test_span_closed_on_exception(self, recorded):
+        with pytest.raises(KeyError):
+            with metrics.span('failing'):
+                raise KeyError()
+        with metrics.span('next'):
+            pass
+        assert list(recorded.spans) == ['failing', 'next']
+
+    def test_histogram_summary(self, recorded):
+        for value in range(1, 101):
+            metrics.observe('latency', value)
+        summary = recorded.report()['histograms']['latency']
+        assert summary['count'] == 100
+        assert summary['mean'] == 50.5
+        assert summary['p50'] == 50.5 and summary['max'] == 100
+
+    def test_report_formats(self, recorded):
+        stage(1)
+        metrics.observe('latency', 0.5)
+        report = json.loads(metrics.report('json'))
+        assert set(report['spans']) == {'stage', 'stage/inner'}
+        assert report['counters'] == {'calls': 1}
+        assert report['profile'] is None
+        text = metrics.report()
+        assert 'stage' in text and 'latency' in text
+        with pytest.raises(ValueError):
+            metrics.report('xml')
+
+    def test_profile(self, recorded, tmp_path):
+        registry = metrics.enable(profile='stage')
+        with metrics.span('stage'):
+            stage(1)
+        assert registry.spans['stage'].calls == 1
+        assert registry.spans['stage/stage'].calls == 1
+        functions = [row['function'] for row in registry.report()['profile']]
+        assert any('stage' in function for function in functions)
+        registry.dump_profile(str(tmp_path / 'stage.pstats'))
+        assert (tmp_path / 'stage.pstats').exists()
+
+    def test_simulation_is_instrumented(self, recorded):
+        devices = [PatientDevice((i, 0), i + 1, patient=Patient(i)) for i in range(6)]
+        socket_graph, nan_graph = build_topology(devices, 1, 5)
+        SimulationEngine(devices, step=1, params=('spo2', 'hr')).run(ticks=4)
+        report = recorded.report()
+        assert {'build_topology/scan_in_range_batch', 'build_topology/create_socket_edges',
+                'build_topology/create_nan_edges', 'tick'} <= set(report['spans'])
+        assert report['counters']['measurements'] == 6 * 4 * 2
+        assert report['counters']['socket_edges'] == socket_graph.number_of_edges()
+        assert report['counters']['nan_edges'] == report['counters']['neighbour_pairs'] == 5 * 2
+        assert report['histograms']['tick']['count'] == 4
@@ -0,0 +1,74 @@
+from device import PatientDevice
+from engine import Mutator
+from measurements import MeasurementStore
+from patient import CRITICAL, RESTING, UNWELL, PatientPopulation
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def population():
+    return PatientPopulation(1000, seed=3)
+
+
+class TestPatientPopulation:
+
+    def test_initial_state_within_bounds(self, population):
+        hr, spo2 = population.measure('hr'), population.measure('spo2')
+        assert ((RESTING['hr'][0] <= hr) & (hr <= RESTING['hr'][1])).all()
+        assert ((RESTING['spo2'][0] <= spo2) & (spo2 <= RESTING['spo2'][1])).all()
+
+    def test_tick_is_bounded_random_walk(self, population):
+        population.set_condition(slice(0, 500), CRITICAL)
+        before = population.state.copy()
+        population.tick()
+        moved = population.state.astype(int) - before
+        assert (np.abs(moved[500:]) <= 1).all()
+        for _ in range(20):
+            population.tick()
+        assert (population.measure('spo2')[:500] <= CRITICAL['spo2'][1]).all()
+        assert (population.measure('spo2')[500:] >= RESTING['spo2'][0]).all()
+
+    def test_view(self, population):
+        view = population[7]
+        assert view.id == 7
+        assert view.condition is RESTING
+        view.condition = UNWELL
+        assert population[7].condition is UNWELL
+        assert population[8].condition is RESTING
+        assert view.measure('hr') == view.state['hr'] == population.measure('hr')[7]
+        assert list(view.params) == ['hr', 'spo2']
+
+    def test_equal_conditions_share_code(self, population):
+        for index in range(300):
+            population[index].condition = dict(UNWELL)
+        assert len(population.conditions) == 2
+        assert population[299].condition == UNWELL
+        assert population.low[299, 0] == UNWELL['hr'][0]
+
+    def test_mutator_ticks_population_once(self, population):
+        devices = [PatientDevice((i, 0), i, patient=population[i]) for i in range(10)]
+        ticks = []
+        population.tick = lambda: ticks.append(1)
+        Mutator(devices).tick()
+        assert ticks == [1]
+
+    def test_mutator_faulty_sensors(self, population):
+        store = MeasurementStore(10)
+        devices = [PatientDevice((i, 0), i, patient=population[i], store=store, slot=i)
+                   for i in range(10)]
+        mutator = Mutator(devices)
+        healthy = population.measure('spo2')[:10].tolist()
+        mutator.measure('spo2')
+        assert store.last('spo2')[1].tolist() == healthy
+        devices[3].set_faulty('spo2')
+        mutator.tick()
+        mutator.measure('spo2')
+        values = store.last('spo2')[1]
+        assert 0 <= values[3] <= 5
+        assert values[4] == population.measure('spo2')[4]
+        devices[3].set_faulty('spo2', False)
+        mutator.tick()
+        mutator.measure('spo2')
+        assert store.last('spo2')[1].tolist() == population.measure('spo2')[:10].tolist()
@@ -0,0 +1,89 @@
+import random
+
+from device import Device
+from graph import build_topology
+from meshgraph import MeshGraph
+from propagation import Propagation, format_table
+
+import networkx as nx
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def ward():
+    devices = [Device((x, y), x * 10 + y + 1) for x in range(6) for y in range(6)]
+    socket_graph, nan_graph = build_topology(devices, 1, 3)
+    return devices, socket_graph, nan_graph, Propagation(socket_graph, nan_graph)
+
+
+def random_mesh(seed):
+    rng = random.Random(seed)
+    count = rng.randint(3, 40)
+    devices = [Device((i, 0), i) for i in range(count)]
+    mesh = MeshGraph(devices)
+    pairs = [rng.sample(range(count), 2) for _ in range(rng.randint(1, 3 * count))]
+    mesh.add_edges(*zip(*pairs))
+    return devices, mesh
+
+
+class TestPropagation:
+
+    def test_flood_matches_bfs(self):
+        for seed in range(50):
+            devices, mesh = random_mesh(seed)
+            report = Propagation(MeshGraph(devices), mesh).flood(devices[0])
+            distances = nx.single_source_shortest_path_length(mesh.to_networkx(), devices[0])
+            expected = np.array([distances.get(dev, -1) for dev in devices])
+            np.testing.assert_array_equal(report.hops, expected)
+            # every reached device sends to all its neighbours but its parent
+            degree = mesh.degree()[report.hops >= 0]
+            assert report.transmissions == degree.sum() - (report.reached - 1)
+            assert report.duplicates == report.transmissions - (report.reached - 1)
+
+    def test_flood(self, ward):
+        devices, _, _, propagation = ward
+        report = propagation.run(devices[0], 'flood')
+        # 6x6 grid, distance from a corner
+        np.testing.assert_array_equal(report.hops, [x + y for x in range(6) for y in range(6)])
+        np.testing.assert_allclose(report.times, report.hops * propagation.nan_latency)
+        assert report.coverage == 1 and report.max_hops == 10
+        assert report.transmissions == 2 * 60 - 35
+        assert report.duplicates == 2 * 60 - 70
+
+    def test_tree(self, ward):
+        devices, socket_graph, _, propagation = ward
+        flood = propagation.flood(devices[0])
+        report = propagation.run(devices[0], 'tree')
+        assert report.reached == len(devices)
+        assert report.transmissions == len(devices) - 1 and report.duplicates == 0
+        assert (report.hops >= flood.hops).all()
+        # masters and their slaves pass the message over sockets
+        for u, v in socket_graph.edges.tolist():
+            first, second = sorted((u, v), key=lambda i: report.hops[i])
+            if report.hops[second] == report.hops[first] + 1:
+                assert report.times[second] == pytest.approx(
+                    report.times[first] + propagation.socket_latency)
+        assert report.max_time < flood.max_time
+
+    def test_unicast(self, ward):
+        devices, _, _, propagation = ward
+        flood = propagation.flood(devices[0])
+        report = propagation.run(devices[0], 'unicast')
+        np.testing.assert_array_equal(report.hops, flood.hops)
+        assert report.transmissions == flood.hops.sum() and report.duplicates == 0
+        some = propagation.unicast(devices[0], destinations=[devices[7], devices[35]])
+        assert some.reached == 3 and some.transmissions == 2 + 10
+        assert np.isnan(some.times[1])
+
+    def test_unreachable_and_table(self):
+        devices = [Device((x, 0), x + 1) for x in (0, 1, 5)]
+        socket_graph, nan_graph = build_topology(devices, 1, 3)
+        propagation = Propagation(socket_graph, nan_graph)
+        reports = [propagation.run(devices[0], protocol) for protocol in ('flood', 'tree', 'unicast')]
+        for report in reports:
+            np.testing.assert_array_equal(report.hops, [0, 1, -1])
+            assert report.transmissions == 1
+        assert len(format_table(reports).splitlines()) == 4
+        with pytest.raises(ValueError):
+            propagation.run(devices[0], 'gossip')
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from device import MAX_CLIENT_COUNT, MAX_MASTER_COUNT
+from protocol import DECIDED, ClusterSimulation, VirtualClockLoop, format_table
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def ward():
+    return [(x, y) for x in range(0, 20, 2) for y in range(0, 20, 2)]
+
+
+def check_roles(simulation):
+    agents = [agent for agent in simulation.agents if agent.alive]
+    for agent in agents:
+        assert agent.device.status in DECIDED
+        master = simulation.agents[agent.master_id]
+        assert master.alive and master.device.is_master
+        if not agent.device.is_master:
+            assert agent.index in master.clients
+        assert len(agent.masters) <= MAX_MASTER_COUNT
+    for agent in agents:
+        if agent.device.is_master:
+            clients = [other.index for other in agents
+                       if other.master_id == agent.index and other is not agent]
+            assert sorted(agent.clients) == sorted(clients)
+            assert agent.device.socket_client_count == len(clients) <= MAX_CLIENT_COUNT
+
+
+class TestClusterProtocol:
+
+    def test_virtual_clock(self):
+        loop = VirtualClockLoop()
+        start = time.perf_counter()
+        try:
+            loop.run_until_complete(asyncio.sleep(3600))
+            assert loop.time() == pytest.approx(3600)
+        finally:
+            loop.close()
+        assert time.perf_counter() - start < 1
+
+    def test_formation(self, ward):
+        simulation = ClusterSimulation(ward, 3, seed=1)
+        report, = simulation.run()
+        check_roles(simulation)
+        assert report.converged and report.undecided == 0
+        assert report.masters + report.clients + report.client_servers == len(ward)
+        # a gateway links one foreign master, so a lone master surrounded
+        # by busy gateways can stay apart, most clusters are joined
+        assert report.client_servers > 0 and report.backbone_components < report.masters / 4
+        assert report.messages == sum(report.by_type.values())
+        assert report.dropped == 0
+        again, = ClusterSimulation(ward, 3, seed=1).run()
+        assert again._replace(wall_seconds=0) == report._replace(wall_seconds=0)
+
+    def test_reconnect_after_masters_fail(self, ward):
+        simulation = ClusterSimulation(ward, 3, seed=2)
+        formation, reconnect = simulation.run(fail_masters=1.0)
+        assert reconnect.devices == len(ward) - formation.masters
+        assert reconnect.converged and reconnect.undecided == 0
+        check_roles(simulation)
+
+    def test_lossy_channels(self, ward):
+        simulation = ClusterSimulation(ward, 3, loss=0.2, seed=3)
+        report, = simulation.run(fail_masters=0.0)
+        assert report.converged and report.dropped > 0
+        check_roles(simulation)
+        with pytest.raises(ValueError):
+            ClusterSimulation(ward, 3, loss=1.0).run()
+
+    def test_isolated_devices(self):
+        coordinates = np.arange(10).repeat(2).reshape(-1, 2) * 10
+        report, = ClusterSimulation(coordinates, 3, seed=0).run()
+        assert report.converged and report.masters == 10
+        assert report.messages == 0 and report.backbone_components == 10
+        assert len(format_table([report]).splitlines()) == 2
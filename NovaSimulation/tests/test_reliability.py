@@ -0,0 +1,102 @@
+import random
+
+from device import Device, PatientDevice
+from graph import build_topology
+from meshgraph import MeshGraph
+from patient import Patient
+from reliability import FailureInjection, backup_paths, contracted_neighbours, estimate
+from routing import RouteCache
+
+import networkx as nx
+import numpy as np
+import pytest
+
+
+def random_mesh(seed):
+    rng = random.Random(seed)
+    count = rng.randint(3, 20)
+    devices = [Device((i, 0), i) for i in range(count)]
+    mesh = MeshGraph(devices)
+    pairs = [rng.sample(range(count), 2) for _ in range(rng.randint(1, 3 * count))]
+    mesh.add_edges(*zip(*pairs))
+    alive = [i == 0 or rng.random() > 0.2 for i in range(count)]
+    return mesh, alive
+
+
+@pytest.fixture
+def ward():
+    devices = [PatientDevice((x, y), x * 10 + y, patient=Patient(x * 10 + y))
+               for x in range(8) for y in range(8)]
+    socket_graph, nan_graph = build_topology(devices, 1, 3)
+    return FailureInjection(socket_graph, nan_graph, [devices[0]])
+
+
+class TestFailureInjection:
+
+    @pytest.mark.parametrize('seed', range(30))
+    def test_backup_same_as_route_cache(self, seed):
+        mesh, alive = random_mesh(seed)
+        found = backup_paths(contracted_neighbours(mesh.adjacency(), [0]), alive)
+        routes = RouteCache(mesh)
+        for dev, is_alive in zip(mesh.devices, alive):
+            if not is_alive:
+                routes.remove_node(dev)
+        for i in range(1, len(mesh)):
+            paths = routes.paths(mesh.devices[i], mesh.devices[0]) if alive[i] else (None, None)
+            assert found[i] == (paths[1] is not None)
+
+    def test_backup_through_two_stations(self):
+        devices = [Device((i, 0), i) for i in range(4)]
+        mesh = MeshGraph(devices)
+        # 0 - 1 - 2 - 3, both 1 and 2 are next to two stations when 0 and 3 are stations
+        mesh.add_edges([0, 1, 2], [1, 2, 3])
+        neighbours = contracted_neighbours(mesh.adjacency(), [0, 3])
+        assert backup_paths(neighbours, [True] * 4) == [False, True, True, False]
+        neighbours = contracted_neighbours(mesh.adjacency(), [0])
+        assert backup_paths(neighbours, [True] * 4) == [False, False, False, False]
+
+    def test_reachable_same_as_networkx(self, ward):
+        alive, _ = ward.sample(20, rng=np.random.default_rng(3), device_failure=0.3)
+        reached = ward.reachable(alive)
+        graph = ward.graph.to_networkx()
+        for trial in range(len(alive)):
+            survivors = graph.subgraph(dev for dev, is_alive in zip(ward.devices, alive[trial])
+                                       if is_alive)
+            component = nx.node_connected_component(survivors, ward.devices[0])
+            assert reached[trial].tolist() == [dev in component for dev in ward.devices]
+
+    def test_no_failures(self, ward):
+        report = ward.run(10, seed=0, master_failure=0, device_failure=0, sensor_failure=0)
+        assert report.trials == 10
+        assert report.nan_delivery == report.socket_delivery == (1, 1, 1)
+        assert report.nan_backup.mean == 1
+
+    def test_faulty_sensors(self, ward):
+        report = ward.run(200, seed=0, master_failure=0, device_failure=0, sensor_failure=0.5)
+        assert report.nan_delivery.low < 0.5 < report.nan_delivery.high
+
+    def test_dead_masters(self, ward):
+        report = ward.run(20, seed=0, master_failure=1, device_failure=0, sensor_failure=0)
+        # station is a master, only its slaves are left
+        assert ward.is_master[0]
+        station_slaves = (ward.master_of[ward.senders] == 0).mean()
+        assert report.socket_delivery.mean == pytest.approx(station_slaves)
+        assert report.nan_delivery.mean < 1
+
+    def test_broken_sensors(self, ward):
+        ward.devices[5].set_faulty('spo2')
+        ward = FailureInjection(*build_topology(ward.devices, 1, 3), [ward.devices[0]])
+        _, sensors = ward.sample(5, sensor_failure=0)
+        assert sensors.sum(axis=1).tolist() == [len(ward.devices) - 1] * 5
+
+    def test_workers_give_same_backups(self, ward):
+        alive, _ = ward.sample(8, rng=np.random.default_rng(1), device_failure=0.3)
+        assert np.array_equal(ward.backup(alive, workers=2), ward.backup(alive))
+
+
+def test_estimate():
+    mean, low, high = estimate([0.5, 0.7, 0.6, 0.6])
+    assert mean == pytest.approx(0.6)
+    assert low < mean < high
+    assert estimate([1, 1, 1]) == (1, 1, 1)
+    assert np.isnan(estimate([]).mean)
@@ -0,0 +1,217 @@
+import random
+
+from device import Device
+from meshgraph import MeshGraph
+from routing import RouteCache, StationTree, suurballe
+
+import networkx as nx
+import numpy as np
+import pytest
+
+grid_devices = [Device((x, y), x * 10 + y) for x in range(6) for y in range(6)]
+
+# the only shortest path 0-1-2-3 uses a device of each of the disjoint
+# paths 0-1-6-7-3 and 0-4-5-2-3, removing its devices leaves no backup
+trap_edges = [(0, 1), (1, 2), (2, 3), (0, 4), (4, 5), (5, 2), (1, 6), (6, 7), (7, 3)]
+
+
+@pytest.fixture
+def mesh():
+    mesh = MeshGraph(grid_devices)
+    neighbours = mesh.scan_in_range(1)
+    src = [i for i in range(len(mesh)) for _ in neighbours.neighbours(i)[0]]
+    mesh.add_edges(src, neighbours.indices)
+    return mesh
+
+
+def adjacency(edges):
+    graph = nx.Graph(edges)
+    return lambda index: list(graph[index])
+
+
+def assert_disjoint(graph, main, backup):
+    assert main[0] == backup[0] and main[-1] == backup[-1]
+    assert not set(main[1:-1]) & set(backup[1:-1])
+    for path in (main, backup):
+        assert all(graph.has_edge(u, v) for u, v in zip(path, path[1:]))
+
+
+class TestSuurballe:
+
+    def test_trap(self):
+        main, backup = suurballe(adjacency(trap_edges), 0, 3)
+        assert sorted([main, backup]) == [[0, 1, 6, 7, 3], [0, 4, 5, 2, 3]]
+
+    def test_no_backup(self):
+        main, backup = suurballe(adjacency([(0, 1), (1, 2)]), 0, 2)
+        assert main == [0, 1, 2]
+        assert backup is None
+
+    def test_no_path(self):
+        assert suurballe(adjacency([(0, 1), (2, 3)]), 0, 3) == (None, None)
+
+    @pytest.mark.parametrize('seed', range(20))
+    def test_random_graphs(self, seed):
+        rng = random.Random(seed)
+        graph = nx.gnp_random_graph(20, 0.2, seed=seed)
+        start, goal = rng.sample(range(20), 2)
+        main, backup = suurballe(lambda index: list(graph[index]), start, goal)
+        if nx.node_connectivity(graph, start, goal) < 2:
+            assert backup is None
+            return
+        assert_disjoint(graph, main, backup)
+        assert len(main) <= len(backup)
+        assert len(main) - 1 >= nx.shortest_path_length(graph, start, goal)
+
+
+class TestRouteCache:
+
+    def test_paths_do_not_modify_graph(self, mesh):
+        routes = RouteCache(mesh)
+        main, backup = routes.paths(grid_devices[0], grid_devices[35])
+        assert_disjoint(mesh.to_networkx(), main, backup)
+        assert len(main) == 11
+        assert mesh.number_of_edges() == 60
+
+    def test_remove_method(self, mesh):
+        routes = RouteCache(mesh, method='remove')
+        main, backup = routes.paths(grid_devices[7], grid_devices[22])
+        assert main == mesh.shortest_path(grid_devices[7], grid_devices[22])
+        assert backup == mesh.shortest_path(grid_devices[7], grid_devices[22], blocked=main[1:-1])
+
+    def test_trap_backup_found_only_by_suurballe(self):
+        devices = [Device((i, 0), i) for i in range(8)]
+        mesh = MeshGraph(devices)
+        mesh.add_edges(*zip(*trap_edges))
+        assert RouteCache(mesh, method='remove').paths(devices[0], devices[3])[1] is None
+        assert RouteCache(mesh).paths(devices[0], devices[3])[1] is not None
+
+    @pytest.mark.parametrize('seed', range(10))
+    def test_main_is_shortest(self, seed):
+        rng = random.Random(seed)
+        devices = [Device((i, 0), i) for i in range(60)]
+        mesh = MeshGraph(devices)
+        mesh.add_edges(*zip(*[rng.sample(range(60), 2) for _ in range(120)]))
+        routes, removing = RouteCache(mesh), RouteCache(mesh, method='remove')
+        for _ in range(20):
+            source, destination = rng.sample(devices, 2)
+            main, backup = removing.paths(source, destination)
+            shortest = mesh.shortest_path(source, destination)
+            assert main == shortest
+            if backup is not None:
+                assert_disjoint(mesh.to_networkx(), main, backup)
+                # suurballe only changes routes which have no backup otherwise
+                assert routes.paths(source, destination) == (main, backup)
+
+    def test_backup_of_direct_link(self, mesh):
+        routes = RouteCache(mesh)
+        main, backup = routes.paths(grid_devices[7], grid_devices[8])
+        assert main == [grid_devices[7], grid_devices[8]]
+        assert len(backup) == 4
+        # the same with failures applied, over the live graph
+        routes.remove_edge(grid_devices[0], grid_devices[1])
+        assert routes.paths(grid_devices[7], grid_devices[8]) == (main, backup)
+
+    def test_memoized_both_directions(self, mesh):
+        routes = RouteCache(mesh)
+        main, backup = routes.paths(grid_devices[0], grid_devices[35])
+        assert routes.paths(grid_devices[0], grid_devices[35]) == (main, backup)
+        assert routes.paths(grid_devices[35], grid_devices[0]) == (main[::-1], backup[::-1])
+        assert (routes.hits, routes.misses) == (2, 1)
+
+    def test_remove_node_invalidates_affected_routes(self, mesh):
+        routes = RouteCache(mesh)
+        main, _ = routes.paths(grid_devices[0], grid_devices[35])
+        other = routes.paths(grid_devices[30], grid_devices[31])
+        dead = next(dev for dev in main[2:-2] if dev not in other[0] + other[1])
+        routes.remove_node(dead)
+        assert len(routes) == 1
+        assert routes.paths(grid_devices[30], grid_devices[31]) == other
+
+        # neighbours of the corner devices are alive, so there is still a backup
+        main, backup = routes.paths(grid_devices[0], grid_devices[35])
+        assert dead not in main + backup
+        assert mesh.number_of_edges() == 60
+
+    def test_remove_and_add_edge(self, mesh):
+        routes = RouteCache(mesh)
+        # corner device has two edges, without one of them there is no backup
+        assert routes.paths(grid_devices[0], grid_devices[35])[1] is not None
+        routes.remove_edge(grid_devices[0], grid_devices[1])
+        main, backup = routes.paths(grid_devices[0], grid_devices[35])
+        assert main[1] == grid_devices[6]
+        assert backup is None
+        routes.add_edge(grid_devices[0], grid_devices[1])
+        assert routes.paths(grid_devices[0], grid_devices[35])[1] is not None
+
+    def test_dead_device_has_no_route(self, mesh):
+        routes = RouteCache(mesh)
+        routes.remove_node(grid_devices[35])
+        assert routes.paths(grid_devices[0], grid_devices[35]) == (None, None)
+        routes.restore_node(grid_devices[35])
+        assert routes.paths(grid_devices[0], grid_devices[35])[0] is not None
+
+
+
+def assert_nearest_station(tree):
+    alive = [i for i in range(len(tree.graph)) if tree.alive[i]]
+    live = nx.Graph([(i, j) for i in alive for j in tree.neighbours(i)])
+    live.add_nodes_from(alive)
+    stations = [i for i in tree.stations if tree.alive[i]]
+    expected = nx.multi_source_dijkstra_path_length(live, stations) if stations else {}
+    assert tree.hops.tolist() == [expected.get(i, -1) for i in range(len(tree.graph))]
+    for i in np.nonzero(tree.hops > 0)[0]:
+        assert live.has_edge(i, tree.parent[i])
+        assert tree.station[i] == tree.station[tree.parent[i]]
+
+
+class TestStationTree:
+
+    def test_nearest_station(self, mesh):
+        tree = StationTree(mesh, [grid_devices[0], grid_devices[35]])
+        assert_nearest_station(tree)
+        assert tree.station_of(grid_devices[6]) == grid_devices[0]
+        assert tree.station_of(grid_devices[29]) == grid_devices[35]
+        route = tree.route(grid_devices[14])
+        assert route[0] == grid_devices[14] and route[-1] == grid_devices[0]
+        assert len(route) == 5
+
+    def test_remove_node(self, mesh):
+        tree = StationTree(mesh, [grid_devices[0]])
+        tree.remove_node(grid_devices[1])
+        tree.remove_node(grid_devices[7])
+        assert_nearest_station(tree)
+        assert tree.route(grid_devices[1]) is None
+        assert grid_devices[7] not in tree.route(grid_devices[35])
+        assert mesh.number_of_edges() == 60
+
+    def test_remove_station(self, mesh):
+        tree = StationTree(mesh, [grid_devices[0], grid_devices[35]])
+        tree.remove_node(grid_devices[0])
+        assert_nearest_station(tree)
+        assert tree.station_of(grid_devices[1]) == grid_devices[35]
+        tree.restore_node(grid_devices[0])
+        assert_nearest_station(tree)
+        assert tree.station_of(grid_devices[1]) == grid_devices[0]
+
+    def test_edges(self, mesh):
+        tree = StationTree(mesh, [grid_devices[0]])
+        tree.remove_edge(grid_devices[0], grid_devices[1])
+        tree.remove_edge(grid_devices[0], grid_devices[6])
+        assert tree.route(grid_devices[35]) is None
+        tree.add_edge(grid_devices[0], grid_devices[35])
+        assert tree.route(grid_devices[35]) == [grid_devices[35], grid_devices[0]]
+        assert_nearest_station(tree)
+
+    @pytest.mark.parametrize('seed', range(5))
+    def test_random_failures(self, mesh, seed):
+        rng = random.Random(seed)
+        tree = StationTree(mesh, rng.sample(grid_devices, 2))
+        for _ in range(30):
+            u, v = rng.sample(grid_devices, 2)
+            rng.choice([tree.remove_node, tree.restore_node])(u)
+            if rng.random() < 0.5:
+                tree.remove_edge(u, v)
+            else:
+                tree.add_edge(u, v)
+            assert_nearest_station(tree)
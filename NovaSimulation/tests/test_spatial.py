@@ -0,0 +1,61 @@
+import math
+import random
+
+from spatial import GridIndex, range_csr
+
+import pytest
+
+random.seed(7)
+scattered_points = [(random.randint(0, 40), random.randint(0, 40)) for _ in range(300)]
+
+query_data = [
+    ([(0, 0), (3, 4), (6, 8), (0, 5)], (0, 0), 5, [(0, 0.0), (1, 5.0), (3, 5.0)]),
+    ([(0, 0), (3, 4), (6, 8), (0, 5)], (6, 8), 4.9, [(2, 0.0)]),
+    ([(-3, -3), (-1, -1), (2, 2)], (0, 0), 2, [(1, math.sqrt(2))]),
+]
+
+
+def brute_force_neighbours(points, index, radius):
+    return [(other, math.dist(points[index], coords))
+            for other, coords in enumerate(points)
+            if coords != points[index] and math.dist(points[index], coords) <= radius]
+
+
+class TestGridIndex:
+
+    @pytest.mark.parametrize('points, coords, radius, expected', query_data)
+    def test_query(self, points, coords, radius, expected):
+        assert GridIndex(points, radius).query(coords, radius) == expected
+
+    @pytest.mark.parametrize('radius', [1, 2.5, 5, 12])
+    def test_neighbours_match_brute_force(self, radius):
+        grid = GridIndex(scattered_points, radius)
+        for index in range(len(scattered_points)):
+            assert grid.neighbours(index, radius) == \
+                brute_force_neighbours(scattered_points, index, radius)
+
+    def test_radius_larger_than_cell(self):
+        grid = GridIndex(scattered_points, 2)
+        assert grid.neighbours(0, 9) == brute_force_neighbours(scattered_points, 0, 9)
+
+    def test_invalid_cell_size(self):
+        with pytest.raises(ValueError):
+            GridIndex([(0, 0)], 0)
+
+
+class TestRangeCSR:
+
+    @pytest.mark.parametrize('radius, tile_size', [(1, 16), (5, 7), (5, 1024), (12, 50)])
+    def test_matches_grid_index(self, radius, tile_size):
+        csr = range_csr(scattered_points, radius, tile_size)
+        grid = GridIndex(scattered_points, radius)
+        assert csr.node_count == len(scattered_points)
+        for index in range(len(scattered_points)):
+            expected = sorted(grid.neighbours(index, radius), key=lambda pair: pair[1])
+            indices, distances = csr.neighbours(index)
+            assert list(zip(indices.tolist(), distances.tolist())) == expected
+
+    def test_no_points(self):
+        csr = range_csr([], 5)
+        assert csr.node_count == 0
+        assert len(csr.indices) == 0
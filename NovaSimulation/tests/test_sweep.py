@@ -0,0 +1,32 @@
+import os
+
+from sweep import SweepResult, format_table, sweep
+
+INPUT_FILE = os.path.join(os.path.dirname(__file__), os.pardir, 'simulation', 'input', 'input.txt')
+
+
+def without_time(results):
+    return [result._replace(seconds=None) for result in results]
+
+
+class TestSweep:
+
+    def test_workers_give_same_results(self):
+        options = dict(duration=14, step=0.5, pairs=5)
+        in_process = sweep(INPUT_FILE, [3, 5], [5], [3], [0, 1], workers=1, **options)
+        pooled = sweep(INPUT_FILE, [3, 5], [5], [3], [0, 1], workers=2, **options)
+        assert [result[:4] for result in in_process] == [(3, 5, 3, 0), (3, 5, 3, 1),
+                                                         (5, 5, 3, 0), (5, 5, 3, 1)]
+        assert without_time(pooled) == without_time(in_process)
+
+    def test_metrics(self):
+        wide, narrow = sweep(INPUT_FILE, [5], [5, 2], [3], [0], workers=1, duration=14, pairs=5)
+        # fewer slaves per master need more masters
+        assert narrow.masters > wide.masters
+        assert narrow.over_limit == 0 < wide.over_limit
+        assert wide.components == 1 and wide.unreachable == 0
+        assert wide.alerts == narrow.alerts == 1
+        assert 0 < wide.mean_hops <= wide.max_hops
+        table = format_table([wide, narrow]).splitlines()
+        assert len(table) == 3
+        assert table[0].split() == list(SweepResult._fields)
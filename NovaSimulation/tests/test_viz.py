@@ -0,0 +1,123 @@
+import matplotlib
+matplotlib.use('Agg')
+
+from device import PatientDevice
+from engine import DEMO_PATIENT_VALUE, DEMO_STATION_VALUE, SimulationEngine
+from graph import build_topology
+from measurements import MeasurementStore
+from patient import Patient
+from viz import EdgeLayer, MeasurementsViz
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def health_viz():
+    store = MeasurementStore(36)
+    values = [DEMO_PATIENT_VALUE, DEMO_STATION_VALUE] + list(range(1, 35))
+    devices = [PatientDevice((i % 6, i // 6), value, patient=Patient(i), store=store, slot=i)
+               for i, value in enumerate(values)]
+    socket_graph, nan_graph = build_topology(devices, 1, 5)
+    engine = SimulationEngine(devices)
+    engine.run(ticks=1)
+    viz = MeasurementsViz(socket_graph, grid_size=6, nan_graph=nan_graph, engine=engine)
+    yield viz, engine
+    plt.close('all')
+
+
+class TestMeasurementsViz:
+
+    def test_lookup_table(self, health_viz):
+        viz, _ = health_viz
+        values = np.array([-3, 0, 85, 89, 92, 94, 95, 97, 100, 120])
+        expected = [viz.spo2_to_color(value) for value in np.clip(values, 0, 100)]
+        np.testing.assert_allclose(viz.colors_of(values), expected)
+
+    def test_frames_reuse_artists(self, health_viz):
+        viz, engine = health_viz
+        viz.observe(engine)
+        viz.fig.canvas.draw()
+        artists = len(viz.ax.collections)
+        for _ in range(5):
+            engine.tick()
+            viz.observe(engine)
+        viz.show_paths(viz._colored[:3], None)
+        viz.observe(engine)
+        assert len(viz.ax.collections) == artists
+        legend = viz.ax.get_legend()
+        assert [text.get_text() for text in legend.get_texts()] == ['Main path', 'Backup path']
+
+        others, patient_node = viz._node_artists
+        last = [dev.get_last_measurement('spo2').value for dev in viz._colored]
+        np.testing.assert_allclose(others.get_facecolor()[:, :3], viz.colors_of(last[:-1]))
+        np.testing.assert_allclose(patient_node.get_facecolor()[:, :3], viz.colors_of(last[-1:]))
+        assert len(viz._path_artists[1].get_segments()) == 2
+        assert len(viz._path_artists[0].get_segments()) == 0
+
+    def test_cleared_devices_not_coloured(self, health_viz):
+        viz, engine = health_viz
+        viz.observe(engine)
+        viz._colored[0].pop_measurements('spo2')
+        viz.observe(engine)
+        others, _ = viz._node_artists
+        np.testing.assert_allclose(others.get_facecolor()[0, :3], viz.NO_DATA_COLOR)
+        assert not np.allclose(others.get_facecolor()[1, :3], viz.NO_DATA_COLOR)
+
+
+class TestEdgeLayer:
+
+    @pytest.fixture
+    def grid(self):
+        xs, ys = np.meshgrid(np.arange(30), np.arange(30))
+        coordinates = np.column_stack((xs.ravel(), ys.ravel()))
+        index = np.arange(900).reshape(30, 30)
+        edges = np.concatenate((
+            np.column_stack((index[:, :-1].ravel(), index[:, 1:].ravel())),
+            np.column_stack((index[:-1].ravel(), index[1:].ravel())),
+        ))
+        fig, ax = plt.subplots()
+        yield ax, coordinates, edges
+        plt.close(fig)
+
+    def test_decimated_until_zoomed_in(self, grid):
+        ax, coordinates, edges = grid
+        layer = EdgeLayer(ax, coordinates, edges, max_edges=100)
+        ax.figure.canvas.draw()
+        drawn = layer.collection.get_segments()
+        assert len(drawn) == 100
+        ax.set_xlim(0, 5)
+        ax.set_ylim(0, 5)
+        ax.figure.canvas.draw()
+        drawn = np.array(layer.collection.get_segments())
+        assert 0 < len(drawn) < 100
+        # every edge in view is drawn
+        assert len(drawn) == len(layer.in_view())
+
+    def test_density(self, grid):
+        ax, coordinates, edges = grid
+        layer = EdgeLayer(ax, coordinates, edges, max_edges=100, lod='density', colors='b')
+        ax.figure.canvas.draw()
+        assert not layer.collection.get_segments()
+        assert layer.density.get_visible()
+        assert layer.density.get_array()[..., 3].max() == 1
+
+    def test_hidden_layer(self, grid):
+        ax, coordinates, edges = grid
+        layer = EdgeLayer(ax, coordinates, edges, visible=False)
+        ax.figure.canvas.draw()
+        assert layer.collection is None and not ax.collections
+        layer.toggle()
+        ax.figure.canvas.draw()
+        assert len(layer.collection.get_segments()) == len(edges)
+        layer.toggle()
+        assert not layer.collection.get_visible()
+
+    def test_draw_edges_mask(self, health_viz):
+        viz, engine = health_viz
+        viz.observe(engine)
+        everything = viz.layers['socket']
+        layer = viz.draw_edges(lambda edges: edges[:, 0] == 0, layer='first')
+        assert len(layer.edges) == (everything.edges[:, 0] == 0).sum() > 0
+        assert viz.layers['first'] is layer